@@ -0,0 +1,113 @@
+import re  # For splitting text into words.
+import string  # For removing punctuation from words.
+import time  # For per-call timing.
+from collections import Counter  # For field term frequencies.
+from functools import lru_cache  # For memoizing stems.
+from nltk.corpus import stopwords  # For filtering out common stop words.
+from nltk.stem import PorterStemmer  # For stemming words to their root forms.
+
+# Words are runs of word characters, in documents and in queries (see query_parser.WORD_PATTERN)
+WORD_PATTERN = re.compile(r'\b\w+\b')
+
+# Fields with posting lists of their own. Their index terms are "<field>:<term>", which never
+# collide with full-text terms (those are \w only). Name and description terms are analyzed
+# words; every tag is one term, e.g. "Action RPG" -> "tag:action-rpg".
+FIELDS = ('name', 'tag', 'description')
+
+
+# Tag -> the key of its field term
+def tag_key(tag):
+    return re.sub(r'\W+', '-', tag.strip().lower()).strip('-')
+
+
+def is_field_term(term):
+    return ':' in term
+
+
+class Analyzer:
+    """Text processing shared by the indexer and the query path.
+
+    The stop word set and punctuation table are built once, and stems are memoized in a
+    bounded LRU cache (game descriptions and queries repeat the same words a lot).
+    `analyze` turns a document into index terms; `normalize` turns one query word into
+    the index term it should match, or None for stop words.
+    """
+
+    def __init__(self, language='english', stem_cache_size=1 << 18):
+        self.stop_words = frozenset(stopwords.words(language))
+        self.translator = str.maketrans('', '', string.punctuation)
+        self.stemmer = PorterStemmer()
+        self.stem = lru_cache(maxsize=stem_cache_size)(self.stemmer.stem)
+
+        # Timing of analyze_many calls
+        self.calls = 0
+        self.texts = 0
+        self.terms = 0
+        self.seconds = 0.0
+        self.last_call_seconds = 0.0
+
+    def tokenize(self, text):
+        return WORD_PATTERN.findall(text.lower())
+
+    # Tokenize, remove punctuation and stop words, and stem
+    def analyze(self, text):
+        stop_words, stem = self.stop_words, self.stem
+        words = (word.translate(self.translator) for word in self.tokenize(text))
+        return [stem(word) for word in words if word not in stop_words]
+
+    # (term, word offset) of every index term; offsets count stop words too, so phrases with
+    # stop words ("call of duty") keep their gaps
+    def analyze_positions(self, text):
+        stop_words, stem = self.stop_words, self.stem
+        words = (word.translate(self.translator) for word in self.tokenize(text))
+        return [(stem(word), position) for position, word in enumerate(words) if word not in stop_words]
+
+    # Index term for one query word, None when it is a stop word or only punctuation
+    def normalize(self, word):
+        word = word.lower().translate(self.translator)
+        if not word or word in self.stop_words:
+            return None
+        return self.stem(word)
+
+    # Field terms of one field's text
+    def field_terms(self, field, text):
+        if field == 'tag':
+            return [f"tag:{key}" for key in (tag_key(tag) for tag in text.split(",")) if key]
+        return [f"{field}:{term}" for term in self.analyze(text)]
+
+    # {field term: tf within its field} for a document's {field: text}
+    def analyze_fields(self, fields):
+        tfs = {}
+        for field, text in fields.items():
+            terms = self.field_terms(field, text)
+            for term, count in Counter(terms).items():
+                tfs[term] = count / len(terms)
+        return tfs
+
+    # analyze() every text; the call is timed
+    def analyze_many(self, texts):
+        start = time.perf_counter()
+        analyzed = [self.analyze(text) for text in texts]
+        self.last_call_seconds = time.perf_counter() - start
+        self.calls += 1
+        self.texts += len(analyzed)
+        self.terms += sum(len(terms) for terms in analyzed)
+        self.seconds += self.last_call_seconds
+        return analyzed
+
+    def stats(self):
+        cache = self.stem.cache_info()
+        return {
+            'calls': self.calls,
+            'texts': self.texts,
+            'terms': self.terms,
+            'seconds': self.seconds,
+            'last_call_seconds': self.last_call_seconds,
+            'texts_per_second': self.texts / self.seconds if self.seconds else 0.0,
+            'stem_cache_hits': cache.hits,
+            'stem_cache_misses': cache.misses,
+        }
+
+
+# Shared by every module in a process
+analyzer = Analyzer()
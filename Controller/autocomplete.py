@@ -0,0 +1,110 @@
+import bisect  # For finding the keys that start with a prefix.
+from functools import lru_cache  # For repeated keystrokes.
+import numpy as np  # Suggestion weights and top-k selection.
+from Controller import booleanQuerySteam
+from Controller.analyzer import WORD_PATTERN, analyzer, is_field_term  # Index terms of name and tag words.
+
+# Search box suggestions, served by app.py's /suggest route on every keystroke:
+#   - words completing the last word of the query, ranked by the document frequency of their
+#     index term. Index terms are stems ("adventur"), so a term is suggested under the name
+#     and tag words that stem to it ("adventure") when there are any.
+#   - games whose name starts with the query, ranked by review count.
+# Both are sorted key arrays: the completions of a prefix are one slice found by binary search.
+
+
+class PrefixIndex:
+    """Weighted keys sorted once, for prefix completion by binary search."""
+
+    def __init__(self, keys, weights, values):
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = [keys[i] for i in order]
+        self.weights = np.asarray(weights, dtype=np.float64)[order] if order else np.empty(0)
+        self.values = [values[i] for i in order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    # Slice of the keys starting with `prefix`
+    def prefix_range(self, prefix):
+        start = bisect.bisect_left(self.keys, prefix)
+        return start, bisect.bisect_left(self.keys, prefix + "\U0010ffff", start)
+
+    # (value, weight) of the `limit` heaviest keys starting with `prefix`, ties by key
+    def complete(self, prefix, limit=5):
+        start, end = self.prefix_range(prefix)
+        weights = self.weights[start:end]
+        if end - start > limit:
+            # Every key heavier than the limit-th weight, then the first keys with that weight
+            cutoff = -np.partition(-weights, limit - 1)[limit - 1]
+            rows = start + np.concatenate((np.flatnonzero(weights > cutoff), np.flatnonzero(weights == cutoff)))[:limit]
+        else:
+            rows = np.arange(start, end)
+        rows = sorted(rows.tolist(), key=lambda row: (-self.weights[row], row))
+        return [(self.values[row], float(self.weights[row])) for row in rows]
+
+
+term_index = PrefixIndex([], [], [])
+name_index = PrefixIndex([], [], [])
+
+
+def build_suggestions():
+    """Rebuild both prefix indexes from the live index and booleanQuerySteam.document_data."""
+    global term_index, name_index
+    index = booleanQuerySteam.inverted_index
+    names = booleanQuerySteam.document_data.name_entries()
+
+    # Name and tag words by the index term they stem to
+    words = {word for _, name, _ in names for word in WORD_PATTERN.findall(name.lower())}
+    store = booleanQuerySteam.document_data.store
+    if store is not None:
+        words.update(word for tag in store.tags for word in WORD_PATTERN.findall(tag.lower()))
+    surface_words = {}
+    for word in words:
+        term = analyzer.normalize(word)
+        if term is not None and not word.isdigit():
+            surface_words.setdefault(term, set()).add(word)
+
+    best = {}
+    for term in index.keys():
+        if is_field_term(term):
+            continue
+        frequency = index.doc_frequency(term)
+        for word in surface_words.get(term, (term,)):
+            if frequency > best.get(word, (-1,))[0]:
+                best[word] = (frequency, term)
+    keys = list(best)
+    term_index = PrefixIndex(keys, [best[word][0] for word in keys], keys)
+    name_index = PrefixIndex([name.lower() for _, name, _ in names], [reviews for _, _, reviews in names],
+                             [doc_id for doc_id, _, _ in names])
+    suggest.cache_clear()
+
+
+# Suggestions for a partly typed query: {'terms': [{'query', 'word', 'documents'}],
+# 'games': [{'id', 'name', 'reviews', 'sanitized_name', 'cluster'}]}
+@lru_cache(maxsize=4096)
+def suggest(query, limit=5):
+    text = query.lower().lstrip()
+    words = WORD_PATTERN.findall(text)
+    terms = []
+    if words and text[-1:].isalnum():
+        head = text[:len(text) - len(words[-1])]
+        terms = [{'query': head + word, 'word': word, 'documents': int(frequency)}
+                 for word, frequency in term_index.complete(words[-1], limit)]
+
+    games = []
+    if text.strip():
+        for doc_id, reviews in name_index.complete(text, limit):
+            document = booleanQuerySteam.document_data.get(doc_id)
+            if document is None:
+                continue
+            games.append({
+                'id': doc_id,
+                'name': document['data'].get('Name', 'Unknown'),
+                'reviews': int(reviews),
+                'sanitized_name': document['sanitized_name'],
+                'cluster': booleanQuerySteam.inverted_index.cluster_of(doc_id),
+            })
+    return {'terms': terms, 'games': games}
+
+
+build_suggestions()
@@ -0,0 +1,479 @@
+import hashlib  # Fingerprint of the query workload.
+import json  # Machine readable results and the replayable workload.
+import os  # Working directories and output sizes.
+import platform  # Machine description in the results.
+import random  # Seeded catalogs, workloads and samples.
+import re  # Words for the query workload and prices to jitter.
+import resource  # Peak RSS of every stage.
+import shutil  # For removing the working directory.
+import subprocess  # Every stage runs in its own process, so its peak RSS is its own.
+import sys  # For starting stage processes with the same interpreter.
+import tempfile  # Default working directory.
+import time  # Stage and query timings.
+from collections import Counter  # Frequent words for the query workload.
+from datetime import datetime, timezone  # Run timestamp.
+import numpy as np  # Latency percentiles.
+
+# Run from the repository root:
+#   python -m Controller.benchmark run --scales 1 10 100 --output benchmark.json
+#   python -m Controller.benchmark compare old.json new.json
+#
+# Every scale gets a working directory with its own dataset/ folder holding a synthetic catalog
+# of scale x steam_uncleaned.csv games (the real games plus perturbed copies). The pipeline runs
+# there stage by stage, each stage in its own process since every data path in Controller is
+# relative to the working directory. Every stage reports its wall time and peak RSS. The search
+# stage replays one query workload (saved next to the results so later runs can replay it) and
+# the recommend stage asks for related games of sampled games.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSV_PATH = 'dataset/steam_uncleaned.csv'
+RESULTS_VERSION = 1
+
+# Name suffixes of the perturbed copies of a game
+COPY_SUFFIXES = ('II', 'Remastered', 'Deluxe', 'Origins', 'Legends', 'Online', 'Tactics', 'Chronicles', 'Zero')
+QUERY_KINDS = ('broad', 'boolean', 'typo', 'phrase', 'field')
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux; worker pools count through RUSAGE_CHILDREN
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / 1024
+
+
+# Latency distribution of a list of durations in seconds
+def summarize(durations):
+    if not durations:
+        return {'count': 0}
+    milliseconds = np.array(durations) * 1000
+    p50, p95, p99 = np.percentile(milliseconds, [50, 95, 99]).tolist()
+    return {
+        'count': len(durations),
+        'mean_ms': float(milliseconds.mean()),
+        'p50_ms': p50,
+        'p95_ms': p95,
+        'p99_ms': p99,
+        'max_ms': float(milliseconds.max()),
+        'throughput_per_s': len(durations) / float(sum(durations)) if sum(durations) else 0.0,
+    }
+
+
+# Bytes of a file or of everything under a directory, 0 when missing
+def path_bytes(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+# Synthetic catalog: the real games followed by (scale - 1) perturbed copies of every game,
+# with new names, jittered price, reviews and release date, edited tags and reordered sentences
+def generate_catalog(source_csv, output_csv, scale, seed=0):
+    import pandas as pd  # Only needed to generate catalogs.
+
+    base = pd.read_csv(source_csv)
+    vocabulary = sorted({tag.strip() for tags in base['Tags'].dropna() for tag in str(tags).split(",") if tag.strip()})
+    dates = pd.to_datetime(base['Release_date'], format='%b %d, %Y', errors='coerce')
+    frames = [base]
+    for copy in range(1, scale):
+        rng = random.Random(f"{seed}-{copy}")
+        suffix = COPY_SUFFIXES[(copy - 1) % len(COPY_SUFFIXES)]
+        if copy > len(COPY_SUFFIXES):
+            suffix = f"{suffix} {copy}"
+        rows = []
+        for record, date in zip(base.to_dict('records'), dates):
+            record = dict(record)
+            if pd.notna(record['Name']):
+                record['Name'] = f"{record['Name']} {suffix}"
+            price = re.search(r'\d[\d,]*(\.\d+)?', str(record['Price']))
+            if price:
+                record['Price'] = f"${float(price.group().replace(',', '')) * rng.uniform(0.5, 1.5):.2f}"
+            reviews = re.search(r'\d[\d,]*', str(record['Review_no']))
+            if reviews:
+                record['Review_no'] = f" {max(1, int(int(reviews.group().replace(',', '')) * rng.uniform(0.1, 3))):,} User Reviews "
+            if pd.notna(date):
+                date = date + pd.Timedelta(days=rng.randint(-1500, 1500))
+                record['Release_date'] = f"{date:%b} {date.day}, {date.year}"
+            if pd.notna(record['Tags']):
+                tags = [tag for tag in str(record['Tags']).strip().split(",") if tag]
+                if len(tags) > 1 and rng.random() < 0.3:
+                    tags.pop(rng.randrange(len(tags)))
+                if rng.random() < 0.3:
+                    tag = rng.choice(vocabulary)
+                    if tag not in tags:
+                        tags.append(tag)
+                record['Tags'] = ",".join(tags)
+            if pd.notna(record['Description']):
+                sentences = str(record['Description']).split(". ")
+                rng.shuffle(sentences)
+                record['Description'] = ". ".join(sentences)
+            rows.append(record)
+        frames.append(pd.DataFrame(rows, columns=base.columns))
+    catalog = pd.concat(frames, ignore_index=True)
+    catalog.to_csv(output_csv, index=False)
+    return len(catalog)
+
+
+# Replayable query mix built from the catalog's words and tags: broad single words, boolean
+# combinations, misspelled words, phrases / NEAR and field plus range filters
+def generate_workload(csv_path, count=200, seed=0):
+    import pandas as pd  # Only needed to generate workloads.
+    from Controller.analyzer import analyzer  # Stop words never make useful query words.
+
+    rng = random.Random(seed)
+    steam_data = pd.read_csv(csv_path)
+    tags = sorted({tag.strip() for tags in steam_data['Tags'].dropna() for tag in str(tags).split(",") if tag.strip()})
+    descriptions = [str(text) for text in steam_data['Description'].dropna()]
+    words = Counter(word for text in descriptions for word in re.findall(r'[a-z]{4,}', text.lower())
+                    if word not in analyzer.stop_words)
+    frequent = [word for word, _ in words.most_common(500)]
+    typo_words = [word for word in frequent if len(word) >= 5]
+
+    def typo(word):
+        i = rng.randrange(1, len(word) - 1)
+        edit = rng.choice(('delete', 'swap', 'replace'))
+        if edit == 'delete':
+            return word[:i] + word[i + 1:]
+        if edit == 'swap':
+            return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        return word[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[i + 1:]
+
+    def phrase():
+        pairs = [pair for pair in re.findall(r'\b([A-Za-z]{3,}) ([A-Za-z]{3,})\b', rng.choice(descriptions))
+                 if not any(word.lower() in analyzer.stop_words for word in pair)]
+        if not pairs:
+            return f'"{rng.choice(frequent[:50])} {rng.choice(frequent[:50])}"'
+        first, second = rng.choice(pairs)
+        return f"{first} NEAR/3 {second}" if rng.random() < 0.3 else f'"{first} {second}"'
+
+    def field():
+        tag = rng.choice(tags)
+        tag_query = f'tags:"{tag}"' if " " in tag else f"tag:{tag}"
+        return rng.choice((f"{tag_query} AND price<{rng.choice((5, 10, 20))}",
+                           f"{tag_query} AND year>={rng.choice((2015, 2020, 2023))}",
+                           f"{rng.choice(frequent[:100])} AND reviews>{rng.choice((1000, 10000))}"))
+
+    def boolean():
+        a, b, c = (rng.choice(frequent[:200]) for _ in range(3))
+        return rng.choice((f"{a} AND {b}", f"{a} OR {b}", f"{a} NOT {b}", f"({a} OR {b}) AND {c}", f"{a} {b} NOT {c}"))
+
+    makers = {
+        'broad': lambda: rng.choice(frequent[:20]),
+        'boolean': boolean,
+        'typo': lambda: " ".join(typo(rng.choice(typo_words)) for _ in range(rng.choice((1, 2)))),
+        'phrase': phrase,
+        'field': field,
+    }
+    return [{'kind': kind, 'query': makers[kind]()} for kind in (QUERY_KINDS[i % len(QUERY_KINDS)] for i in range(count))]
+
+
+# Stages; each runs in the scale's working directory and returns its metrics
+
+def catalog_stage(options):
+    games = generate_catalog(options['source_csv'], CSV_PATH, options['scale'], options['seed'])
+    return {'games': games}
+
+
+def documents_stage(options):
+    from Controller import create_document  # Packed JSON Lines export of the catalog.
+
+    create_document.main(CSV_PATH, 'packed')
+    return {}
+
+
+def store_stage(options):
+    from Controller.document_store import build_document_store  # Columnar metadata for the app.
+
+    build_document_store(CSV_PATH)
+    return {}
+
+
+def index_stage(options):
+    if options['builder'] == 'streaming':
+        from Controller.streaming_index import build_streaming_index  # Bounded memory builder.
+
+        build_streaming_index(CSV_PATH, memory_mb=options['memory_mb'], workers=options['workers'])
+    else:
+        from Controller import indexing  # In-memory JSON builder; kmeans_clustering packs it.
+
+        indexing.build_index('dataset/documents.jsonl', 'dataset/inverted_index_ai.json', options['workers'],
+                             options['positions'])
+    return {}
+
+
+def cluster_stage(options):
+    from Controller import kmeans_clustering  # Loads the JSON index and the document store.
+
+    kmeans_clustering.main(options['clusters'], options['cluster_method'])
+    return {}
+
+
+def search_stage(options):
+    start = time.perf_counter()
+    from Controller import booleanQuerySteam  # Loads the index and the document store.
+    load_seconds = time.perf_counter() - start
+
+    with open(options['workload'], 'r', encoding='utf-8') as f:
+        workload = json.load(f)['queries']
+    durations, errors, hits = {}, 0, 0
+    for entry in workload:
+        # Every query is planned and ranked from scratch
+        booleanQuerySteam.result_cache.clear()
+        booleanQuerySteam.compile_query.cache_clear()
+        start = time.perf_counter()
+        results = booleanQuerySteam.ranked_search(entry['query'], 10)
+        if isinstance(results, dict):
+            errors += 1
+        else:
+            booleanQuerySteam.describe_results(results, 0, 10)
+            hits += results.total
+        durations.setdefault(entry['kind'], []).append(time.perf_counter() - start)
+
+    latency = {kind: summarize(values) for kind, values in durations.items()}
+    latency['all'] = summarize([value for values in durations.values() for value in values])
+    return {'load_seconds': load_seconds, 'latency': latency, 'errors': errors, 'total_hits': hits}
+
+
+def recommend_stage(options):
+    start = time.perf_counter()
+    from Controller import booleanQuerySteam, relatedGameRecommendation  # Index, metadata and tag bitsets.
+    load_seconds = time.perf_counter() - start
+
+    documents = booleanQuerySteam.inverted_index.documents.tolist()
+    sample = random.Random(options['seed']).sample(documents, min(options['recommendations'], len(documents)))
+    durations = []
+    for doc_id in sample:
+        tags = booleanQuerySteam.document_data[doc_id]['data']['Tags']
+        cluster = booleanQuerySteam.inverted_index.cluster_of(doc_id)
+        start = time.perf_counter()
+        relatedGameRecommendation.recommend_related_games(tags, cluster, 5, doc_id)
+        durations.append(time.perf_counter() - start)
+    return {'load_seconds': load_seconds, 'latency': summarize(durations)}
+
+
+def workload_stage(options):
+    queries = generate_workload(options['source_csv'], options['queries'], options['seed'])
+    with open(options['workload'], 'w', encoding='utf-8') as f:
+        json.dump({'seed': options['seed'], 'queries': queries}, f, indent=1)
+    return {'queries': len(queries)}
+
+
+STAGES = {
+    'workload': workload_stage,
+    'catalog': catalog_stage,
+    'documents': documents_stage,
+    'store': store_stage,
+    'index': index_stage,
+    'cluster': cluster_stage,
+    'search': search_stage,
+    'recommend': recommend_stage,
+}
+
+
+# Entry point of a stage process: run it and write its metrics to stage_<name>.json
+def run_stage(name, options):
+    start = time.perf_counter()
+    metrics = STAGES[name](options)
+    metrics['seconds'] = time.perf_counter() - start
+    metrics['peak_rss_mb'] = peak_rss_mb()
+    with open(f"stage_{name}.json", 'w', encoding='utf-8') as f:
+        json.dump(metrics, f)
+
+
+# Run a stage in a fresh process inside `scale_dir`; its output goes to logs/<stage>.log
+def run_stage_process(name, scale_dir, options):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get('PYTHONPATH')])))
+    os.makedirs(os.path.join(scale_dir, 'logs'), exist_ok=True)
+    with open(os.path.join(scale_dir, 'logs', f"{name}.log"), 'w', encoding='utf-8') as log:
+        process = subprocess.run([sys.executable, '-m', 'Controller.benchmark', 'stage', name, json.dumps(options)],
+                                 cwd=scale_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    if process.returncode != 0:
+        return {'error': f"Stage '{name}' exited with {process.returncode}; see {log.name}."}
+    with open(os.path.join(scale_dir, f"stage_{name}.json"), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def benchmark_scale(scale, workdir, options):
+    scale_dir = os.path.join(workdir, f"scale_{scale}")
+    os.makedirs(os.path.join(scale_dir, 'dataset'), exist_ok=True)
+    options = dict(options, scale=scale)
+
+    # The streaming builder needs the cluster model first; the JSON index is clustered after
+    build = ['index', 'cluster'] if options['builder'] == 'json' else ['cluster', 'index']
+    stages = {}
+    for name in ['catalog', 'documents', 'store'] + build + ['search', 'recommend']:
+        print(f"[{scale}x] {name}...")
+        stages[name] = run_stage_process(name, scale_dir, options)
+        if 'error' in stages[name]:
+            print(stages[name]['error'])
+            break
+
+    dataset = os.path.join(scale_dir, 'dataset')
+    return {
+        'games': stages['catalog'].get('games'),
+        'build_seconds': sum(stages[name].get('seconds', 0.0) for name in ('documents', 'store', 'index', 'cluster')
+                             if name in stages),
+        'peak_rss_mb': max(stage.get('peak_rss_mb', 0.0) for stage in stages.values()),
+        'sizes_bytes': {
+            'catalog_csv': path_bytes(os.path.join(dataset, 'steam_uncleaned.csv')),
+            'packed_documents': path_bytes(os.path.join(dataset, 'documents.jsonl')),
+            'document_store': path_bytes(os.path.join(dataset, 'document_store')),
+            'json_index': path_bytes(os.path.join(dataset, 'inverted_index_ai(30).json')),
+            'binary_index': path_bytes(os.path.join(dataset, 'inverted_index_bin')),
+        },
+        'stages': stages,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(scales=(1, 10, 100), source_csv=CSV_PATH, workdir=None, workload_path=None, queries=200,
+                  seed=0, builder='json', positions=False, workers=1, clusters=30, cluster_method='kmeans',
+                  memory_mb=256, recommendations=200, keep=False, save_workload=None):
+    """Benchmark the whole pipeline at every scale; returns the results dict."""
+    source_csv = os.path.abspath(source_csv)
+    created_workdir = workdir is None
+    workdir = os.path.abspath(workdir or tempfile.mkdtemp(prefix='steam_benchmark_'))
+    os.makedirs(workdir, exist_ok=True)
+
+    options = {
+        'source_csv': source_csv, 'workload': os.path.abspath(workload_path or os.path.join(workdir, 'workload.json')),
+        'seed': seed, 'builder': builder, 'positions': positions, 'workers': workers, 'clusters': clusters,
+        'cluster_method': cluster_method, 'memory_mb': memory_mb, 'recommendations': recommendations,
+    }
+
+    # One workload for every scale, so the scales are comparable. It is generated in a stage
+    # process too: Linux children inherit the peak RSS of the process they are forked from.
+    if workload_path is None:
+        generated = run_stage_process('workload', workdir, dict(options, queries=queries))
+        if 'error' in generated:
+            return generated
+        if save_workload:
+            shutil.copyfile(options['workload'], save_workload)
+    with open(options['workload'], 'rb') as f:
+        workload_sha1 = hashlib.sha1(f.read()).hexdigest()
+
+    results = {
+        'version': RESULTS_VERSION,
+        'started': datetime.now(timezone.utc).isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'options': options,
+        'workload_sha1': workload_sha1,
+        'scales': {},
+    }
+    try:
+        for scale in scales:
+            results['scales'][str(scale)] = benchmark_scale(scale, workdir, options)
+    finally:
+        if created_workdir and not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def print_summary(results):
+    print(f"{'scale':>6} {'games':>9} {'build s':>8} {'index MB':>9} {'peak MB':>8} "
+          f"{'search p50/p95/p99 ms':>24} {'qps':>7} {'recommend p50/p95/p99 ms':>26}")
+    for scale, result in results['scales'].items():
+        search = result['stages'].get('search', {}).get('latency', {}).get('all', {})
+        recommend = result['stages'].get('recommend', {}).get('latency', {})
+
+        def percentiles(latency):
+            if not latency.get('count'):
+                return "-"
+            return f"{latency['p50_ms']:.2f}/{latency['p95_ms']:.2f}/{latency['p99_ms']:.2f}"
+
+        print(f"{scale + 'x':>6} {result['games'] or 0:>9} {result['build_seconds']:>8.1f} "
+              f"{result['sizes_bytes']['binary_index'] / 2 ** 20:>9.1f} {result['peak_rss_mb']:>8.0f} "
+              f"{percentiles(search):>24} {search.get('throughput_per_s', 0):>7.0f} {percentiles(recommend):>26}")
+
+
+# Numeric leaves of a results dict by dotted path
+def _metrics(node, prefix=''):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from _metrics(value, f"{prefix}{key}.")
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        yield prefix[:-1], node
+
+
+# Side by side metrics of two result files, with the relative change
+def compare_results(old, new):
+    old_metrics = dict(_metrics(old['scales'], 'scales.'))
+    rows = []
+    for path, value in _metrics(new['scales'], 'scales.'):
+        if path in old_metrics and re.search(r'(_ms|seconds|_mb|sizes_bytes\..*|throughput_per_s)$', path):
+            before = old_metrics[path]
+            change = (value - before) / before * 100 if before else 0.0
+            rows.append((path, before, value, change))
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark index builds, searches and recommendations.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="benchmark synthetic catalogs")
+    run_parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100],
+                            help="catalog sizes as multiples of the source CSV")
+    run_parser.add_argument('--csv', default=CSV_PATH, help="source catalog")
+    run_parser.add_argument('--workdir', default=None, help="where catalogs and indexes are built (default: temp dir)")
+    run_parser.add_argument('--keep', action='store_true', help="keep the default temp working directory")
+    run_parser.add_argument('--workload', default=None, help="replay this workload file instead of generating one")
+    run_parser.add_argument('--save-workload', default=None, help="copy the generated workload to this file")
+    run_parser.add_argument('--queries', type=int, default=200, help="size of a generated workload")
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--builder', choices=['json', 'streaming'], default='json',
+                            help="json: indexing.py then kmeans_clustering.py; streaming: streaming_index.py")
+    run_parser.add_argument('--positions', action='store_true', help="index positions (json builder)")
+    run_parser.add_argument('--workers', type=int, default=1)
+    run_parser.add_argument('--clusters', type=int, default=30)
+    run_parser.add_argument('--cluster-method', choices=['kmeans', 'minibatch'], default='kmeans')
+    run_parser.add_argument('--memory-mb', type=int, default=256, help="posting buffer of the streaming builder")
+    run_parser.add_argument('--recommendations', type=int, default=200, help="games to ask related games for")
+    run_parser.add_argument('--output', default=None, help="results file (default: print JSON)")
+
+    stage_parser = subparsers.add_parser('stage', help="run one stage in the current directory (used by run)")
+    stage_parser.add_argument('name', choices=list(STAGES))
+    stage_parser.add_argument('options', help="stage options as JSON")
+
+    compare_parser = subparsers.add_parser('compare', help="compare two results files")
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+
+    args = parser.parse_args()
+    if args.command == 'stage':
+        run_stage(args.name, json.loads(args.options))
+    elif args.command == 'compare':
+        with open(args.old, 'r', encoding='utf-8') as f:
+            old_results = json.load(f)
+        with open(args.new, 'r', encoding='utf-8') as f:
+            new_results = json.load(f)
+        for path, before, after, change in compare_results(old_results, new_results):
+            print(f"{path:70s} {before:>14.3f} {after:>14.3f} {change:>+8.1f}%")
+    else:
+        benchmark_results = run_benchmark(args.scales, args.csv, args.workdir, args.workload, args.queries, args.seed,
+                                          args.builder, args.positions, args.workers, args.clusters,
+                                          args.cluster_method, args.memory_mb, args.recommendations, args.keep,
+                                          args.save_workload)
+        if 'error' in benchmark_results:
+            print(benchmark_results['error'])
+            sys.exit(1)
+        print_summary(benchmark_results)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(benchmark_results, f, indent=2)
+            print(f"Results saved to {args.output}.")
+        else:
+            print(json.dumps(benchmark_results, indent=2))
@@ -0,0 +1,325 @@
+import json  # For the term dictionary and metadata files.
+import os  # For building paths inside the index directory.
+import numpy as np  # For the packed posting arrays and memory mapping.
+from Controller import bitmaps  # Bitmaps of dense posting lists and of clusters.
+from Controller import generations  # Rebuilds are published as new generations.
+from Controller.positions import decode_position_lists, list_offsets, positions_from_text  # Delta/varint position lists.
+
+
+# Layout of an index directory written by `write_binary_index`:
+#   meta.json              format version and counts
+#   terms.json             sorted term dictionary (term i owns postings[offsets[i]:offsets[i + 1]])
+#   idf.npy                float64 idf per term
+#   offsets.npy            int64 start of every term's postings, plus the end sentinel
+#   doc_ids.npy            int32 doc ids, sorted inside every term
+#   scores.npy             float32 TF-IDF score parallel to doc_ids
+#   clusters.npy           int16 cluster parallel to doc_ids (-1 when not clustered yet)
+#   documents.npy          int32 sorted ids of every indexed document
+#   document_clusters.npy  int16 cluster of every indexed document
+#   max_scores.npy         float32 highest score of every term (top-k pruning bound)
+#   min_scores.npy         float32 lowest score of every term
+#   dense_terms.npy        int32 ids of the terms also served as bitmaps (bitmaps.dense_terms)
+# and, for indexes built with positions (python -m Controller.indexing --positions):
+#   positions.npy          uint8 heap of position lists (see positions.py), in posting order
+#   position_offsets.npy   uint32 (int64 for heaps over 4 GiB) start of every posting's position
+#                          list, plus the end sentinel
+#
+# Rebuilding a directory that already holds an index writes a new generation next to the
+# files readers have memory mapped and publishes it atomically (generations.py).
+FORMAT_VERSION = 1
+ARRAY_FILES = ('idf', 'offsets', 'doc_ids', 'scores', 'clusters', 'documents', 'document_clusters')
+# Derived arrays; recomputed on load when an older index directory doesn't have them
+DERIVED_FILES = ('max_scores', 'min_scores', 'dense_terms')
+# Optional arrays; phrase and NEAR queries fall back to matching all their terms without them
+POSITION_FILES = ('positions', 'position_offsets')
+
+
+# Split a posting value into (score, cluster); indexing.py stores a bare score,
+# kmeans_clustering.py stores {"score": ..., "cluster": ...}
+def _posting_values(posting):
+    if isinstance(posting, dict):
+        return posting.get('score', 0.0), posting.get('cluster', -1)
+    return posting, -1
+
+
+# Highest and lowest score of every term
+def score_bounds(offsets, scores):
+    counts = np.diff(offsets)
+    max_scores = np.zeros(len(counts), dtype=np.float32)
+    min_scores = np.zeros(len(counts), dtype=np.float32)
+    nonempty = counts > 0
+    if nonempty.any():
+        starts = offsets[:-1][nonempty]
+        max_scores[nonempty] = np.maximum.reduceat(scores, starts)
+        min_scores[nonempty] = np.minimum.reduceat(scores, starts)
+    return max_scores, min_scores
+
+
+# Pack a JSON shaped inverted index into flat arrays
+def pack_inverted_index(inverted_index):
+    terms = sorted(inverted_index.keys())
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    for i, term in enumerate(terms):
+        offsets[i + 1] = offsets[i] + len(inverted_index[term]['postings'])
+
+    doc_ids = np.empty(offsets[-1], dtype=np.int32)
+    scores = np.empty(offsets[-1], dtype=np.float32)
+    clusters = np.empty(offsets[-1], dtype=np.int16)
+    idf = np.empty(len(terms), dtype=np.float64)
+    document_clusters = {}
+    has_positions = any('positions' in term_data for term_data in inverted_index.values())
+    position_lists = []
+
+    for i, term in enumerate(terms):
+        term_data = inverted_index[term]
+        idf[i] = term_data.get('idf', 0.0)
+        postings = sorted((int(doc_id), posting) for doc_id, posting in term_data['postings'].items())
+        start = offsets[i]
+        for j, (doc_id, posting) in enumerate(postings):
+            score, cluster = _posting_values(posting)
+            doc_ids[start + j] = doc_id
+            scores[start + j] = score
+            clusters[start + j] = cluster
+            document_clusters[doc_id] = cluster
+        if has_positions:
+            term_positions = term_data.get('positions', {})
+            position_lists.extend(positions_from_text(term_positions[str(doc_id)]) if str(doc_id) in term_positions
+                                  else b"" for doc_id, _ in postings)
+
+    documents = np.array(sorted(document_clusters), dtype=np.int32)
+    arrays = {
+        'idf': idf,
+        'offsets': offsets,
+        'doc_ids': doc_ids,
+        'scores': scores,
+        'clusters': clusters,
+        'documents': documents,
+        'document_clusters': np.array([document_clusters[d] for d in documents.tolist()], dtype=np.int16),
+    }
+    arrays['max_scores'], arrays['min_scores'] = score_bounds(offsets, scores)
+    if has_positions:
+        arrays['position_offsets'] = list_offsets([len(position_list) for position_list in position_lists])
+        arrays['positions'] = np.frombuffer(b"".join(position_lists), dtype=np.uint8)
+    return terms, arrays
+
+
+# Write the inverted index to `output_dir` in the binary format
+def write_binary_index(inverted_index, output_dir):
+    terms, arrays = pack_inverted_index(inverted_index)
+    save_binary_index(terms, arrays, output_dir)
+
+
+# Directory the arrays of `index_dir` are read from (see generations.py)
+def index_path(index_dir):
+    return generations.current_path(index_dir)
+
+
+# Where a new index for `output_dir` is written (see generations.py)
+def staging_directory(output_dir):
+    return generations.staging_directory(output_dir)
+
+
+# Make the generation in `staging_dir` the index readers of `output_dir` load
+def publish_index(staging_dir, output_dir):
+    index_files = {f"{name}.npy" for name in ARRAY_FILES + DERIVED_FILES + POSITION_FILES} | {'terms.json', 'meta.json'}
+    generations.publish(staging_dir, output_dir, index_files)
+
+
+# Save already packed arrays; used by the writers that build arrays directly. Writers that
+# stream arrays into files (np.lib.format.open_memmap) do so in `staging_dir`, see staging_directory
+def save_binary_index(terms, arrays, output_dir, staging_dir=None):
+    staging_dir = staging_directory(output_dir) if staging_dir is None else staging_dir
+    # The writer decides which posting lists are dense enough to be kept as bitmaps
+    if 'dense_terms' not in arrays:
+        arrays['dense_terms'] = bitmaps.dense_terms(np.diff(arrays['offsets']), len(arrays['documents']))
+    for name in ARRAY_FILES + DERIVED_FILES + tuple(name for name in POSITION_FILES if name in arrays):
+        path = os.path.join(staging_dir, f"{name}.npy")
+        # Arrays streamed straight into their destination file only need a flush
+        if isinstance(arrays[name], np.memmap) and os.path.abspath(arrays[name].filename) == os.path.abspath(path):
+            arrays[name].flush()
+            continue
+        np.save(path, arrays[name])
+    with open(os.path.join(staging_dir, 'terms.json'), 'w', encoding='utf-8') as f:
+        json.dump(terms, f, ensure_ascii=False)
+    # meta.json is written last so a half written directory is never picked up
+    with open(os.path.join(staging_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'version': FORMAT_VERSION,
+            'term_count': len(terms),
+            'posting_count': int(arrays['offsets'][-1]),
+            'document_count': int(len(arrays['documents'])),
+        }, f)
+    publish_index(staging_dir, output_dir)
+    print(f"Binary inverted index saved to {output_dir}.")
+
+
+class BinaryIndex:
+    """Read-only inverted index backed by flat (optionally memory mapped) arrays."""
+
+    def __init__(self, terms, arrays):
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.idf_values = arrays['idf']
+        self.offsets = arrays['offsets']
+        self.doc_ids = arrays['doc_ids']
+        self.scores = arrays['scores']
+        self.clusters = arrays['clusters']
+        self.documents = arrays['documents']
+        self.document_clusters = arrays['document_clusters']
+        if 'max_scores' not in arrays:
+            arrays['max_scores'], arrays['min_scores'] = score_bounds(self.offsets, self.scores)
+        self.max_scores = arrays['max_scores']
+        self.min_scores = arrays['min_scores']
+        if 'dense_terms' not in arrays:
+            arrays['dense_terms'] = bitmaps.dense_terms(np.diff(self.offsets), len(self.documents))
+        self._build_bitmaps(arrays['dense_terms'])
+        self._build_cluster_docs()
+        self.has_positions = 'positions' in arrays
+        if self.has_positions:
+            self.positions = arrays['positions']
+            self.position_offsets = arrays['position_offsets']
+
+    # Terms served as bitmaps; their bitmaps are built on first use
+    def _build_bitmaps(self, dense_term_ids):
+        self.dense_terms = {self.terms[i] for i in np.asarray(dense_term_ids).tolist()}
+        self.bitmaps = {}
+        self.document_bitmap = None
+
+    # cluster -> doc ids as a bitmap (see bitmaps.compact), built once (documents are already sorted)
+    def _build_cluster_docs(self):
+        order = np.argsort(self.document_clusters, kind='stable')
+        cluster_ids, starts = np.unique(self.document_clusters[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+        self.cluster_docs = {
+            int(cluster): bitmaps.compact(self.documents[order[start:end]], len(self.documents))
+            for cluster, start, end in zip(cluster_ids, starts, ends)
+        }
+
+    @classmethod
+    def from_dict(cls, inverted_index):
+        return cls(*pack_inverted_index(inverted_index))
+
+    def __contains__(self, term):
+        return term in self.term_ids
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __iter__(self):
+        return iter(self.terms)
+
+    def keys(self):
+        return self.terms
+
+    def _range(self, term):
+        i = self.term_ids[term]
+        return self.offsets[i], self.offsets[i + 1]
+
+    # Sorted doc ids, scores and clusters of a term (views, nothing is copied)
+    def postings(self, term):
+        if term not in self.term_ids:
+            empty = slice(0, 0)
+            return self.doc_ids[empty], self.scores[empty], self.clusters[empty]
+        start, end = self._range(term)
+        return self.doc_ids[start:end], self.scores[start:end], self.clusters[start:end]
+
+    # Postings plus the term's score bounds, the shape ranking.top_k expects
+    def scored_postings(self, term):
+        doc_ids, scores, _ = self.postings(term)
+        if term not in self.term_ids:
+            return doc_ids, scores, 0.0, 0.0
+        i = self.term_ids[term]
+        return doc_ids, scores, float(self.max_scores[i]), float(self.min_scores[i])
+
+    def doc_frequency(self, term):
+        if term not in self.term_ids:
+            return 0
+        start, end = self._range(term)
+        return int(end - start)
+
+    # Doc ids of a term for boolean matching: a bitmap for dense terms, else the sorted array
+    def doc_set(self, term):
+        if term not in self.dense_terms:
+            return self.postings(term)[0]
+        bitmap = self.bitmaps.get(term)
+        if bitmap is None:
+            bitmap = self.bitmaps[term] = bitmaps.from_array(self.postings(term)[0])
+        return bitmap
+
+    # (doc id of every position, word offsets) of a term in the sorted `doc_ids`, for
+    # phrase and NEAR matching; docs without the term are skipped
+    def term_positions(self, term, doc_ids):
+        term_doc_ids, _, _ = self.postings(term)
+        if not self.has_positions or len(term_doc_ids) == 0:
+            return doc_ids[:0], np.empty(0, dtype=np.int64)
+        rows = np.searchsorted(term_doc_ids, doc_ids)
+        rows[rows == len(term_doc_ids)] = 0
+        found = term_doc_ids[rows] == doc_ids
+        rows = rows[found] + self._range(term)[0]
+        counts, positions = decode_position_lists(self.positions, self.position_offsets[rows],
+                                                  self.position_offsets[rows + 1])
+        return np.repeat(doc_ids[found], counts), positions
+
+    # Every indexed document as a bitmap, the universe NOT clauses subtract from
+    def document_set(self):
+        if self.document_bitmap is None:
+            self.document_bitmap = bitmaps.from_array(self.documents)
+        return self.document_bitmap
+
+    # Cluster of a document, -1 when the document isn't indexed
+    def cluster_of(self, doc_id):
+        return int(self.clusters_of(np.array([doc_id]))[0])
+
+    # Vectorized cluster_of for an array of doc ids
+    def clusters_of(self, doc_ids):
+        clusters = np.full(len(doc_ids), -1, dtype=np.int16)
+        if len(self.documents) == 0:
+            return clusters
+        positions = np.searchsorted(self.documents, doc_ids)
+        positions[positions == len(self.documents)] = len(self.documents) - 1
+        found = self.documents[positions] == doc_ids
+        clusters[found] = self.document_clusters[positions[found]]
+        return clusters
+
+    # Sorted doc ids of every document in a cluster
+    def cluster_members(self, cluster):
+        return bitmaps.to_array(self.cluster_set(cluster))
+
+    # Documents of a cluster in their stored form, for boolean filtering
+    def cluster_set(self, cluster):
+        return self.cluster_docs.get(int(cluster), np.asarray(self.documents[:0]))
+
+    def idf(self, term):
+        return float(self.idf_values[self.term_ids[term]]) if term in self.term_ids else 0.0
+
+
+# Load an index directory; arrays are memory mapped so workers share the page cache
+def load_binary_index(index_dir, mmap=True):
+    index_dir = index_path(index_dir)  # resolved once, so every file comes from the same generation
+    with open(os.path.join(index_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported binary index version {meta.get('version')} in {index_dir}.")
+    with open(os.path.join(index_dir, 'terms.json'), 'r', encoding='utf-8') as f:
+        terms = json.load(f)
+    mmap_mode = 'r' if mmap else None
+    arrays = {name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode=mmap_mode) for name in ARRAY_FILES}
+    for name in DERIVED_FILES + POSITION_FILES:
+        path = os.path.join(index_dir, f"{name}.npy")
+        if os.path.exists(path):
+            arrays[name] = np.load(path, mmap_mode=mmap_mode)
+    return BinaryIndex(terms, arrays)
+
+
+def binary_index_exists(index_dir):
+    return generations.is_complete(index_dir)
+
+
+# Convert an existing JSON index: python -m Controller.binary_index <index.json> <output_dir>
+if __name__ == "__main__":
+    import sys
+
+    json_path = sys.argv[1] if len(sys.argv) > 1 else 'dataset/inverted_index_ai.json'
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else 'dataset/inverted_index_bin'
+    with open(json_path, 'r', encoding='utf-8') as f:
+        write_binary_index(json.load(f), output_dir)
@@ -0,0 +1,129 @@
+from array import array  # Zero-copy hand-off of doc ids to pyroaring.
+import numpy as np  # Doc-id arrays and the packed fallback bitmap.
+
+try:
+    from pyroaring import BitMap  # Compressed (roaring) bitmaps, used when installed.
+except ImportError:
+    BitMap = None
+
+
+# Doc-id sets for dense posting lists and cluster membership. A roaring bitmap when pyroaring
+# is installed, otherwise a PackedBitmap (one bit per doc id up to the largest one). Posting
+# lists stay sorted int32 arrays (see posting_algebra.py); a term's list is also kept as a
+# bitmap when at least DENSE_FRACTION of the documents contain it. That is roaring's own
+# cut-off between array and bitmap containers (4096 of 65536 values).
+DENSE_FRACTION = 1 / 16
+HAVE_ROARING = BitMap is not None
+
+# Set bits of every byte value, for counting PackedBitmap members
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+
+
+class PackedBitmap:
+    """Set of doc ids stored as one bit per id in a uint8 array."""
+
+    __slots__ = ('bits', 'count')
+
+    def __init__(self, bits, count=None):
+        self.bits = bits
+        self.count = int(_POPCOUNT[bits].sum()) if count is None else count
+
+    @classmethod
+    def from_array(cls, doc_ids):
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        if len(doc_ids) == 0:
+            return cls(np.zeros(0, dtype=np.uint8), 0)
+        mask = np.zeros(int(doc_ids[-1]) + 1, dtype=bool)
+        mask[doc_ids] = True
+        return cls(np.packbits(mask, bitorder='little'), len(doc_ids))
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, doc_id):
+        return bool(self.contains(np.array([doc_id]))[0])
+
+    # Boolean mask telling which of `values` are in the set
+    def contains(self, values):
+        values = np.asarray(values, dtype=np.int64)
+        found = np.zeros(len(values), dtype=bool)
+        inside = (values >= 0) & (values < len(self.bits) * 8)
+        positions = values[inside]
+        found[inside] = (self.bits[positions >> 3] >> (positions & 7)) & 1 == 1
+        return found
+
+    def to_array(self):
+        return np.flatnonzero(np.unpackbits(self.bits, bitorder='little')).astype(np.int32)
+
+    # Both bit arrays padded to the same length
+    def _aligned(self, other):
+        size = max(len(self.bits), len(other.bits))
+        return (np.pad(self.bits, (0, size - len(self.bits))), np.pad(other.bits, (0, size - len(other.bits))))
+
+    def __and__(self, other):
+        size = min(len(self.bits), len(other.bits))
+        return PackedBitmap(self.bits[:size] & other.bits[:size])
+
+    def __or__(self, other):
+        a, b = self._aligned(other)
+        return PackedBitmap(a | b)
+
+    def __sub__(self, other):
+        a, b = self._aligned(other)
+        return PackedBitmap((a & ~b)[:len(self.bits)])
+
+
+def is_bitmap(postings):
+    return isinstance(postings, PackedBitmap) or (HAVE_ROARING and isinstance(postings, BitMap))
+
+
+# Bitmap of a sorted doc-id array
+def from_array(doc_ids):
+    if HAVE_ROARING:
+        return BitMap(array('I', np.asarray(doc_ids, dtype=np.uint32).tobytes()))
+    return PackedBitmap.from_array(doc_ids)
+
+
+# Sorted int32 doc ids of a bitmap; arrays are returned as they are
+def to_array(postings):
+    if isinstance(postings, PackedBitmap):
+        return postings.to_array()
+    if HAVE_ROARING and isinstance(postings, BitMap):
+        return np.frombuffer(postings.to_array(), dtype=np.uint32).astype(np.int32)
+    return postings
+
+
+def as_bitmap(postings):
+    return postings if is_bitmap(postings) else from_array(postings)
+
+
+# Docs of the sorted array `doc_ids` that are in `bitmap`, as a sorted array
+def select(bitmap, doc_ids):
+    if isinstance(bitmap, PackedBitmap):
+        return doc_ids[bitmap.contains(doc_ids)]
+    return to_array(from_array(doc_ids) & bitmap)
+
+
+# Docs of the sorted array `doc_ids` that are not in `bitmap`, as a sorted array
+def reject(bitmap, doc_ids):
+    if isinstance(bitmap, PackedBitmap):
+        return doc_ids[~bitmap.contains(doc_ids)]
+    return to_array(from_array(doc_ids) - bitmap)
+
+
+# Whether a posting list of `count` docs out of `document_count` is worth a bitmap
+def is_dense(count, document_count):
+    return document_count > 0 and count >= DENSE_FRACTION * document_count
+
+
+# Ids of the terms whose posting lists the index keeps as bitmaps too
+def dense_terms(doc_frequency, document_count):
+    return np.flatnonzero(np.asarray(doc_frequency) >= max(DENSE_FRACTION * document_count, 1)).astype(np.int32)
+
+
+# Smallest set form of a sorted doc-id array: a roaring bitmap adapts to any density, the
+# packed fallback only pays off for dense sets
+def compact(doc_ids, document_count):
+    if HAVE_ROARING or is_dense(len(doc_ids), document_count):
+        return from_array(doc_ids)
+    return np.asarray(doc_ids, dtype=np.int32)
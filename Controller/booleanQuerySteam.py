@@ -1,40 +1,180 @@
 import json  # load and save data like the JSON inverted index.
 import os  # For interacting with the file system, e.g., reading files and checking file/directory existence.
-import string  # For handling strings and removing punctuation.
 import re  # For working with regular expressions to parse and process text.
-from nltk.stem import PorterStemmer  # For stemming words to their root forms (e.g., "running" -> "run").
-from nltk.corpus import stopwords  # For removing common stop words (e.g., "the", "and") during text processing.
-import difflib  # For approximate string matching, used for correcting and finding similar terms in a dictionary.
+import threading  # One index refresh at a time across request threads.
+import time  # For telling data loaded by different runs apart.
+import traceback  # For logging failed index refreshes.
+from Controller.analyzer import analyzer, is_field_term  # Stop words and cached stemming shared with the indexer.
+from functools import lru_cache  # For caching compiled query plans.
+import numpy as np  # Ranked result arrays.
+from Controller.binary_index import BinaryIndex, binary_index_exists, load_binary_index  # Compact postings format.
+from Controller import query_planner  # Rewrites and evaluates parsed boolean queries.
+from Controller import bitmaps  # Boolean results may be bitmaps; ranking takes arrays.
+from Controller import ranking  # Top-k scoring of matched documents.
+from Controller.ranking import SearchResults  # Ranked hits of a query.
+from Controller.query_parser import parse_query, parse_range_term, QuerySyntaxError  # Boolean query grammar.
+from Controller.spell_correction import CorrectionIndex  # Fast closest-term lookup for typo correction.
+from Controller.result_cache import ResultCache  # Ranked results reused across page turns.
+from Controller import metrics  # Stage latency histograms and cache gauges.
+from Controller.document_store import (  # Columnar metadata of every game built from the CSV.
+    DOCUMENT_STORE_DIR, DocumentData, document_store_exists, load_document_store, sanitize_filename
+)
+from Controller import segments  # Incremental updates written next to the base index.
+from Controller.create_document import iter_packed_documents, packed_path  # Packed export of the game documents.
 
 
 # Global variables to hold loaded data
-inverted_index = {}
-document_data = {}
+base_index = BinaryIndex.from_dict({})  # index built by the full pipeline (or the last merge)
+inverted_index = base_index  # live view searched by queries: base index plus segments
+correction_index = CorrectionIndex([])
+document_data = DocumentData()
 
+# Incremental update state; index_generation moves whenever inverted_index is replaced
+index_generation = 0
+startup_token = f"{time.time_ns():x}"
+loaded_base = None
+loaded_segments = {}
+manifest_state = None
+refresh_lock = threading.Lock()
 
-# Load the inverted index
-def load_inverted_index(file_path):
-    global inverted_index
-    if os.path.exists(file_path):
+# Ranked doc ids per query plan. At least RESULT_CACHE_DEPTH hits are ranked on a miss so the
+# next pages of a query are slices of the cached arrays.
+RESULT_CACHE_DEPTH = 100
+result_cache = ResultCache(max_entries=256, ttl=300)
+
+# With STEAM_SHARDS set, app.py searches the shard workers (Controller/sharding.py) and this
+# process only needs the game data: the full index is not loaded and app.py installs the
+# shards' catalog with use_index
+SHARDED = bool(os.environ.get('STEAM_SHARDS'))
+
+
+# Load the inverted index, preferring the memory mapped binary format over the JSON file
+def load_inverted_index(file_path, binary_dir="dataset/inverted_index_bin"):
+    global base_index
+    start = time.perf_counter()
+    if binary_index_exists(binary_dir):
+        base_index = load_binary_index(binary_dir)
+        print("Binary inverted index loaded successfully.")
+    elif os.path.exists(file_path):
         with open(file_path, 'r', encoding='utf-8') as f:
             try:
-                inverted_index = json.load(f)
+                base_index = BinaryIndex.from_dict(json.load(f))
                 print("Inverted index loaded successfully.")
             except json.JSONDecodeError:
                 print("Error: Invalid JSON format in inverted index file.")
     else:
         print(f"Error: File {file_path} not found.")
+    use_index(base_index)
+    metrics.load_latency.observe('index', time.perf_counter() - start)
+
+
+# Switch queries over to a new live index
+def use_index(index):
+    global inverted_index, correction_index, index_generation
+    inverted_index = index
+    # Most updates leave the vocabulary as it was, and then the correction index is kept
+    vocabulary = {term for term in inverted_index.keys() if not is_field_term(term)}
+    if vocabulary != correction_index.vocabulary_set:
+        correction_index = CorrectionIndex(vocabulary)
+    compile_query.cache_clear()
+    result_cache.clear()
+    index_generation += 1
+
+
+# Pick up segments, deletions and merges written since the last call without a restart.
+# Cheap when nothing changed (one stat call); returns True when the live index changed.
+# Requests call this from several threads, so one refresh runs at a time. The manifest's mtime
+# is only remembered once the reload succeeded: a failed reload (a half written manifest, a
+# segment a merge just removed) keeps the current index and is retried on the next call.
+def refresh_index(segments_dir=segments.SEGMENTS_DIR):
+    path = segments.manifest_path(segments_dir)
+    if not os.path.exists(path) or os.stat(path).st_mtime_ns == manifest_state:
+        return False
+    with refresh_lock:
+        try:
+            return _refresh_index(segments_dir, path)
+        except Exception:
+            print("Index refresh failed, keeping the current index:")
+            traceback.print_exc()
+            return False
+
+
+def _refresh_index(segments_dir, path):
+    global base_index, loaded_base, loaded_segments, manifest_state
+    state = os.stat(path).st_mtime_ns
+    if state == manifest_state:
+        return False  # another thread refreshed while this one waited
+    start = time.perf_counter()
+    manifest = segments.read_manifest(segments_dir)
+
+    # Load everything before touching the globals
+    new_base, new_loaded_base, new_documents = base_index, loaded_base, {}
+    if manifest['base'] and manifest['base'] != loaded_base:
+        base_dir = os.path.join(segments_dir, manifest['base'])
+        new_base = load_binary_index(base_dir)
+        new_loaded_base = manifest['base']
+        new_documents.update(segments.load_segment_documents(base_dir))
 
+    names = {entry['name'] for entry in manifest['segments'] if entry['name']}
+    new_segments = {name: index for name, index in loaded_segments.items() if name in names}
+    for name in sorted(names - set(new_segments)):
+        segment_dir = os.path.join(segments_dir, name)
+        new_segments[name] = load_binary_index(segment_dir)
+        new_documents.update(segments.load_segment_documents(segment_dir))
+    live = segments.live_index(new_base, manifest, new_segments)
 
-def sanitize_filename(filename):
-    # Remove or replace invalid characters for filesystem
-    return re.sub(r'[^\w\s\.-]', '', filename)  # Removes invalid characters
+    base_index, loaded_base, loaded_segments = new_base, new_loaded_base, new_segments
+    add_documents(new_documents)
+    use_index(live)
 
+    # Forget the metadata of deleted games
+    deleted = set(manifest['removed_documents'])
+    deleted.update(doc_id for entry in manifest['segments'] for doc_id in entry['deletes'])
+    live = set(inverted_index.documents.tolist())
+    for doc_id in deleted - live:
+        document_data.pop(doc_id, None)
+    manifest_state = state
+    metrics.load_latency.observe('refresh', time.perf_counter() - start)
+    print(f"Index refreshed to generation {manifest['generation']}.")
+    return True
 
-# Load document data from the `dataset/document` directory
-def load_document_data(directory_path):
+
+# Changes whenever the data behind search results or game pages may have changed (reload,
+# segment refresh, restart or the document store generation loaded); used to build HTTP ETags
+def data_version():
+    store = document_data.store
+    return f"{startup_token}-{index_generation}-{store.generation if store is not None else 'none'}"
+
+
+# Add documents written by segments.add_documents to document_data
+def add_documents(documents):
+    for doc_id, document in documents.items():
+        document_data[doc_id] = {
+            'original_name': document['original_name'],
+            'sanitized_name': document['sanitized_name'],
+            'data': parse_document_content(document['content']),
+            'details': parse_game_details(document['content'])
+        }
+
+
+# Load game metadata from the columnar document store. When the store hasn't been built
+# (python -m Controller.document_store), read the packed export or the per-game files in
+# `directory_path` instead.
+def load_document_data(directory_path, store_dir=DOCUMENT_STORE_DIR, packed_file=packed_path):
     global document_data
-    if os.path.exists(directory_path):
+    start = time.perf_counter()
+    if document_store_exists(store_dir):
+        document_data = DocumentData(load_document_store(store_dir))
+        print("Document store loaded successfully.")
+    elif os.path.exists(packed_file):
+        document_data = DocumentData()
+        add_documents({
+            document['id']: dict(document, sanitized_name=sanitize_filename(document['original_name']))
+            for document in iter_packed_documents(packed_file)
+        })
+        print("Packed document data loaded successfully.")
+    elif os.path.exists(directory_path):
+        document_data = DocumentData()
         for filename in os.listdir(directory_path):
             if filename.endswith(".txt"):
                 match = re.match(r"(\d+)_", filename)
@@ -47,11 +187,13 @@ def load_document_data(directory_path):
                         document_data[doc_id] = {
                             'original_name': filename,
                             'sanitized_name': sanitized_name,
-                            'data': parse_document_content(content)
+                            'data': parse_document_content(content),
+                            'details': parse_game_details(content)
                         }
         print("Document data loaded successfully.")
     else:
         print(f"Error: Directory {directory_path} not found.")
+    metrics.load_latency.observe('documents', time.perf_counter() - start)
 
 
 # Parse the content of a document for specific fields
@@ -80,96 +222,190 @@ def parse_document_content(content):
     return data
 
 
-def get_closest_matches(word, dictionary, cutoff=0.8):
-    matches = difflib.get_close_matches(word, dictionary, n=1, cutoff=cutoff)
-    return matches[0] if matches else word
+# Fields of the game details page from a document's text; the description runs to the end
+def parse_game_details(content):
+    data = {}
+    lines = content.splitlines()
+    for i, line in enumerate(lines):
+        if line.startswith("Name:"):
+            data['name'] = line[len("Name:"):].strip()
+        elif line.startswith("Price:"):
+            data['price'] = line[len("Price:"):].strip()
+        elif line.startswith("Release_date:"):
+            data['release_date'] = line[len("Release_date:"):].strip()
+        elif line.startswith("Review_no:"):
+            data['review_no'] = line[len("Review_no:"):].strip()
+        elif line.startswith("Review_type:"):
+            data['review_type'] = line[len("Review_type:"):].strip()
+        elif line.startswith("Tags:"):
+            data['tags'] = line[len("Tags:"):].strip()
+        elif line.startswith("Description:"):
+            data['description'] = "\n".join([line[len("Description:"):]] + lines[i + 1:]).strip()
+            break
+    return data
+
+
+# Normalize one query word into an index term; stop words normalize to None
+def normalize_query_term(word):
+    term = analyzer.normalize(word)
+    if term is None:
+        return None
+    with metrics.timed(metrics.search_stages, 'correction'):
+        return correction_index.closest(term, cutoff=0.8)
 
 
-def boolean_search(query):
-    tokens = query.upper().split()
+# Field terms of a field query such as tag:roguelike; field terms are not spell corrected
+def normalize_field_query(field, text):
+    return analyzer.field_terms(field, text)
 
-    translator = str.maketrans('', '', string.punctuation)
-    filtered_tokens = [word.translate(translator) for word in tokens]
 
-    stop_words = set(stopwords.words('english'))
-    filtered_tokens = [word for word in filtered_tokens if word.lower() not in stop_words]
+# Doc ids (sorted array or bitmap) of an index term or of a range pseudo term such as "price<10"
+def term_documents(term):
+    return query_planner.index_postings(inverted_index, document_data, term)
 
-    stemmer = PorterStemmer()
 
-    # Separate sentences into words, stem them, and find closest matches
-    corrected_tokens = []
-    inverted_index_keys = list(inverted_index.keys())
+def term_frequency(term):
+    if parse_range_term(term) is None:
+        return inverted_index.doc_frequency(term)
+    return len(term_documents(term))
 
-    for token in filtered_tokens:
-        # Split token into words if it appears to be a sentence
-        words = token.split()
-        corrected_words = [
-            get_closest_matches(stemmer.stem(word.lower()), inverted_index_keys, cutoff=0.8)
-            for word in words
-        ]
-        corrected_tokens.append(" ".join(corrected_words))  # Rebuild corrected sentence
 
-    result = None
-    current_operation = 'and'
+# Parse and plan a query; plans are cached until the index is reloaded
+@lru_cache(maxsize=1024)
+def compile_query(query):
+    with metrics.timed(metrics.search_stages, 'parse'):
+        ast = parse_query(query)
+    with metrics.timed(metrics.search_stages, 'plan'):
+        return query_planner.plan_query(
+            ast,
+            normalize_query_term,
+            term_frequency,
+            len(inverted_index.documents),
+            normalize_field_query
+        )
 
-    for token in corrected_tokens:
-        print(token)
-        if token in {'and', 'or', 'not'}:
-            current_operation = token  # Update the current operation
-        else:
-            if token in inverted_index:
-                word_postings = inverted_index[token]["postings"]
-                word_set = set(map(int, word_postings.keys()))
-            else:
-                word_set = set()
 
-            if result is None:
-                result = word_set
-            elif current_operation == 'and':
-                result &= word_set
-            elif current_operation == 'or':
-                result |= word_set
-            elif current_operation == 'not':
-                result -= word_set
+# Match and rank a query. Returns SearchResults for the best `limit` matches (all of them
+# when limit is None), or {'error': ...}. `postings` fetches a term's doc set and
+# `scored_postings` its scored posting list (see batch_search).
+def ranked_search(query, limit=None, postings=None, scored_postings=None):
+    if not query.strip():
+        return rank_plan(query_planner.EMPTY)
 
-    if not result:
+    start = time.perf_counter()
+    try:
+        plan = compile_query(query)
+    except QuerySyntaxError as e:
+        return {'error': str(e)}
+
+    cached = result_cache.get(plan, index_generation, lambda ranked: covers(ranked, limit))
+    if cached is None:
+        depth = None if limit is None else max(limit, RESULT_CACHE_DEPTH)
+        cached = rank_plan(plan, depth, postings, scored_postings)
+        result_cache.put(plan, index_generation, cached)
+    metrics.search_stages.observe('search', time.perf_counter() - start)
+
+    if cached.total == 0:
         print("No results found for the query.")
-        return []
-
-    ranked_results = []
-    for doc_id in result:
-        doc_id_str = str(doc_id)
-        score = 0
-        cluster = 0
-        for token in corrected_tokens:
-            if token in inverted_index:
-                postings = inverted_index[token]["postings"]
-                posting_data = postings.get(doc_id_str, {})
-                score += posting_data.get("score", 0)
-                cluster = posting_data.get("cluster", -1)
-        ranked_results.append((doc_id, score, cluster))
-
-    ranked_results.sort(key=lambda x: -x[1])
-
-    # Add metadata and document path
-    return [
-        {
+    return SearchResults(cached.total, cached.doc_ids[:limit], cached.scores[:limit], cached.clusters[:limit])
+
+
+# Whether a cached ranking holds the best `limit` hits
+def covers(cached, limit):
+    return len(cached.doc_ids) == cached.total or (limit is not None and limit <= len(cached.doc_ids))
+
+
+# Match a plan and rank the best `limit` hits
+def rank_plan(plan, limit=None, postings=None, scored_postings=None):
+    postings = postings or term_documents
+    scored_postings = scored_postings or inverted_index.scored_postings
+    term_positions = inverted_index.term_positions if inverted_index.has_positions else None
+    with metrics.timed(metrics.search_stages, 'match'):
+        result = bitmaps.to_array(query_planner.execute(plan, postings, inverted_index.document_set(),
+                                                        term_positions))
+
+    if len(result) == 0:
+        return SearchResults(0, result, np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int16))
+
+    with metrics.timed(metrics.search_stages, 'scoring'):
+        term_postings = [scored_postings(term) for term in query_planner.scoring_terms(plan)]
+        doc_ids, scores = ranking.top_k(result, term_postings, limit)
+    return SearchResults(len(result), doc_ids, scores, inverted_index.clusters_of(doc_ids))
+
+
+# Add metadata and document path to the ranked hits in [start, end)
+def describe_results(results, start=0, end=None):
+    started = time.perf_counter()
+    described = []
+    for doc_id, score, cluster in zip(results.doc_ids[start:end].tolist(),
+                                      results.scores[start:end].tolist(),
+                                      results.clusters[start:end].tolist()):
+        document = document_data[doc_id]
+        described.append({
             'id': doc_id,
             'score': score,
             'cluster': cluster,
-            'original_name': document_data[doc_id].get('original_name', 'Unknown'),
-            'name': document_data[doc_id]['data'].get('Name', 'Unknown'),
-            'price': document_data[doc_id]['data'].get('Price', 'Unknown'),
-            'release_date': document_data[doc_id]['data'].get('Release_date', 'Unknown'),
-            'review_no': document_data[doc_id]['data'].get('Review_no', 'Unknown'),
-            'tags': document_data[doc_id]['data'].get('Tags', 'Unknown'),
-            'path': f"dataset/document/{document_data[doc_id]['sanitized_name']}",
-            'rec_path': f"{document_data[doc_id]['sanitized_name']}"
-        }
-        for doc_id, score, cluster in ranked_results
-    ]
+            'original_name': document.get('original_name', 'Unknown'),
+            'sanitized_name': document.get('sanitized_name', 'unknown'),
+            'name': document['data'].get('Name', 'Unknown'),
+            'price': document['data'].get('Price', 'Unknown'),
+            'release_date': document['data'].get('Release_date', 'Unknown'),
+            'review_no': document['data'].get('Review_no', 'Unknown'),
+            'tags': document['data'].get('Tags', 'Unknown'),
+            'path': f"dataset/document/{document['sanitized_name']}",
+            'rec_path': f"{document['sanitized_name']}"
+        })
+    metrics.search_stages.observe('metadata', time.perf_counter() - started)
+    return described
+
+
+# Run a batch of (query, limit) pairs through one pipeline; yields what ranked_search returns
+# for each, in order. Identical queries share their compiled plan and cached ranking, and
+# every term's doc set and scored postings are fetched once for the whole batch.
+def batch_search(requests):
+    doc_sets, scored = {}, {}
+
+    def shared_documents(term):
+        if term not in doc_sets:
+            doc_sets[term] = term_documents(term)
+        return doc_sets[term]
+
+    def shared_scored_postings(term):
+        if term not in scored:
+            scored[term] = inverted_index.scored_postings(term)
+        return scored[term]
+
+    generation = index_generation
+    for query, limit in requests:
+        # Postings fetched before an index refresh are stale
+        if index_generation != generation:
+            doc_sets.clear()
+            scored.clear()
+            generation = index_generation
+        yield ranked_search(query, limit, shared_documents, shared_scored_postings)
+
+
+def boolean_search(query, limit=None):
+    results = ranked_search(query, limit)
+    if isinstance(results, dict):
+        return results
+    return describe_results(results)
 
 
 # Initial data loading
-load_inverted_index("dataset/inverted_index_ai.json")
+if not SHARDED:
+    load_inverted_index("dataset/inverted_index_ai.json")
 load_document_data("dataset/document")
+if not SHARDED:
+    refresh_index()
+
+# Cache and index gauges for /metrics
+metrics.register_gauges('steam_result_cache', "Search result cache counters.", result_cache.stats)
+metrics.register_gauges('steam_plan_cache', "Compiled query plan cache counters.",
+                        lambda: compile_query.cache_info()._asdict())
+metrics.register_gauges('steam_analyzer', "Text analyzer counters.", analyzer.stats)
+metrics.register_gauges('steam_index', "Live index state.", lambda: {
+    'documents': len(inverted_index.documents),
+    'generation': index_generation,
+    'has_positions': int(inverted_index.has_positions),
+})
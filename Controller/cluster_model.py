@@ -0,0 +1,40 @@
+import os  # For checking whether a saved model exists.
+import numpy as np  # Centroids and feature scaling.
+from Controller.document_store import parse_price  # Same price parsing as the clustered catalog.
+
+
+# A saved clustering model (see kmeans_clustering.py): the tag vocabulary that defines the
+# feature columns, the per-column scale used before clustering, and the K-Means centroids.
+# New games are placed in the cluster of the nearest centroid without re-clustering.
+CLUSTER_MODEL_PATH = "dataset/cluster_model.npz"
+
+
+def save_cluster_model(file_path, tags, scale, centroids):
+    np.savez(file_path, tags=np.array(tags, dtype=str), scale=scale, centroids=centroids)
+    print(f"Cluster model saved to {file_path}.")
+
+
+def load_cluster_model(file_path=CLUSTER_MODEL_PATH):
+    if not os.path.exists(file_path):
+        return None
+    with np.load(file_path) as model:
+        return {
+            'tag_ids': {tag: i for i, tag in enumerate(model['tags'].tolist())},
+            'scale': model['scale'],
+            'centroids': model['centroids'],
+        }
+
+
+# Nearest-centroid cluster for each game, given its tag list and price string
+def assign_clusters(model, tag_lists, prices):
+    tag_ids = model['tag_ids']
+    features = np.zeros((len(tag_lists), len(tag_ids) + 1), dtype=np.float64)
+    for row, (tags, price) in enumerate(zip(tag_lists, prices)):
+        for tag in set(tags):
+            if tag in tag_ids:
+                features[row, tag_ids[tag]] = 1.0
+        features[row, -1] = np.nan_to_num(parse_price(price))
+    features /= model['scale']
+
+    distances = ((features[:, None, :] - model['centroids'][None, :, :]) ** 2).sum(axis=2)
+    return distances.argmin(axis=1)
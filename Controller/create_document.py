@@ -1,6 +1,16 @@
+import json  # For the packed JSON Lines export.
 import os  # For interacting with the filesystem, e.g., creating directories and writing files.
 import re  # For cleaning strings with regular expressions.
-import pandas as pd  # For reading and processing tabular data from CSV files.
+import numpy as np  # For the offsets index of the packed export.
+
+# Run from the repository root: python -m Controller.create_document [--format packed|files|both]
+
+csv_path = 'dataset/steam_uncleaned.csv'
+output_dir = 'dataset/document'
+packed_path = 'dataset/documents.jsonl'
+
+# Fields of a document, in the order they are written
+FIELDS = ('Name', 'Price', 'Release_date', 'Review_no', 'Review_type', 'Tags', 'Description')
 
 
 # Define the function to clean filenames
@@ -8,41 +18,137 @@ def clean_filename(name):
     return re.sub(r'[^\w\s-]', '', name).replace(" ", "_")
 
 
-# Load the CSV file and add unique IDs
-file_path = '../dataset/steam_uncleaned.csv'
-# file_path = 'dataset/steam_uncleaned.csv' #Khusus untuk william fi
-steam_data = pd.read_csv(file_path)
-steam_data['id'] = steam_data.index + 1  # Generate unique IDs starting from 1
-
-# Define the output directory
-output_dir = '../dataset/document'
-# output_dir = 'dataset/document' #Khusus untuk William FI
-os.makedirs(output_dir, exist_ok=True)
-
-# Create a document for each game with the specified structure
-for _, row in steam_data.iterrows():
-    title = row['Name']
-    price = row['Price'] if 'Price' in row else "N/A"
-    release_date = row['Release_date'] if 'Release_date' in row else "N/A"
-    review_no = row['Review_no'] if 'Review_no' in row else "N/A"
-    review_type = row['Review_type'] if 'Review_type' in row else "N/A"
-    tags = row['Tags'] if 'Tags' in row else "N/A"
-    description = row['Description']
-
-    doc_id = row['id']
-
-    # Clean the filename and create a full path
-    filename = f"{doc_id}_{clean_filename(title)}.txt"
-    file_path = os.path.join(output_dir, filename)
-
-    # Write the details to the file
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(f"Name: {title}\n")
-        f.write(f"Price: {price}\n")
-        f.write(f"Release_date: {release_date}\n")
-        f.write(f"Review_no: {review_no}\n")
-        f.write(f"Review_type: {review_type}\n")
-        f.write(f"Tags: {tags}\n")
-        f.write(f"Description: {description}\n")
-
-print("Documents created successfully!")
+# Text of one game (a dict with the CSV columns); the layout every document uses
+def document_text(record):
+    return "".join(f"{field}: {record.get(field, 'N/A')}\n" for field in FIELDS)
+
+
+# Text of the fields with their own posting lists (analyzer.FIELDS) in a document, skipping
+# missing values. The description runs to the end of the document.
+def document_fields(content):
+    fields = {}
+    lines = content.splitlines()
+    for i, line in enumerate(lines):
+        if line.startswith("Name:"):
+            fields['name'] = line[len("Name:"):].strip()
+        elif line.startswith("Tags:"):
+            fields['tag'] = line[len("Tags:"):].strip()
+        elif line.startswith("Description:"):
+            fields['description'] = "\n".join([line[len("Description:"):]] + lines[i + 1:]).strip()
+            break
+    return {field: text for field, text in fields.items() if text not in ('', 'nan', 'N/A')}
+
+
+# Text analyzed for the full-text terms of a document: its name and description. Tags, price,
+# dates and review counts are searched through their field terms and range filters only, so
+# their labels and values ("price", "tags", "99") stay out of the full-text vocabulary.
+def full_text(content):
+    fields = document_fields(content)
+    return "\n".join(fields[field] for field in ('name', 'description') if field in fields)
+
+
+# Ids, file names and texts of every game, computed column by column
+def prepare_documents(steam_data):
+    import pandas as pd  # For processing tabular data; only needed when generating documents.
+
+    documents = pd.DataFrame({'id': steam_data.index + 1})  # Generate unique IDs starting from 1
+
+    # Missing values are written as "nan", like str() of the value. Object columns keep the
+    # string ops on Python's re, whose \w also matches non-ASCII names.
+    columns = {
+        field: steam_data[field].astype(object).fillna("nan").astype(str).astype(object)
+        if field in steam_data else pd.Series("N/A", index=steam_data.index, dtype=object)
+        for field in FIELDS
+    }
+    content = pd.Series("", index=steam_data.index, dtype=object)
+    for field in FIELDS:
+        content = content + f"{field}: " + columns[field] + "\n"
+
+    names = columns['Name'].str.replace(r'[^\w\s-]', '', regex=True).str.replace(" ", "_", regex=False)
+    documents['original_name'] = documents['id'].astype(str) + "_" + names.values + ".txt"
+    documents['content'] = content.values
+    return documents
+
+
+# One .txt file per game (the original layout)
+def write_document_files(documents, output_dir=output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    for file_name, content in zip(documents['original_name'], documents['content']):
+        with open(os.path.join(output_dir, file_name), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+
+# Offsets index written next to a packed export: documents.jsonl -> documents.index.npz
+def packed_index_path(path):
+    return os.path.splitext(path)[0] + ".index.npz"
+
+
+# Every game as one JSON line {"id", "original_name", "content"}, plus an index with the
+# sorted doc ids and the byte offset of every line so single games can be read directly
+def write_packed_documents(documents, path=packed_path):
+    doc_ids = documents['id'].to_numpy(dtype=np.int64)
+    offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+    with open(path, 'wb') as f:
+        for i, (doc_id, file_name, content) in enumerate(
+                zip(doc_ids.tolist(), documents['original_name'], documents['content'])):
+            line = json.dumps({'id': doc_id, 'original_name': file_name, 'content': content}, ensure_ascii=False)
+            f.write(line.encode('utf-8') + b"\n")
+            offsets[i + 1] = f.tell()
+    order = np.argsort(doc_ids, kind='stable')
+    np.savez(packed_index_path(path), doc_ids=doc_ids[order], starts=offsets[:-1][order], ends=offsets[1:][order])
+
+
+# Stream the games of a packed export as dicts, in file order
+def iter_packed_documents(path=packed_path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class PackedDocuments:
+    """Random access to single games of a packed export through its offsets index."""
+
+    def __init__(self, path=packed_path):
+        self.path = path
+        with np.load(packed_index_path(path)) as index:
+            self.doc_ids, self.starts, self.ends = index['doc_ids'], index['starts'], index['ends']
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def get(self, doc_id):
+        row = int(np.searchsorted(self.doc_ids, doc_id))
+        if row == len(self.doc_ids) or self.doc_ids[row] != doc_id:
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek(int(self.starts[row]))
+            return json.loads(f.read(int(self.ends[row] - self.starts[row])).decode('utf-8'))
+
+
+def main(csv_path=csv_path, output_format='packed', output_dir=output_dir, packed_path=packed_path):
+    import pandas as pd  # For reading tabular data from CSV files.
+
+    # Load the CSV file and build every document at once
+    steam_data = pd.read_csv(csv_path)
+    documents = prepare_documents(steam_data)
+
+    if output_format in ('packed', 'both'):
+        write_packed_documents(documents, packed_path)
+        print(f"Packed {len(documents)} documents into {packed_path}.")
+    if output_format in ('files', 'both'):
+        write_document_files(documents, output_dir)
+        print("Documents created successfully!")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create the game documents from the Steam CSV.")
+    parser.add_argument('--csv', default=csv_path)
+    parser.add_argument('--format', choices=['packed', 'files', 'both'], default='packed',
+                        help="packed: one JSON Lines file with an offsets index; files: one .txt per game")
+    parser.add_argument('--output-dir', default=output_dir)
+    parser.add_argument('--packed-path', default=packed_path)
+    args = parser.parse_args()
+    main(args.csv, args.format, args.output_dir, args.packed_path)
@@ -0,0 +1,343 @@
+import json  # For the store metadata file.
+import operator  # Comparisons of range filters on documents outside the store.
+import os  # For building paths inside the store directory.
+import re  # For cleaning file names and parsing prices and review counts.
+from collections.abc import MutableMapping  # document_data keeps its dict interface.
+import numpy as np  # Typed columns, the string heap and memory mapping.
+from Controller import generations  # Rebuilds are published as new generations.
+
+
+# Layout of a store directory written by `build_document_store` from steam_uncleaned.csv:
+#   meta.json           format version, document count, string fields and the tag vocabulary
+#   doc_ids.npy         int32 sorted doc ids (CSV row + 1, like the files in dataset/document)
+#   price.npy           float64 price in dollars, 0 for free games, nan when unknown
+#   release_date.npy    datetime64[D] release date, NaT when unknown
+#   review_no.npy       int64 number of user reviews, -1 when unknown
+#   tag_offsets.npy     int64 start of every document's tags in tag_ids, plus the end sentinel
+#   tag_ids.npy         int32 positions in the tag vocabulary, in the order the CSV lists them
+#   strings.npy         uint8 UTF-8 heap holding every string field
+#   string_offsets.npy  int64 (string field x document count + 1) start of each string in the heap
+#
+# Rebuilding a directory that already holds a store writes a new generation next to the files
+# servers have memory mapped and publishes it atomically (generations.py).
+DOCUMENT_STORE_DIR = "dataset/document_store"
+CSV_PATH = "dataset/steam_uncleaned.csv"
+FORMAT_VERSION = 1
+ARRAY_FILES = ('doc_ids', 'price', 'release_date', 'review_no', 'tag_offsets', 'tag_ids', 'strings', 'string_offsets')
+STRING_FIELDS = ('name', 'price', 'release_date', 'review_no', 'review_type', 'description',
+                 'original_name', 'sanitized_name')
+
+
+def clean_filename(name):
+    return re.sub(r'[^\w\s-]', '', name).replace(" ", "_")
+
+
+def sanitize_filename(filename):
+    return re.sub(r'[^\w\s\.-]', '', filename)
+
+
+# "$59.99" -> 59.99, "Free To Play" -> 0.0, anything else (e.g. "Prepurchase") -> nan
+def parse_price(text):
+    text = str(text).strip()
+    match = re.search(r'\d[\d,]*(\.\d+)?', text)
+    if match:
+        return float(match.group().replace(",", ""))
+    return 0.0 if text.lower().startswith("free") else float('nan')
+
+
+# " 574,097 User Reviews " -> 574097, -1 when there is no number
+def parse_review_no(text):
+    match = re.search(r'\d[\d,]*', str(text))
+    return int(match.group().replace(",", "")) if match else -1
+
+
+# Numeric doc values range filters work on (query_parser.RANGE_FIELDS)
+NUMERIC_FIELDS = ('price', 'reviews', 'year')
+COMPARISONS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge, '=': operator.eq}
+
+
+# Numeric value of a field in a document_data 'data' dict, nan when unknown
+def document_numeric_value(data, field):
+    if field == 'price':
+        return parse_price(data.get('Price', 'Unknown'))
+    if field == 'reviews':
+        review_no = parse_review_no(data.get('Review_no', 'Unknown'))
+        return float(review_no) if review_no >= 0 else float('nan')
+    match = re.search(r'\b(\d{4})\b', str(data.get('Release_date', '')))
+    return float(match.group(1)) if match else float('nan')
+
+
+def build_document_store(csv_path=CSV_PATH, store_dir=DOCUMENT_STORE_DIR):
+    import pandas as pd  # Only needed to build the store.
+
+    steam_data = pd.read_csv(csv_path)
+    count = len(steam_data)
+
+    # Display text of every field, 'Unknown' where the CSV has no value
+    text = {
+        column: [str(value).strip() if pd.notna(value) else 'Unknown' for value in steam_data[column]]
+        for column in ('Name', 'Price', 'Release_date', 'Review_no', 'Review_type', 'Description')
+    }
+    doc_ids = np.arange(1, count + 1, dtype=np.int32)
+    original_names = [f"{doc_id}_{clean_filename(str(name))}.txt" for doc_id, name in zip(doc_ids.tolist(), steam_data['Name'])]
+
+    # Tags as ids into a vocabulary in order of first appearance
+    vocabulary = {}
+    tag_offsets = np.zeros(count + 1, dtype=np.int64)
+    tag_ids = []
+    for row, tags in enumerate(steam_data['Tags']):
+        if pd.notna(tags):
+            tag_ids.extend(vocabulary.setdefault(tag, len(vocabulary)) for tag in str(tags).strip().split(","))
+        tag_offsets[row + 1] = len(tag_ids)
+
+    columns = {
+        'name': text['Name'],
+        'price': text['Price'],
+        'release_date': text['Release_date'],
+        'review_no': text['Review_no'],
+        'review_type': text['Review_type'],
+        'description': text['Description'],
+        'original_name': original_names,
+        'sanitized_name': [sanitize_filename(name) for name in original_names],
+    }
+    encoded = [value.encode('utf-8') for field in STRING_FIELDS for value in columns[field]]
+    lengths = np.array([len(value) for value in encoded], dtype=np.int64).reshape(len(STRING_FIELDS), count)
+    string_offsets = np.zeros((len(STRING_FIELDS), count + 1), dtype=np.int64)
+    string_offsets[:, 1:] = np.cumsum(lengths, axis=None).reshape(len(STRING_FIELDS), count)
+    string_offsets[1:, 0] = string_offsets[:-1, -1]
+
+    arrays = {
+        'doc_ids': doc_ids,
+        'price': steam_data['Price'].map(parse_price, na_action='ignore').to_numpy(dtype=np.float64, na_value=np.nan),
+        'release_date': pd.to_datetime(steam_data['Release_date'], format='%b %d, %Y', errors='coerce')
+                          .to_numpy(dtype='datetime64[D]'),
+        'review_no': steam_data['Review_no'].map(parse_review_no, na_action='ignore').fillna(-1).to_numpy(dtype=np.int64),
+        'tag_offsets': tag_offsets,
+        'tag_ids': np.array(tag_ids, dtype=np.int32),
+        'strings': np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        'string_offsets': string_offsets,
+    }
+
+    staging_dir = generations.staging_directory(store_dir)
+    for name in ARRAY_FILES:
+        np.save(os.path.join(staging_dir, f"{name}.npy"), arrays[name])
+    # Written last: a store directory without meta.json is incomplete
+    meta = {'version': FORMAT_VERSION, 'count': count, 'string_fields': list(STRING_FIELDS), 'tags': list(vocabulary)}
+    with open(os.path.join(staging_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    generations.publish(staging_dir, store_dir, {f"{name}.npy" for name in ARRAY_FILES} | {'meta.json'})
+    print(f"Document store with {count} games written to {store_dir}.")
+    return DocumentStore(meta, arrays, store_generation(store_dir))
+
+
+class DocumentStore:
+    """Typed columns of every game, looked up by doc id."""
+
+    def __init__(self, meta, arrays, generation='.'):
+        self.generation = generation
+        self.tags = meta['tags']
+        self.tag_index = {tag: i for i, tag in enumerate(self.tags)}
+        self.fields = {field: i for i, field in enumerate(meta['string_fields'])}
+        for name in ARRAY_FILES:
+            setattr(self, name, arrays[name])
+        self.sorted_columns = {}
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def __contains__(self, doc_id):
+        return self.row(doc_id) is not None
+
+    # Row of a doc id, or None
+    def row(self, doc_id):
+        row = int(np.searchsorted(self.doc_ids, doc_id))
+        if row < len(self.doc_ids) and self.doc_ids[row] == doc_id:
+            return row
+        return None
+
+    def string(self, field, row):
+        offsets = self.string_offsets[self.fields[field]]
+        return bytes(self.strings[offsets[row]:offsets[row + 1]]).decode('utf-8')
+
+    def tag_list(self, row):
+        return [self.tags[i] for i in self.tag_ids[self.tag_offsets[row]:self.tag_offsets[row + 1]].tolist()]
+
+    # Values of a numeric field (NUMERIC_FIELDS) by row, nan when unknown
+    def numeric_column(self, field):
+        if field == 'price':
+            return np.asarray(self.price, dtype=np.float64)
+        if field == 'reviews':
+            reviews = np.asarray(self.review_no, dtype=np.float64)
+            return np.where(reviews >= 0, reviews, np.nan)
+        if field == 'year':
+            dates = np.asarray(self.release_date)
+            years = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+            return np.where(np.isnat(dates), np.nan, years.astype(np.float64))
+        raise KeyError(field)
+
+    # (known values sorted, their rows), built on first use
+    def sorted_column(self, field):
+        if field not in self.sorted_columns:
+            values = self.numeric_column(field)
+            rows = np.flatnonzero(~np.isnan(values))
+            order = np.argsort(values[rows], kind='stable')
+            self.sorted_columns[field] = (values[rows][order], rows[order])
+        return self.sorted_columns[field]
+
+    # Sorted rows whose `field` value compares true with `value` (op in COMPARISONS)
+    def range_rows(self, field, op, value):
+        values, rows = self.sorted_column(field)
+        start, end = 0, len(values)
+        if op in ('<', '<='):
+            end = np.searchsorted(values, value, side='left' if op == '<' else 'right')
+        elif op in ('>', '>='):
+            start = np.searchsorted(values, value, side='right' if op == '>' else 'left')
+        else:
+            start, end = np.searchsorted(values, value, side='left'), np.searchsorted(values, value, side='right')
+        return np.sort(rows[start:end])
+
+    # The document_data entry of a game, like booleanQuerySteam.load_document_data used to build it
+    def document(self, row):
+        return {
+            'original_name': self.string('original_name', row),
+            'sanitized_name': self.string('sanitized_name', row),
+            'data': {
+                'Name': self.string('name', row),
+                'Price': self.string('price', row),
+                'Release_date': self.string('release_date', row),
+                'Review_no': self.string('review_no', row),
+                'Tags': self.tag_list(row),
+            }
+        }
+
+    # Every text field of a game, for the game details page
+    def details(self, row):
+        return {
+            'name': self.string('name', row),
+            'price': self.string('price', row),
+            'release_date': self.string('release_date', row),
+            'review_no': self.string('review_no', row),
+            'review_type': self.string('review_type', row),
+            'tags': ",".join(self.tag_list(row)),
+            'description': self.string('description', row),
+        }
+
+
+# Load a store directory; arrays are memory mapped so workers share the page cache
+def load_document_store(store_dir=DOCUMENT_STORE_DIR, mmap=True):
+    # Resolved once so every file comes from the same generation
+    path = generations.current_path(store_dir)
+    with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported document store version {meta.get('version')} in {store_dir}.")
+    mmap_mode = 'r' if mmap else None
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in ARRAY_FILES}
+    return DocumentStore(meta, arrays, os.path.relpath(path, store_dir))
+
+
+def document_store_exists(store_dir=DOCUMENT_STORE_DIR):
+    return generations.is_complete(store_dir)
+
+
+# Published generation of a store directory ('.' for a store written in place)
+def store_generation(store_dir=DOCUMENT_STORE_DIR):
+    return os.path.relpath(generations.current_path(store_dir), store_dir)
+
+
+class DocumentData(MutableMapping):
+    """doc id -> {'original_name', 'sanitized_name', 'data'} over a document store.
+
+    Entries are built from the store's columns when looked up. Games set afterwards
+    (added through index segments, or read from dataset/document when there is no
+    store) live in an overlay dict, and deleted store games are hidden. Overlay
+    entries carry their game details page fields under 'details'.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self.overlay = {}
+        self.removed = set()
+
+    def _store_row(self, doc_id):
+        if self.store is None or doc_id in self.removed or not isinstance(doc_id, (int, np.integer)):
+            return None
+        return self.store.row(doc_id)
+
+    def __getitem__(self, doc_id):
+        if doc_id in self.overlay:
+            return self.overlay[doc_id]
+        row = self._store_row(doc_id)
+        if row is None:
+            raise KeyError(doc_id)
+        return self.store.document(row)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.overlay or self._store_row(doc_id) is not None
+
+    def __setitem__(self, doc_id, document):
+        self.overlay[doc_id] = document
+
+    def __delitem__(self, doc_id):
+        found = self.overlay.pop(doc_id, None) is not None
+        if self._store_row(doc_id) is not None:
+            self.removed.add(doc_id)
+            found = True
+        if not found:
+            raise KeyError(doc_id)
+
+    def __iter__(self):
+        if self.store is not None:
+            for doc_id in self.store.doc_ids.tolist():
+                if doc_id not in self.overlay and doc_id not in self.removed:
+                    yield doc_id
+        yield from self.overlay
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    # Every text field of a game for the game details page, or None
+    def details(self, doc_id):
+        if doc_id in self.overlay:
+            return self.overlay[doc_id].get('details')
+        row = self._store_row(doc_id)
+        return self.store.details(row) if row is not None else None
+
+    # Sorted doc ids whose numeric `field` compares true with `value`, e.g. ('price', '<', 10)
+    def range_doc_ids(self, field, op, value):
+        parts = []
+        if self.store is not None:
+            doc_ids = self.store.doc_ids[self.store.range_rows(field, op, value)]
+            hidden = self.removed.union(self.overlay)
+            if hidden:
+                doc_ids = doc_ids[~np.isin(doc_ids, list(hidden))]
+            parts.append(doc_ids)
+        compare = COMPARISONS[op]
+        parts.append(np.array([doc_id for doc_id, document in self.overlay.items()
+                               if compare(document_numeric_value(document['data'], field), value)], dtype=np.int64))
+        return np.unique(np.concatenate(parts)).astype(np.int32)
+
+    # (doc id, name, review count or -1) of every game, for name suggestions
+    def name_entries(self):
+        entries = []
+        if self.store is not None:
+            hidden = self.removed.union(self.overlay)
+            review_no = np.asarray(self.store.review_no).tolist()
+            for row, doc_id in enumerate(self.store.doc_ids.tolist()):
+                if doc_id not in hidden:
+                    entries.append((doc_id, self.store.string('name', row), review_no[row]))
+        for doc_id, document in self.overlay.items():
+            entries.append((doc_id, document['data'].get('Name', 'Unknown'),
+                            parse_review_no(document['data'].get('Review_no', 'Unknown'))))
+        return entries
+
+
+# python -m Controller.document_store [csv] [output dir]
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the columnar document store from the games CSV.")
+    parser.add_argument('csv_path', nargs='?', default=CSV_PATH)
+    parser.add_argument('store_dir', nargs='?', default=DOCUMENT_STORE_DIR)
+    args = parser.parse_args()
+    build_document_store(args.csv_path, args.store_dir)
@@ -0,0 +1,61 @@
+import json  # For the current.json pointer.
+import os  # For generation directories and the atomic pointer swap.
+import shutil  # For removing generations no reader can still be loading.
+
+# Data directories rebuilt while servers have their files memory mapped (binary_index.py,
+# document_store.py). Rebuilding a directory that is already complete never touches the files
+# readers map: the new data is written to a gen_NNNNNN subdirectory and published by atomically
+# replacing current.json ({"directory": "gen_NNNNNN"}), like the segments manifest. The
+# previous generation is kept until the next rebuild so a reader that resolved it just before
+# the swap can finish loading; open memory maps survive the files being removed.
+#
+# A directory is complete once its meta.json exists (both formats write it last).
+CURRENT_FILE = 'current.json'
+META_FILE = 'meta.json'
+
+
+# Directory the files of `directory` are read from: its published generation, or the directory
+# itself for data written in place
+def current_path(directory):
+    pointer = os.path.join(directory, CURRENT_FILE)
+    if not os.path.exists(pointer):
+        return directory
+    with open(pointer, 'r', encoding='utf-8') as f:
+        return os.path.join(directory, json.load(f)['directory'])
+
+
+def is_complete(directory):
+    return os.path.exists(os.path.join(current_path(directory), META_FILE))
+
+
+# Where new data for `directory` is written: the directory itself while it holds nothing
+# complete (nothing can be reading it), otherwise a fresh generation subdirectory
+def staging_directory(directory):
+    if not is_complete(directory):
+        os.makedirs(directory, exist_ok=True)
+        return directory
+    numbers = [int(name[4:]) for name in os.listdir(directory) if name.startswith('gen_') and name[4:].isdigit()]
+    staging_dir = os.path.join(directory, f"gen_{max(numbers, default=0) + 1:06d}")
+    os.makedirs(staging_dir)
+    return staging_dir
+
+
+# Make the generation in `staging_dir` the one readers of `directory` load. `files` are the
+# names written in place by the format, removed once a generation has replaced them.
+def publish(staging_dir, directory, files):
+    if os.path.abspath(staging_dir) == os.path.abspath(directory):
+        return
+    previous = os.path.relpath(current_path(directory), directory)
+    current = os.path.basename(staging_dir)
+    pointer = os.path.join(directory, CURRENT_FILE)
+    with open(pointer + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'directory': current}, f)
+    os.replace(pointer + '.tmp', pointer)
+
+    # Keep the generation just replaced; older ones can't be loading any more
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith('gen_') and name not in (current, previous):
+            shutil.rmtree(path, ignore_errors=True)
+        elif name in files and previous != '.':
+            os.remove(path)
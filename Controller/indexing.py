@@ -2,104 +2,189 @@ import os  # For interacting with the filesystem.
 import re  # For pattern matching and extracting text using regular expressions.
 import json  # For saving the inverted index as a JSON file.
 import math  # For mathematical calculations like logarithm.
-import string  # For removing punctuation from text.
+import time  # For reporting indexing throughput.
 from collections import defaultdict  # For creating dictionaries with default values.
-from nltk.corpus import stopwords  # For filtering out common stop words.
-from nltk.stem import PorterStemmer  # For stemming words to their root forms.
+from functools import partial  # For passing options to the worker processes.
+from multiprocessing import Pool  # For tokenizing shards of the document directory in parallel.
+from Controller.analyzer import analyzer  # Tokenizing, stop words and cached stemming shared with the query path.
+from Controller.create_document import document_fields, full_text, iter_packed_documents, packed_path  # Game documents.
+from Controller.document_store import parse_review_no  # Review counts like " 574,097 User Reviews ".
+from Controller.positions import positions_to_text  # Delta/varint position lists.
 
-# Initialize the Porter Stemmer for stemming words
-stemmer = PorterStemmer()
+# Run from the repository root: python -m Controller.indexing
 
-# Define the directory containing the documents
-input_dir = '../dataset/document'
-
-
-# input_dir = 'dataset/document' #Khusus Untuk William FI
+# Define the documents to index: the packed export when it exists, else one file per game
+input_dir = 'dataset/document'
+output_path = 'dataset/inverted_index.json'
 
 
 # Function to tokenize, remove punctuation, and stem words
 def process_text(text):
-    # Tokenize the text into words
-    tokens = re.findall(r'\b\w+\b', text.lower())
-
-    # Remove punctuation
-    translator = str.maketrans('', '', string.punctuation)
-    tokens = [word.translate(translator) for word in tokens]
-
-    # Remove stop words
-    stop_words = set(stopwords.words('english'))
-    filtered_tokens = [word for word in tokens if word not in stop_words]
-
-    # Stem the filtered words
-    return [stemmer.stem(word) for word in filtered_tokens]
+    return analyzer.analyze(text)
 
 
 # Helper function to extract Review_no from document content
 def extract_review_no(content):
-    match = re.search(r'Review_no: (\d+)', content)
-    return int(match.group(1)) if match else 1  # Default to 1 if not found
-
-
-# Dictionary to hold term frequencies, document lengths, and review numbers
-doc_term_freq = defaultdict(lambda: defaultdict(int))
-doc_lengths = defaultdict(int)
-review_numbers = {}  # Store Review_no for each document
-document_count = 0
-
-# Process each document to populate term frequencies
-for filename in os.listdir(input_dir):
-    if filename.endswith('.txt'):
-        # Extract the document ID from the filename
-        doc_id = int(filename.split('_')[0])
-
-        # Read the document content
-        file_path = os.path.join(input_dir, filename)
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-
-        # Extract Review_no for document rank
-        review_no = extract_review_no(content)
-        review_numbers[doc_id] = review_no
-
-        # Tokenize, stop word, and stem the content
-        tokens = process_text(content)
-        document_count += 1
-
-        # Calculate term frequencies and document length
-        for token in tokens:
-            doc_term_freq[doc_id][token] += 1
-            doc_lengths[doc_id] += 1
-
-# Calculate IDF for each term
-term_document_count = defaultdict(int)
-for doc_id, terms in doc_term_freq.items():
-    for term in terms.keys():
-        term_document_count[term] += 1
-
-idf = {term: math.log(document_count / (1 + term_document_count[term])) for term in term_document_count}
-
-# Build the inverted index with the desired structure
-inverted_index = {}
-for term, idf_value in idf.items():
-    postings = {}
-    semantic_terms = {}
-
+    match = re.search(r'Review_no:(.*)', content)
+    review_no = parse_review_no(match.group(1)) if match else -1
+    return review_no if review_no >= 0 else 1  # Default to 1 if not found
+
+
+# Tokenize (doc_id, content) records. Returns, in record order, (doc_id, review_no, term counts,
+# field term tfs, term positions) per document; term counts (of the name and description, see
+# create_document.full_text) keep first-occurrence order so the merged index is deterministic.
+# Term positions ({term: [word offsets]}) are None unless `positions` is set.
+def index_records(records, positions=False):
+    records = list(records)
+    texts = (full_text(content) for _, content in records)
+    analyzed = [analyzer.analyze_positions(text) for text in texts] if positions else analyzer.analyze_many(texts)
+    shard = []
+    for (doc_id, content), tokens in zip(records, analyzed):
+        term_positions = None
+        if positions:
+            term_positions = defaultdict(list)
+            for token, position in tokens:
+                term_positions[token].append(position)
+            term_positions = dict(term_positions)
+            term_counts = {term: len(offsets) for term, offsets in term_positions.items()}
+        else:
+            term_counts = defaultdict(int)
+            for token in tokens:
+                term_counts[token] += 1
+        field_tfs = analyzer.analyze_fields(document_fields(content))
+        shard.append((doc_id, extract_review_no(content), dict(term_counts), field_tfs, term_positions))
+    return shard
+
+
+# Tokenize one shard of document files
+def index_shard(file_paths, positions=False):
+    return index_records((read_document_file(file_path) for file_path in file_paths), positions)
+
+
+def read_document_file(file_path):
+    # Extract the document ID from the filename
+    doc_id = int(os.path.basename(file_path).split('_')[0])
+
+    # Read the document content
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return doc_id, f.read()
+
+
+# Merge tokenized documents (in input order) into the inverted index in one pass over the postings
+def merge_shards(shards):
+    doc_term_freq = {}
+    doc_field_tfs = {}  # tf of every field term, already relative to its field's length
+    doc_positions = {}  # word offsets of every term, when the shards recorded them
+    review_numbers = {}  # Store Review_no for each document
+    document_count = 0
+
+    for shard in shards:
+        for doc_id, review_no, term_counts, field_tfs, term_positions in shard:
+            review_numbers[doc_id] = review_no
+            document_count += 1
+            if field_tfs:
+                doc_field_tfs.setdefault(doc_id, {}).update(field_tfs)
+            if term_positions:
+                merged_positions = doc_positions.setdefault(doc_id, {})
+                for term, offsets in term_positions.items():
+                    merged_positions[term] = sorted(merged_positions.get(term, []) + offsets)
+            if not term_counts:
+                continue
+            merged = doc_term_freq.setdefault(doc_id, {})
+            for term, count in term_counts.items():
+                merged[term] = merged.get(term, 0) + count
+
+    # Calculate IDF for each term
+    term_document_count = defaultdict(int)
+    for terms in doc_term_freq.values():
+        for term in terms.keys():
+            term_document_count[term] += 1
+    for field_tfs in doc_field_tfs.values():
+        for term in field_tfs:
+            term_document_count[term] += 1
+
+    idf = {term: math.log(document_count / (1 + term_document_count[term])) for term in term_document_count}
+
+    # Build the inverted index with the desired structure
+    postings = {term: {} for term in idf}
     for doc_id, terms in doc_term_freq.items():
-        if term in terms:
-            tf = doc_term_freq[doc_id][term] / doc_lengths[doc_id]
-            tfidf = tf * idf_value
-            postings[str(doc_id)] = tfidf
-
-    inverted_index[term] = {
-        "idf": idf_value,
-        "postings": postings,
-        "semantic_terms": semantic_terms,  # Add semantic terms to index
+        doc_length = sum(terms.values())
+        for term, count in terms.items():
+            tf = count / doc_length
+            postings[term][str(doc_id)] = tf * idf[term]
+    for doc_id, field_tfs in doc_field_tfs.items():
+        for term, tf in field_tfs.items():
+            postings[term][str(doc_id)] = tf * idf[term]
+
+    inverted_index = {
+        term: {
+            "idf": idf_value,
+            "postings": postings[term],
+            "semantic_terms": {},  # Add semantic terms to index
+        }
+        for term, idf_value in idf.items()
     }
 
-# Save the inverted index to a JSON file
-output_path = '../dataset/inverted_index.json'
-# output_path = 'dataset/inverted_index.json' #Khusus Untuk William FI
-with open(output_path, 'w', encoding='utf-8') as f:
-    json.dump(inverted_index, f, indent=4)
-
-print("inverted index created successfully!")
+    # Encoded position lists (see positions.py) next to the postings of every full-text term
+    for doc_id, term_positions in doc_positions.items():
+        for term, offsets in term_positions.items():
+            inverted_index[term].setdefault("positions", {})[str(doc_id)] = positions_to_text(offsets)
+    return inverted_index, document_count
+
+
+# Split the input into contiguous shards, keeping its order
+def shard_files(file_paths, shard_count):
+    shard_size = max(1, math.ceil(len(file_paths) / shard_count))
+    return [file_paths[i:i + shard_size] for i in range(0, len(file_paths), shard_size)]
+
+
+# `input_path` is a packed .jsonl export or a directory of .txt files
+def build_index(input_path=None, output_path=output_path, workers=None, positions=False):
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    if input_path is None:
+        input_path = packed_path if os.path.exists(packed_path) else input_dir
+
+    if input_path.endswith('.jsonl'):
+        records = [(document['id'], document['content']) for document in iter_packed_documents(input_path)]
+        index_fn = partial(index_records, positions=positions)
+    else:
+        records = [
+            os.path.join(input_path, filename)
+            for filename in os.listdir(input_path)
+            if filename.endswith('.txt')
+        ]
+        index_fn = partial(index_shard, positions=positions)
+
+    if workers == 1:
+        shards = [index_fn(records)]
+    else:
+        # Several shards per worker keep the pool busy when shards finish unevenly
+        with Pool(workers) as pool:
+            shards = pool.map(index_fn, shard_files(records, workers * 4))
+
+    inverted_index, document_count = merge_shards(shards)
+
+    # Save the inverted index to a JSON file
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(inverted_index, f, indent=4)
+
+    elapsed = time.perf_counter() - start
+    print(f"Indexed {document_count} documents in {elapsed:.1f}s "
+          f"({document_count / elapsed if elapsed else 0:.0f} docs/sec) with {workers} worker(s).")
+    print("inverted index created successfully!")
+    return inverted_index
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the TF-IDF inverted index from the game documents.")
+    parser.add_argument('--input', default=None,
+                        help=f"packed .jsonl export or directory of .txt files (default: {packed_path} if present, else {input_dir})")
+    parser.add_argument('--output', default=output_path)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--positions', action='store_true',
+                        help="record term positions for phrase and NEAR queries (delta/varint encoded)")
+    args = parser.parse_args()
+    build_index(args.input, args.output, args.workers, args.positions)
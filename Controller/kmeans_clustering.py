@@ -1,9 +1,14 @@
 import json  # For modifying the inverted index.
 import os  # Handle file reading, writing, and path operations.
-import re  # Perform regular expression-based string manipulation.
 import numpy as np  # Work with numerical data.
-from sklearn.cluster import KMeans  # Apply K-Means clustering.
+from scipy import sparse  # Sparse doc x tag feature matrix.
+from sklearn.cluster import KMeans, MiniBatchKMeans  # Apply (mini-batch) K-Means clustering.
 from sklearn.preprocessing import StandardScaler  # Normalize features before clustering.
+from Controller.binary_index import write_binary_index  # Save the compact postings format loaded by the app.
+from Controller.cluster_model import CLUSTER_MODEL_PATH, save_cluster_model  # Centroids for clustering new games later.
+from Controller.document_store import load_document_store  # Typed tags and prices of every game.
+
+# Run from the repository root: python -m Controller.kmeans_clustering
 
 
 # Load the inverted index
@@ -20,104 +25,59 @@ def load_inverted_index(file_path):
         print(f"Error: File {file_path} not found.")
 
 
-def sanitize_filename(filename):
-    return re.sub(r'[^\w\s\.-]', '', filename)  # Removes invalid characters
-
-
-def load_document_data(directory_path):
-    global document_data
-    if os.path.exists(directory_path):
-        for filename in os.listdir(directory_path):
-            if filename.endswith(".txt"):
-                match = re.match(r"(\d+)_", filename)
-                if match:
-                    doc_id = int(match.group(1))
-                    sanitized_name = sanitize_filename(filename)
-                    file_path = os.path.join(directory_path, filename)
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        document_data[doc_id] = {
-                            'original_name': filename,
-                            'sanitized_name': sanitized_name,
-                            'data': parse_document_content(content)
-                        }
-        print("Document data loaded successfully.")
-    else:
-        print(f"Error: Directory {directory_path} not found.")
-
-
-def parse_document_content(content):
-    data = {}
-    for line in content.splitlines():
-        line = line.strip()
-        if "Name:" in line:
-            data['Name'] = line.split("Name:", 1)[1].strip()
-        elif "Price:" in line:
-            data['Price'] = line.split("Price:", 1)[1].strip()
-        elif "Release_date:" in line:
-            data['Release_date'] = line.split("Release_date:", 1)[1].strip()
-        elif "Review_no:" in line:
-            data['Review_no'] = line.split("Review_no:", 1)[1].strip()
-        elif "Tags:" in line:
-            data['Tags'] = line.split("Tags:", 1)[1].strip().split(",")
-
-    data.setdefault('Name', 'Unknown')
-    data.setdefault('Price', 'Unknown')
-    data.setdefault('Release_date', 'Unknown')
-    data.setdefault('Review_no', 'Unknown')
-    data.setdefault('Tags', [])
-
-    return data
-
-
 # Initialize global variables
 inverted_index = {}
-document_data = {}
-load_inverted_index("../dataset/inverted_index_ai.json")
-load_document_data("../dataset/document")
-
-
-def extract_numeric_value(input_string):
-    match = re.search(r'\d+', input_string)
-    return float(match.group()) if match else 0.0
+load_inverted_index("dataset/inverted_index_ai.json")
+document_store = load_document_store()
 
 
+# One row per game: a binary column per tag in the catalog's tag vocabulary, plus the price.
+# The store already holds every game's tags as vocabulary ids, so the CSR arrays come straight
+# from its columns; memory grows with the number of (game, tag) pairs, not games x vocabulary.
 def prepare_features():
-    features = []
-    game_ids = []
-
-    for doc_id, data in document_data.items():
-        tags = data['data']['Tags']
-        price = extract_numeric_value(data['data']['Price']) if data['data']['Price'] != 'Unknown' else 0
-
-        tag_vector = [1 if tag in tags else 0 for tag in inverted_index.keys()]
-        features.append(tag_vector + [price])
-        game_ids.append(doc_id)
-
-    return np.array(features), game_ids
-
-
-def perform_clustering(features, game_ids, n_clusters):
-    scaler = StandardScaler()
+    tag_offsets = np.asarray(document_store.tag_offsets)
+    rows = np.repeat(np.arange(len(document_store)), np.diff(tag_offsets))
+    tag_matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float64), (rows, np.asarray(document_store.tag_ids))),
+        shape=(len(document_store), len(document_store.tags))
+    )
+    tag_matrix.data[:] = 1.0  # a tag listed twice still counts once
+
+    # Unknown prices count as 0, like free games
+    prices = np.nan_to_num(np.asarray(document_store.price, dtype=np.float64))
+    price_column = sparse.csr_matrix(prices.reshape(-1, 1))
+    game_ids = np.asarray(document_store.doc_ids).tolist()
+    return sparse.hstack([tag_matrix, price_column], format='csr'), game_ids, list(document_store.tags)
+
+
+# `method` is 'kmeans' (full batch) or 'minibatch' (MiniBatchKMeans, streams `batch_size` rows at a time)
+def perform_clustering(features, game_ids, n_clusters, method='kmeans', batch_size=4096):
+    # Scale to unit variance without centering, which would make the matrix dense
+    scaler = StandardScaler(with_mean=False)
     features_scaled = scaler.fit_transform(features)
 
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
+    if method == 'minibatch':
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, batch_size=batch_size, n_init=3)
+    else:
+        kmeans = KMeans(n_clusters=n_clusters, random_state=42)
     clusters = kmeans.fit_predict(features_scaled)
 
-    for idx, doc_id in enumerate(game_ids):
-        document_data[doc_id]['cluster'] = clusters[idx]
-
-    return clusters
+    # The scale and centroids are kept so new games can be assigned without re-clustering
+    return clusters, scaler.scale_, kmeans.cluster_centers_
 
 
-def update_inverted_index_with_clusters(inverted_index, document_data):
+# `game_clusters` maps doc id -> cluster
+def update_inverted_index_with_clusters(inverted_index, game_clusters):
     for term, term_data in inverted_index.items():
         if "postings" in term_data:
             for doc_id in list(term_data["postings"].keys()):
                 doc_id = int(doc_id)  # Ensure doc_id is an integer
-                cluster_id = int(document_data[doc_id].get('cluster'))  # Convert to Python int
+                cluster_id = int(game_clusters[doc_id])  # Convert to Python int
+                score = term_data["postings"][str(doc_id)]
+                if isinstance(score, dict):  # Already clustered by an earlier run
+                    score = score["score"]
                 term_data["postings"][str(doc_id)] = {
-                    "score": term_data["postings"][str(doc_id)],
+                    "score": score,
                     "cluster": cluster_id
                 }
     return inverted_index
@@ -129,28 +89,38 @@ def save_updated_inverted_index(file_path, inverted_index):
     print(f"Inverted index updated and saved to {file_path}.")
 
 
-def main():
+def main(optimal_k=30, method='kmeans', batch_size=4096):
     # Load and prepare data
-    features, game_ids = prepare_features()
+    features, game_ids, tags = prepare_features()
 
     # Perform clustering
     print("Clustering the games...")
-    optimal_k = 30
-    clusters = perform_clustering(features, game_ids, n_clusters=optimal_k)
+    clusters, scale, centroids = perform_clustering(
+        features, game_ids, n_clusters=optimal_k, method=method, batch_size=batch_size
+    )
+    save_cluster_model(CLUSTER_MODEL_PATH, tags, scale, centroids)
 
     # Update the inverted index
     print("Updating inverted index with cluster data...")
-    updated_inverted_index = update_inverted_index_with_clusters(inverted_index, document_data)
+    updated_inverted_index = update_inverted_index_with_clusters(inverted_index, dict(zip(game_ids, clusters.tolist())))
 
     # Save the updated inverted index
-    save_updated_inverted_index("../dataset/inverted_index_ai(30).json", updated_inverted_index)
+    save_updated_inverted_index("dataset/inverted_index_ai(30).json", updated_inverted_index)
+    write_binary_index(updated_inverted_index, "dataset/inverted_index_bin")
 
     # Print clustering results for verification
     for cluster in range(optimal_k):
         print(f"\nCluster {cluster + 1}:")
-        cluster_games = [document_data[doc_id]['data']['Name'] for doc_id, c in zip(game_ids, clusters) if c == cluster]
+        cluster_games = [document_store.string('name', row) for row in np.flatnonzero(clusters == cluster).tolist()]
         print(", ".join(cluster_games))
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cluster the games and store the clusters in the inverted index.")
+    parser.add_argument('--clusters', type=int, default=30)
+    parser.add_argument('--method', choices=['kmeans', 'minibatch'], default='kmeans')
+    parser.add_argument('--batch-size', type=int, default=4096)
+    args = parser.parse_args()
+    main(args.clusters, args.method, args.batch_size)
@@ -0,0 +1,172 @@
+import bisect  # For finding the bucket of an observation.
+import os  # For short file names in profiler stacks.
+import sys  # For reading the stack of the profiled thread.
+import threading  # Metrics are updated from every Flask thread; the profiler samples from its own.
+import time  # For stage timings and the sampling interval.
+from collections import Counter  # Sampled stacks and their counts.
+from contextlib import contextmanager  # For timing a block of code.
+
+# Latency histograms and gauges for the search and recommendation hot paths, rendered in the
+# Prometheus text format by app.py's /metrics route. Timing a stage costs two perf_counter
+# calls and a bisect under a lock, so the hooks stay on in production.
+
+# Upper bounds of the latency buckets, in seconds (+Inf is implicit)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Registered histograms by name and gauge sources as (prefix, help text, stats function)
+histograms = {}
+gauge_sources = []
+
+
+class Histogram:
+    """Latency histogram with one series per value of a single label (e.g. the stage)."""
+
+    def __init__(self, name, help_text, label, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self.series = {}  # label value -> [count per bucket (last is +Inf), sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        with self.lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, seconds)] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = sorted((label, list(counts), total, count) for label, (counts, total, count) in self.series.items())
+        for label_value, counts, total, count in series:
+            labels = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total!r}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+# The histogram called `name`, created on first use
+def histogram(name, help_text, label, buckets=LATENCY_BUCKETS):
+    if name not in histograms:
+        histograms[name] = Histogram(name, help_text, label, buckets)
+    return histograms[name]
+
+
+# Export the numeric values of `stats_function()` (a dict) as gauges named <prefix>_<key>
+def register_gauges(prefix, help_text, stats_function):
+    gauge_sources[:] = [source for source in gauge_sources if source[0] != prefix]
+    gauge_sources.append((prefix, help_text, stats_function))
+
+
+@contextmanager
+def timed(histogram, label_value):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(label_value, time.perf_counter() - start)
+
+
+# Every histogram and gauge in the Prometheus text exposition format
+def render():
+    lines = []
+    for name in sorted(histograms):
+        lines.extend(histograms[name].render())
+    for prefix, help_text, stats_function in gauge_sources:
+        for key, value in stats_function().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"# HELP {prefix}_{key} {help_text}")
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {value!r}")
+    return "\n".join(lines) + "\n"
+
+
+# Stage histograms of the hot paths
+search_stages = histogram('steam_search_stage_seconds',
+                          "Time spent in each stage of a search (correction is per query word).", 'stage')
+recommend_stages = histogram('steam_recommend_stage_seconds',
+                             "Time spent in each stage of a related games lookup.", 'stage')
+request_latency = histogram('steam_http_request_seconds', "Time to serve a request, by route.", 'route')
+load_latency = histogram('steam_load_seconds', "Time to load the index and the game data.", 'source')
+
+
+class SamplingProfiler:
+    """Samples the Python stack of one thread at a fixed interval from a background thread.
+
+    Only the profiled thread's code is seen, which is what a per-request profile needs. A
+    busy thread holds the GIL for up to sys.getswitchinterval() (5 ms by default) at a
+    time, so while any profiler runs the switch interval is lowered to the sampling interval.
+    """
+
+    # Running profilers and the switch interval to restore when the last one stops
+    _running = 0
+    _switch_interval = None
+    _lock = threading.Lock()
+
+    def __init__(self, thread_id=None, interval=0.001):
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.seconds = 0.0
+        self._started = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with SamplingProfiler._lock:
+            if SamplingProfiler._running == 0:
+                SamplingProfiler._switch_interval = sys.getswitchinterval()
+            SamplingProfiler._running += 1
+            sys.setswitchinterval(min(sys.getswitchinterval(), self.interval))
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.seconds = time.perf_counter() - self._started
+        with SamplingProfiler._lock:
+            SamplingProfiler._running -= 1
+            if SamplingProfiler._running == 0:
+                sys.setswitchinterval(SamplingProfiler._switch_interval)
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    # One "outer;...;inner count" line per stack, the input format of flame graph tools
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    # Functions the thread was seen running in the most samples
+    def top(self, n=20):
+        self_counts = Counter()
+        for stack, count in self.stacks.items():
+            self_counts[stack.rsplit(";", 1)[-1]] += count
+        return self_counts.most_common(n)
+
+    def report(self, n=20):
+        lines = [f"{self.samples} samples over {self.seconds * 1000:.1f} ms (interval {self.interval * 1000:g} ms)", ""]
+        lines.extend(f"{count / max(self.samples, 1):7.1%}  {function}" for function, count in self.top(n))
+        lines.extend(["", "Collapsed stacks:", self.collapsed()])
+        return "\n".join(lines)
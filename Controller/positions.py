@@ -0,0 +1,129 @@
+import base64  # Position lists inside the JSON index.
+import numpy as np  # Vectorized varint decoding and position matching.
+
+
+# A position list holds the word offsets of one term in one document, counting stop words
+# (see Analyzer.analyze_positions), so "call of duty" still has "duty" two words after "call".
+# It is stored as the first offset followed by the gaps between consecutive offsets, each a
+# varint: 7 bits per byte, low bits first, high bit set on every byte but the last.
+
+# Added to positions in match keys so a phrase offset or NEAR distance never borrows from the
+# doc id bits (positions beyond 2**31 - POSITION_BIAS are not supported)
+POSITION_BIAS = 1 << 20
+
+
+# Encoded position list of one document's sorted offsets
+def encode_positions(positions):
+    encoded = bytearray()
+    previous = 0
+    for position in positions:
+        delta = position - previous
+        previous = position
+        while delta >= 0x80:
+            encoded.append(delta & 0x7f | 0x80)
+            delta >>= 7
+        encoded.append(delta)
+    return bytes(encoded)
+
+
+# The JSON index keeps encoded position lists as base64 text
+def positions_to_text(positions):
+    return base64.b64encode(encode_positions(positions)).decode('ascii')
+
+
+def positions_from_text(text):
+    return base64.b64decode(text)
+
+
+# Start of every position list in the heap plus the end sentinel, from the lists' byte lengths;
+# uint32 unless the heap outgrows it, since there is one offset per posting
+def list_offsets(lengths):
+    lengths = np.asarray(lengths, dtype=np.int64)
+    total = int(lengths.sum())
+    offsets = np.zeros(len(lengths) + 1, dtype=np.uint32 if total < 1 << 32 else np.int64)
+    np.cumsum(lengths, out=offsets[1:], dtype=offsets.dtype)
+    return offsets
+
+
+# Values of concatenated varints
+def decode_varints(data):
+    data = np.asarray(data, dtype=np.uint8)
+    if len(data) == 0:
+        return np.empty(0, dtype=np.int64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    byte_numbers = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    return np.add.reduceat((data & 0x7f).astype(np.int64) << (7 * byte_numbers), starts)
+
+
+# Encode many sorted position lists at once: `counts[i]` positions of list i, concatenated in
+# `positions`. Returns the byte heap and the byte length of every list.
+def encode_position_lists(counts, positions):
+    counts = np.asarray(counts, dtype=np.int64)
+    positions = np.asarray(positions, dtype=np.int64)
+    deltas = np.diff(positions, prepend=0)
+    firsts = (np.cumsum(counts) - counts)[counts > 0]
+    deltas[firsts] = positions[firsts]
+
+    sizes = np.ones(len(deltas), dtype=np.int64)
+    for shift in (7, 14, 21, 28):
+        sizes += deltas >= (1 << shift)
+    value_starts = np.cumsum(sizes) - sizes
+    heap = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for byte_number in range(int(sizes.max()) if len(sizes) else 0):
+        has = sizes > byte_number
+        more = (sizes[has] > byte_number + 1).astype(np.int64) << 7
+        heap[value_starts[has] + byte_number] = ((deltas[has] >> (7 * byte_number)) & 0x7f) | more
+
+    byte_ends = np.concatenate(([0], np.cumsum(sizes)))
+    list_ends = np.cumsum(counts)
+    return heap, byte_ends[list_ends] - byte_ends[list_ends - counts]
+
+
+# Decode the position lists heap[starts[i]:ends[i]]; returns the number of positions of every
+# list and their offsets, concatenated in list order
+def decode_position_lists(heap, starts, ends):
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(ends, dtype=np.int64) - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(len(starts), dtype=np.int64), np.empty(0, dtype=np.int64)
+    byte_ends = np.cumsum(lengths)
+    data = np.asarray(heap[np.repeat(starts - (byte_ends - lengths), lengths) + np.arange(total)])
+
+    # A list's values end on its bytes without the high bit
+    values_before = np.concatenate(([0], np.cumsum(data < 0x80)))
+    counts = values_before[byte_ends] - values_before[byte_ends - lengths]
+    sums = np.concatenate(([0], np.cumsum(decode_varints(data))))
+    positions = sums[1:] - np.repeat(sums[np.cumsum(counts) - counts], counts)
+    return counts, positions
+
+
+# Sorted (doc << 32 | biased position) keys of a term's positions shifted back by `offset`
+def _position_keys(doc_ids, positions, offset=0):
+    return (np.asarray(doc_ids, dtype=np.int64) << 32) | (positions - offset + POSITION_BIAS)
+
+
+# Docs of the candidate array `doc_ids` holding the terms at the given word offsets from each
+# other. `term_positions(term, doc_ids)` returns (doc id of every position, positions).
+def phrase_documents(doc_ids, terms, offsets, term_positions):
+    keys = None
+    for term, offset in zip(terms, offsets):
+        term_keys = _position_keys(*term_positions(term, doc_ids), offset)
+        keys = term_keys if keys is None else np.intersect1d(keys, term_keys, assume_unique=True)
+        if len(keys) == 0:
+            break
+    return np.unique(keys >> 32).astype(np.int32)
+
+
+# Docs of the candidate array `doc_ids` where the two terms occur at most `distance` words apart
+def near_documents(doc_ids, left, right, distance, term_positions):
+    distance = min(distance, POSITION_BIAS - 1)
+    left_keys = np.sort(_position_keys(*term_positions(left, doc_ids)))
+    right_keys = np.sort(_position_keys(*term_positions(right, doc_ids)))
+    if len(left_keys) == 0 or len(right_keys) == 0:
+        return doc_ids[:0]
+    nearest = np.searchsorted(right_keys, left_keys - distance)
+    found = nearest < len(right_keys)
+    found[found] = right_keys[nearest[found]] <= left_keys[found] + distance
+    return np.unique(left_keys[found] >> 32).astype(np.int32)
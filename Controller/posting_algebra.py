@@ -0,0 +1,98 @@
+import numpy as np  # Sorted doc-id arrays and vectorized merges.
+from Controller import bitmaps  # Bitmap form of dense posting lists.
+
+
+# Posting lists are sorted, duplicate free int32 doc-id arrays (see binary_index.py), or
+# bitmaps for dense terms and clusters (see bitmaps.py). Operations between bitmaps stay
+# bitmaps; an array intersected with or subtracted by a bitmap stays an array, and a union
+# involving a bitmap is a bitmap. bitmaps.to_array turns any result back into an array.
+
+# When one list is this many times longer than the other, probe the long list with
+# binary searches (galloping) instead of merging both lists end to end.
+GALLOP_RATIO = 8
+
+EMPTY = np.empty(0, dtype=np.int32)
+
+
+# Boolean mask telling which values of `values` occur in the sorted array `postings`
+def contains(postings, values):
+    if len(postings) == 0 or len(values) == 0:
+        return np.zeros(len(values), dtype=bool)
+    positions = np.searchsorted(postings, values)
+    positions[positions == len(postings)] = len(postings) - 1
+    return postings[positions] == values
+
+
+# Intersection of two sorted posting lists
+def intersect(a, b):
+    if bitmaps.is_bitmap(a) or bitmaps.is_bitmap(b):
+        if bitmaps.is_bitmap(a) and bitmaps.is_bitmap(b):
+            return a & b
+        bitmap, array = (a, b) if bitmaps.is_bitmap(a) else (b, a)
+        return bitmaps.select(bitmap, array) if len(array) else EMPTY
+    if len(a) > len(b):
+        a, b = b, a
+    if len(a) == 0:
+        return EMPTY
+    # The short list can't match anything outside the long list's range
+    if a[-1] < b[0] or b[-1] < a[0]:
+        return EMPTY
+    if len(b) >= GALLOP_RATIO * len(a):
+        # Cost is O(len(a) * log(len(b))): only the short list is walked
+        return a[contains(b, a)]
+    return np.intersect1d(a, b, assume_unique=True)
+
+
+# Union of two sorted posting lists by merging them
+def union(a, b):
+    if bitmaps.is_bitmap(a) or bitmaps.is_bitmap(b):
+        return bitmaps.as_bitmap(a) | bitmaps.as_bitmap(b)
+    if len(a) == 0:
+        return np.asarray(b, dtype=np.int32)
+    if len(b) == 0:
+        return np.asarray(a, dtype=np.int32)
+    # A stable sort of two sorted runs is a linear merge
+    merged = np.sort(np.concatenate((a, b)), kind='stable')
+    keep = np.empty(len(merged), dtype=bool)
+    keep[0] = True
+    np.not_equal(merged[1:], merged[:-1], out=keep[1:])
+    return merged[keep]
+
+
+# Docs of `a` that are not in `b`
+def difference(a, b):
+    if len(a) == 0 or len(b) == 0:
+        return a if bitmaps.is_bitmap(a) else np.asarray(a, dtype=np.int32)
+    if bitmaps.is_bitmap(a):
+        return a - bitmaps.as_bitmap(b)
+    if bitmaps.is_bitmap(b):
+        return bitmaps.reject(b, a)
+    return a[~contains(b, a)]
+
+
+# Intersection of many posting lists, rarest first so the running result only shrinks
+def intersect_many(postings_lists):
+    if not postings_lists:
+        return EMPTY
+    ordered = sorted(postings_lists, key=len)
+    result = ordered[0]
+    for postings in ordered[1:]:
+        if len(result) == 0:
+            break
+        result = intersect(result, postings)
+    return result if bitmaps.is_bitmap(result) else np.asarray(result, dtype=np.int32)
+
+
+# Union of many posting lists in a single merge
+def union_many(postings_lists):
+    postings_lists = [postings for postings in postings_lists if len(postings)]
+    if not postings_lists:
+        return EMPTY
+    if len(postings_lists) == 1:
+        return postings_lists[0] if bitmaps.is_bitmap(postings_lists[0]) else np.asarray(postings_lists[0], dtype=np.int32)
+    if any(bitmaps.is_bitmap(postings) for postings in postings_lists):
+        result = bitmaps.as_bitmap(postings_lists[0])
+        for postings in postings_lists[1:]:
+            result = result | bitmaps.as_bitmap(postings)
+        return result
+    return np.unique(np.concatenate(postings_lists)).astype(np.int32, copy=False)
@@ -0,0 +1,171 @@
+import re  # For splitting the query string into lexical tokens.
+from collections import namedtuple  # Lightweight, hashable AST nodes.
+
+
+# AST nodes produced by `parse_query`. Children are tuples so whole trees are hashable.
+Term = namedtuple('Term', ['text'])
+# Terms at fixed word offsets from each other; offsets None means consecutive words
+Phrase = namedtuple('Phrase', ['terms', 'offsets'], defaults=(None,))
+And = namedtuple('And', ['children'])
+Or = namedtuple('Or', ['children'])
+Not = namedtuple('Not', ['child'])
+Field = namedtuple('Field', ['field', 'text'])  # tag:roguelike, name:"black myth"
+Range = namedtuple('Range', ['field', 'op', 'value'])  # price<10, year>=2020
+Near = namedtuple('Near', ['children', 'distance'])  # souls NEAR/3 like: two Terms at most `distance` words apart
+
+# Operators are uppercase only; lowercase "and", "or" and "not" are ordinary (stop) words, so
+# queries like "rock and roll" or "not for broadcast" stay plain searches
+OPERATORS = {'AND', 'OR', 'NOT'}
+
+# Query field names -> indexed fields (analyzer.FIELDS) and numeric doc values (document_store,
+# plus the K-Means cluster of every game)
+FIELD_ALIASES = {'name': 'name', 'tag': 'tag', 'tags': 'tag', 'description': 'description', 'desc': 'description'}
+RANGE_FIELDS = {'price': 'price', 'reviews': 'reviews', 'review_no': 'reviews', 'year': 'year', 'cluster': 'cluster'}
+
+# Parentheses, "quoted phrases" or any other run of non-space characters
+TOKEN_PATTERN = re.compile(r'\(|\)|"[^"]*"?|[^\s()"]+')
+WORD_PATTERN = re.compile(r'\b\w+\b')
+FIELD_PATTERN = re.compile(r'^(\w+):(.*)$')
+RANGE_PATTERN = re.compile(r'^(\w+)(<=|>=|<|>|=)(\d+(?:\.\d+)?)$')
+NEAR_PATTERN = re.compile(r'^NEAR/(\d+)$')
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+# Split a query into (kind, value) tokens; kind is 'op', 'near', 'lparen', 'rparen', 'phrase' or 'word'
+def tokenize_query(query):
+    tokens = []
+    for raw in TOKEN_PATTERN.findall(query):
+        if raw == '(':
+            tokens.append(('lparen', raw))
+        elif raw == ')':
+            tokens.append(('rparen', raw))
+        elif raw.startswith('"'):
+            tokens.append(('phrase', raw.strip('"')))
+        elif raw in OPERATORS:
+            tokens.append(('op', raw))
+        elif NEAR_PATTERN.match(raw):
+            tokens.append(('near', raw))
+        else:
+            tokens.append(('word', raw))
+    return tokens
+
+
+# Recursive descent parser. Precedence from loosest to tightest: OR, AND, NOT, NEAR/k.
+# Adjacent operands without an operator between them are joined with AND.
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def advance(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise QuerySyntaxError("Empty query.")
+        node = self.parse_or()
+        if self.position < len(self.tokens):
+            raise QuerySyntaxError(f"Unexpected '{self.peek()[1]}' in query.")
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == ('op', 'OR'):
+            self.advance()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(tuple(children))
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while True:
+            kind, value = self.peek()
+            if (kind, value) == ('op', 'AND'):
+                self.advance()
+            elif not (kind in {'word', 'phrase', 'lparen'} or (kind, value) == ('op', 'NOT')):
+                break
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else And(tuple(children))
+
+    def parse_not(self):
+        if self.peek() == ('op', 'NOT'):
+            self.advance()
+            return Not(self.parse_not())
+        return self.parse_near()
+
+    # a NEAR/3 b NEAR/2 c -> (a NEAR/3 b) AND (b NEAR/2 c)
+    def parse_near(self):
+        node = self.parse_primary()
+        pairs = []
+        while self.peek()[0] == 'near':
+            distance = int(NEAR_PATTERN.match(self.advance()[1]).group(1))
+            right = self.parse_primary()
+            if not isinstance(node, Term) or not isinstance(right, Term):
+                raise QuerySyntaxError("NEAR needs a single word on each side.")
+            pairs.append(Near((node, right), distance))
+            node = right
+        if not pairs:
+            return node
+        return pairs[0] if len(pairs) == 1 else And(tuple(pairs))
+
+    def parse_primary(self):
+        kind, value = self.advance()
+        if kind == 'lparen':
+            node = self.parse_or()
+            if self.advance()[0] != 'rparen':
+                raise QuerySyntaxError("Missing closing parenthesis.")
+            return node
+        if kind == 'phrase':
+            return Phrase(tuple(Term(word) for word in WORD_PATTERN.findall(value)))
+        if kind == 'word':
+            node = self.parse_field(value)
+            if node is not None:
+                return node
+            # "souls-like" and the like are kept together as a phrase
+            words = WORD_PATTERN.findall(value)
+            if len(words) == 1:
+                return Term(words[0])
+            return Phrase(tuple(Term(word) for word in words))
+        if kind is None:
+            raise QuerySyntaxError("Unexpected end of query.")
+        raise QuerySyntaxError(f"Unexpected '{value}' in query.")
+
+    # field:value, field:"quoted value" or a numeric comparison like price<10; None for other words
+    def parse_field(self, value):
+        match = RANGE_PATTERN.match(value)
+        if match and match.group(1).lower() in RANGE_FIELDS:
+            return Range(RANGE_FIELDS[match.group(1).lower()], match.group(2), float(match.group(3)))
+        match = FIELD_PATTERN.match(value)
+        if match and match.group(1).lower() in FIELD_ALIASES:
+            text = match.group(2)
+            if not text:
+                if self.peek()[0] != 'phrase':
+                    raise QuerySyntaxError(f"Missing value after '{value}'.")
+                text = self.advance()[1]
+            return Field(FIELD_ALIASES[match.group(1).lower()], text)
+        return None
+
+
+# Ranges reach the engine as pseudo terms like "price<10"
+def range_term(node):
+    return f"{node.field}{node.op}{node.value:g}"
+
+
+# Range of a pseudo term made by range_term, or None for any other term
+def parse_range_term(term):
+    match = RANGE_PATTERN.match(term)
+    if not match or match.group(1) not in RANGE_FIELDS.values():
+        return None
+    return Range(match.group(1), match.group(2), float(match.group(3)))
+
+
+# Parse a boolean query string into an AST of Term/Phrase/Near/Field/Range/And/Or/Not nodes
+def parse_query(query):
+    return _Parser(tokenize_query(query)).parse()
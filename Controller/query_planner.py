@@ -0,0 +1,222 @@
+from Controller import bitmaps  # Phrase and NEAR checks run on candidate arrays.
+from Controller import posting_algebra  # Set operations on sorted doc-id arrays.
+from Controller import positions  # Position list matching for phrases and NEAR.
+from Controller.document_store import COMPARISONS  # Operators of range pseudo terms.
+from Controller.query_parser import (  # AST nodes shared with the parser.
+    Term, Phrase, Near, And, Or, Not, Field, Range, range_term, parse_range_term, WORD_PATTERN
+)
+
+
+# Constant nodes the planner folds sub-queries into (compared by identity)
+class _Constant:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+    # Plans sent to shard workers (sharding.py) unpickle to the same constants
+    def __reduce__(self):
+        return self.name
+
+
+EMPTY = _Constant('EMPTY')  # matches nothing
+ALL = _Constant('ALL')  # matches every document
+
+
+# Replace query words with index terms; words that normalize to nothing (stop words) disappear.
+# Field queries become field terms and numeric ranges pseudo terms (query_parser.range_term).
+def _normalize(node, normalize_term, normalize_field):
+    if isinstance(node, Term):
+        term = normalize_term(node.text)
+        return Term(term) if term else None
+    if isinstance(node, Range):
+        return Term(range_term(node))
+    if isinstance(node, Field):
+        # Field terms have no positions, so every term of the field value is required
+        terms = [Term(term) for term in normalize_field(node.field, node.text)]
+        if not terms:
+            return None
+        return terms[0] if len(terms) == 1 else And(tuple(terms))
+    if isinstance(node, Phrase):
+        # Stop words leave gaps: "call of duty" is call, then duty two words later
+        offsets = node.offsets or range(len(node.terms))
+        kept = [(Term(term), offset) for term, offset in zip((normalize_term(t.text) for t in node.terms), offsets) if term]
+        if not kept:
+            return None
+        if len(kept) == 1:
+            return kept[0][0]
+        return Phrase(tuple(term for term, _ in kept), tuple(offset - kept[0][1] for _, offset in kept))
+    if isinstance(node, Near):
+        children = [c for c in (_normalize(child, normalize_term, normalize_field) for child in node.children)
+                    if c is not None]
+        if len(children) < 2:
+            return children[0] if children else None
+        return Near(tuple(children), node.distance)
+    if isinstance(node, Not):
+        child = _normalize(node.child, normalize_term, normalize_field)
+        return Not(child) if child is not None else None
+    children = [c for c in (_normalize(child, normalize_term, normalize_field) for child in node.children)
+                if c is not None]
+    if not children:
+        return None
+    return children[0] if len(children) == 1 else type(node)(tuple(children))
+
+
+# Push NOT towards the leaves: NOT NOT a -> a, NOT (a OR b) -> NOT a AND NOT b.
+# NOT (a AND b) is left alone; one difference against the intersection is cheaper.
+def _push_down_not(node, negate=False):
+    if isinstance(node, Not):
+        return _push_down_not(node.child, not negate)
+    if isinstance(node, Or) and negate:
+        return And(tuple(_push_down_not(child, True) for child in node.children))
+    if isinstance(node, (And, Or)):
+        node = type(node)(tuple(_push_down_not(child) for child in node.children))
+    return Not(node) if negate else node
+
+
+# Estimated number of matching documents
+def estimate(node, doc_frequency, document_count):
+    if isinstance(node, Term):
+        return doc_frequency(node.text)
+    if isinstance(node, Phrase):
+        return min(doc_frequency(term.text) for term in node.terms)
+    if isinstance(node, Near):
+        return min(doc_frequency(term.text) for term in node.children)
+    if isinstance(node, Not):
+        return document_count - estimate(node.child, doc_frequency, document_count)
+    if isinstance(node, And):
+        positives = [c for c in node.children if not isinstance(c, Not)]
+        if not positives:
+            return document_count
+        return min(estimate(c, doc_frequency, document_count) for c in positives)
+    if isinstance(node, Or):
+        return min(document_count, sum(estimate(c, doc_frequency, document_count) for c in node.children))
+    return document_count if node is ALL else 0
+
+
+# Flatten nested AND/OR, fold empty and universal sub-queries, and order operands cheapest first
+def _fold(node, doc_frequency, document_count):
+    if isinstance(node, Term):
+        return node if doc_frequency(node.text) else EMPTY
+    if isinstance(node, Phrase):
+        return node if all(doc_frequency(term.text) for term in node.terms) else EMPTY
+    if isinstance(node, Near):
+        return node if all(doc_frequency(term.text) for term in node.children) else EMPTY
+    if isinstance(node, Not):
+        child = _fold(node.child, doc_frequency, document_count)
+        if child is EMPTY:
+            return ALL
+        if child is ALL:
+            return EMPTY
+        return Not(child)
+
+    children = []
+    for child in (_fold(c, doc_frequency, document_count) for c in node.children):
+        children.extend(child.children if type(child) is type(node) else [child])
+
+    def cost(child):
+        return estimate(child, doc_frequency, document_count)
+
+    if isinstance(node, And):
+        # One empty operand empties the whole chain; nothing else gets evaluated
+        if EMPTY in children:
+            return EMPTY
+        children = [c for c in children if c is not ALL]
+        if not children:
+            return ALL
+        positives = sorted((c for c in children if not isinstance(c, Not)), key=cost)
+        # Subtract the biggest exclusions first so the running result shrinks fastest
+        negatives = sorted((c for c in children if isinstance(c, Not)), key=cost)
+        children = positives + negatives
+    else:
+        if ALL in children:
+            return ALL
+        children = sorted((c for c in children if c is not EMPTY), key=cost)
+        if not children:
+            return EMPTY
+    return children[0] if len(children) == 1 else type(node)(tuple(children))
+
+
+# Turn a parsed query into an executable plan. `normalize_field(field, text)` returns the field
+# terms of a field query; without it field queries search the full text.
+def plan_query(ast, normalize_term, doc_frequency, document_count, normalize_field=None):
+    if normalize_field is None:
+        def normalize_field(field, text):
+            return [term for term in map(normalize_term, WORD_PATTERN.findall(text)) if term]
+    node = _normalize(ast, normalize_term, normalize_field)
+    if node is None:
+        return EMPTY
+    return _fold(_push_down_not(node), doc_frequency, document_count)
+
+
+# Terms that contribute to a document's score (everything not under a NOT)
+def scoring_terms(plan):
+    terms = []
+
+    def collect(node):
+        if isinstance(node, Term):
+            terms.append(node.text)
+        elif isinstance(node, Phrase):
+            terms.extend(term.text for term in node.terms)
+        elif isinstance(node, Near):
+            terms.extend(term.text for term in node.children)
+        elif isinstance(node, (And, Or)):
+            for child in node.children:
+                collect(child)
+
+    collect(plan)
+    return list(dict.fromkeys(terms))
+
+
+# Doc ids (sorted array or bitmap) of an index term or of a range pseudo term such as
+# "price<10" in `index`, with range values read from `document_data`
+def index_postings(index, document_data, term):
+    node = parse_range_term(term)
+    if node is None:
+        return index.doc_set(term)
+    if node.field == 'cluster':
+        compare = COMPARISONS[node.op]
+        return posting_algebra.union_many([index.cluster_set(cluster)
+                                           for cluster in index.cluster_docs if compare(cluster, node.value)])
+    return posting_algebra.intersect(document_data.range_doc_ids(node.field, node.op, node.value),
+                                     index.document_set())
+
+
+# Evaluate a plan; `postings(term)` returns the sorted doc ids of a term and
+# `universe` holds every doc id (needed for NOT without a positive operand).
+# `term_positions(term, doc_ids)` returns (doc id of every position, positions) of a term
+# in the given docs; without it phrases and NEAR only require all their terms.
+def execute(plan, postings, universe, term_positions=None):
+    if isinstance(plan, Term):
+        return postings(plan.text)
+    if isinstance(plan, (Phrase, Near)):
+        terms = [term.text for term in (plan.terms if isinstance(plan, Phrase) else plan.children)]
+        candidates = posting_algebra.intersect_many([postings(term) for term in terms])
+        if term_positions is None or len(candidates) == 0:
+            return candidates
+        candidates = bitmaps.to_array(candidates)
+        if isinstance(plan, Near):
+            return positions.near_documents(candidates, terms[0], terms[1], plan.distance, term_positions)
+        offsets = plan.offsets or range(len(terms))
+        return positions.phrase_documents(candidates, terms, offsets, term_positions)
+    if isinstance(plan, Not):
+        return posting_algebra.difference(universe, execute(plan.child, postings, universe, term_positions))
+    if isinstance(plan, And):
+        positives = [c for c in plan.children if not isinstance(c, Not)]
+        negatives = [c.child for c in plan.children if isinstance(c, Not)]
+        result = execute(positives[0], postings, universe, term_positions) if positives else universe
+        # Operands are only materialized while the running result is non-empty
+        for child in positives[1:]:
+            if len(result) == 0:
+                return posting_algebra.EMPTY
+            result = posting_algebra.intersect(result, execute(child, postings, universe, term_positions))
+        for child in negatives:
+            if len(result) == 0:
+                return posting_algebra.EMPTY
+            result = posting_algebra.difference(result, execute(child, postings, universe, term_positions))
+        return result
+    if isinstance(plan, Or):
+        return posting_algebra.union_many([execute(child, postings, universe, term_positions)
+                                           for child in plan.children])
+    return universe if plan is ALL else posting_algebra.EMPTY
@@ -0,0 +1,53 @@
+from collections import namedtuple  # Lightweight ranked results.
+import numpy as np  # Vectorized score accumulation and top-k selection.
+
+
+# Ranked hits of a query: the total match count and parallel arrays for the best hits,
+# best first. Metadata is only looked up for the page being shown (describe_results).
+SearchResults = namedtuple('SearchResults', ['total', 'doc_ids', 'scores', 'clusters'])
+
+# Slack for float rounding when comparing a document's score bound against the threshold
+BOUND_EPSILON = 1e-9
+
+
+# Best `k` candidates by summed term score, ordered by score (descending) then doc id.
+#
+# `term_postings` is a list of (doc_ids, scores, max_score, min_score) per query term.
+# Terms are applied from the highest max_score down (MaxScore): after each term, a
+# candidate whose score so far plus the best the remaining terms could add can't reach
+# the k-th best guaranteed score is dropped, so low-impact terms are only looked up for
+# documents that can still make the top k. Scores can be negative (idf < 0 for terms in
+# nearly every document), so a missing term bounds a contribution by 0 on either side.
+# Returns (doc_ids, scores) arrays.
+def top_k(candidates, term_postings, k=None):
+    candidates = np.asarray(candidates)
+    if k is None or k > len(candidates):
+        k = len(candidates)
+    if k <= 0:
+        return candidates[:0], np.zeros(0, dtype=np.float64)
+
+    term_postings = sorted(term_postings, key=lambda postings: -postings[2])
+    upper_bound = float(sum(max(max_score, 0.0) for _, _, max_score, _ in term_postings))
+    lower_bound = float(sum(min(min_score, 0.0) for _, _, _, min_score in term_postings))
+
+    accumulated = np.zeros(len(candidates), dtype=np.float64)
+    alive = np.arange(len(candidates))
+    for doc_ids, scores, max_score, min_score in term_postings:
+        upper_bound -= max(float(max_score), 0.0)
+        lower_bound -= min(float(min_score), 0.0)
+        if len(doc_ids):
+            alive_docs = candidates[alive]
+            positions = np.searchsorted(doc_ids, alive_docs)
+            positions[positions == len(doc_ids)] = len(doc_ids) - 1
+            hits = doc_ids[positions] == alive_docs
+            accumulated[alive[hits]] += scores[positions[hits]]
+
+        if len(alive) > k:
+            alive_scores = accumulated[alive]
+            threshold = np.partition(alive_scores, len(alive) - k)[len(alive) - k] + lower_bound
+            alive = alive[alive_scores + upper_bound + BOUND_EPSILON >= threshold]
+
+    # Order the survivors by score, ties by doc id, and keep the best k
+    order = np.lexsort((candidates[alive], -accumulated[alive]))[:k]
+    best = alive[order]
+    return candidates[best], accumulated[best]
@@ -1,56 +1,201 @@
+import heapq  # For picking the top N recommendations without sorting every candidate.
+import os  # For checking whether a precomputed neighbour table exists.
+import time  # For stage timings.
+import numpy as np  # Dense similarity blocks and the neighbour table.
+from scipy import sparse  # Sparse doc x tag matrices for batch similarities.
 from Controller import booleanQuerySteam
+from Controller import metrics  # Stage latency histograms.
+
+RELATED_TABLE_PATH = "dataset/related_games.npz"
+
+# Tag vocabulary and per-document tag bitsets, built once from booleanQuerySteam.document_data
+tag_ids = {}
+doc_tag_bits = {}
+
+# Precomputed neighbour table written by `recommend_all` (empty until loaded)
+related_table = {}
+
+
+def build_tag_index():
+    """Encode every document's tags as a bitset over the tag vocabulary."""
+    tag_ids.clear()
+    doc_tag_bits.clear()
+    for doc_id, document in booleanQuerySteam.document_data.items():
+        doc_tag_bits[doc_id] = encode_tags(document['data']['Tags'], add=True)
+
+
+def encode_tags(tags, add=False):
+    """Bitset of the known tags in `tags`; with add=True unseen tags join the vocabulary."""
+    bits = 0
+    for tag in set(tags):
+        if add and tag not in tag_ids:
+            tag_ids[tag] = len(tag_ids)
+        if tag in tag_ids:
+            bits |= 1 << tag_ids[tag]
+    return bits
+
 
 def recommend_related_games(target_game_tags, target_game_cluster, top_n=5, doc_id=None):
     """Find and recommend related games based on cluster and tag similarity."""
-    # Filter postings from the inverted index by target cluster
-    same_cluster_docs = []
-    for term, term_data in booleanQuerySteam.inverted_index.items():
-        for doc_id_key, posting in term_data['postings'].items():
-            if posting['cluster'] == target_game_cluster:
-
-                if int(doc_id_key) not in [doc['id'] for doc in same_cluster_docs]:
-                    same_cluster_docs.append({
-                        'id': int(doc_id_key),
-                        'cluster': posting['cluster']
-                    })
+    start = time.perf_counter()
+    same_cluster_docs = booleanQuerySteam.inverted_index.cluster_members(target_game_cluster)
+    metrics.recommend_stages.observe('candidates', time.perf_counter() - start)
 
     # If not found in the same cluster, return empty list
-    if not same_cluster_docs:
+    if len(same_cluster_docs) == 0:
         return []
 
-    recommendations = []
-
-    # Compare target game with documents in the same cluster
-    for doc in same_cluster_docs:
-        doc_id_current = doc['id']
-        if doc_id_current == int(doc_id):  # Skip the target game itself
-            continue
+    # Tags outside the vocabulary can't overlap, but still count towards the union
+    target_tags = set(target_game_tags)
+    target_bits = encode_tags(target_tags)
+    target_size = len(target_tags)
+    skip_id = int(doc_id) if doc_id is not None else None
 
-        # Retrieve document details
-        doc_tags = booleanQuerySteam.document_data[doc_id_current]['data']['Tags']
+    # Calculate similarity (Jaccard index): the ratio of the overlapping tags to the overall tags
+    def candidates():
+        for doc_id_current in same_cluster_docs.tolist():
+            if doc_id_current == skip_id or doc_id_current not in doc_tag_bits:  # Skip the target game itself
+                continue
+            doc_bits = doc_tag_bits[doc_id_current]
+            overlap = (target_bits & doc_bits).bit_count()
+            union = target_size + doc_bits.bit_count() - overlap
+            yield overlap / union, doc_id_current
 
-        # Calculate similarity (Jaccard index)
-        # Calculate the ratio of the overlapping tags to the overall tags
-        tag_similarity = len(set(target_game_tags) & set(doc_tags)) / len(set(target_game_tags) | set(doc_tags))
+    # Highest similarity first, ties by doc id
+    with metrics.timed(metrics.recommend_stages, 'similarity'):
+        top_recommendations = heapq.nlargest(top_n, candidates(), key=lambda x: (x[0], -x[1]))
 
-        if doc['id'] == int(doc_id):
-            continue
-        else:
-            recommendations.append({
-                'id': doc['id'],
-                'cluster': doc['cluster'],
-                'name': booleanQuerySteam.document_data[doc['id']]['data']['Name'],
-                'price': booleanQuerySteam.document_data[doc['id']]['data']['Price'],
-                'release_date': booleanQuerySteam.document_data[doc['id']]['data']['Release_date'],
-                'path': f"{booleanQuerySteam.document_data[doc['id']]['sanitized_name']}",
-                'tag_similarity': tag_similarity
-            })
-
-    # Sort by tag similarity and take the top N results
-    recommendations.sort(key=lambda x: -x['tag_similarity'])
-    top_recommendations = recommendations[:top_n]
-
-    recommended_game = [{'game': rec} for rec in top_recommendations]
+    with metrics.timed(metrics.recommend_stages, 'metadata'):
+        recommended_game = [
+            _related_game_entry(doc_id_current, target_game_cluster, tag_similarity)
+            for tag_similarity, doc_id_current in top_recommendations
+        ]
+    metrics.recommend_stages.observe('recommend', time.perf_counter() - start)
 
     # Goal state (top 5 recommendation games [sorted])
     return recommended_game
+
+
+# The document is looked up once: the columnar store rebuilds it on every lookup
+def _related_game_entry(doc_id_current, cluster, tag_similarity):
+    document = booleanQuerySteam.document_data[doc_id_current]
+    return {'game': {
+        'id': doc_id_current,
+        'cluster': cluster,
+        'name': document['data']['Name'],
+        'price': document['data']['Price'],
+        'release_date': document['data']['Release_date'],
+        'path': f"{document['sanitized_name']}",
+        'tag_similarity': tag_similarity
+    }}
+
+
+def tag_matrix(doc_ids):
+    """Binary CSR matrix with one row per document in `doc_ids` and one column per tag."""
+    indptr = [0]
+    indices = []
+    for doc_id in doc_ids:
+        tags = booleanQuerySteam.document_data[doc_id]['data']['Tags'] if doc_id in booleanQuerySteam.document_data else []
+        indices.extend(sorted(tag_ids[tag] for tag in set(tags) if tag in tag_ids))
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.float64)
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(doc_ids), len(tag_ids)))
+
+
+def recommend_all(top_n=5, chunk_size=1024, metric='jaccard'):
+    """Top N related games of every document, ranked exactly like recommend_related_games.
+
+    Similarities are computed per cluster as sparse products of the doc x tag matrix,
+    `chunk_size` rows at a time so memory stays bounded by chunk_size x cluster size.
+    Returns a table of sorted doc ids, their clusters and (doc count x top_n) neighbour
+    ids / similarities, padded with -1 / nan where a cluster has fewer than top_n others.
+    """
+    index = booleanQuerySteam.inverted_index
+    documents = np.asarray(index.documents)
+    neighbours = np.full((len(documents), top_n), -1, dtype=np.int32)
+    similarities = np.full((len(documents), top_n), np.nan, dtype=np.float64)
+
+    for cluster in index.cluster_docs:
+        members = np.array([d for d in index.cluster_members(cluster).tolist() if d in doc_tag_bits], dtype=np.int32)
+        if len(members) == 0:
+            continue
+        matrix = tag_matrix(members.tolist())
+        sizes = np.asarray(matrix.sum(axis=1)).ravel()
+        rows = np.searchsorted(documents, members)
+
+        for start in range(0, len(members), chunk_size):
+            end = min(start + chunk_size, len(members))
+            overlap = (matrix[start:end] @ matrix.T).toarray()
+            if metric == 'jaccard':
+                union = sizes[start:end, None] + sizes[None, :] - overlap
+                similarity = np.divide(overlap, union, out=np.zeros_like(overlap), where=union > 0)
+            elif metric == 'cosine':
+                norms = np.sqrt(sizes[start:end, None] * sizes[None, :])
+                similarity = np.divide(overlap, norms, out=np.zeros_like(overlap), where=norms > 0)
+            else:
+                raise ValueError(f"Unsupported similarity metric '{metric}'.")
+
+            # Never recommend a game to itself
+            similarity[np.arange(end - start), np.arange(start, end)] = -np.inf
+
+            # Members are sorted by doc id, so a stable sort breaks ties by doc id
+            order = np.argsort(-similarity, axis=1, kind='stable')[:, :top_n]
+            best = np.take_along_axis(similarity, order, axis=1)
+            valid = np.isfinite(best)
+            block_rows = rows[start:end]
+            neighbours[block_rows, :order.shape[1]] = np.where(valid, members[order], -1)
+            similarities[block_rows, :order.shape[1]] = np.where(valid, best, np.nan)
+
+    return {
+        'doc_ids': documents,
+        'clusters': np.asarray(index.document_clusters),
+        'neighbours': neighbours,
+        'similarities': similarities,
+    }
+
+
+def save_related_table(table, file_path=RELATED_TABLE_PATH):
+    np.savez(file_path, **table)
+    print(f"Related games table saved to {file_path}.")
+
+
+def load_related_table(file_path=RELATED_TABLE_PATH):
+    related_table.clear()
+    if os.path.exists(file_path):
+        with np.load(file_path) as table:
+            related_table.update({name: table[name] for name in table.files})
+        print("Related games table loaded successfully.")
+
+
+def cached_related_games(doc_id, cluster, top_n=5):
+    """Related games from the precomputed table, or None when the table can't answer."""
+    if not related_table or top_n > related_table['neighbours'].shape[1]:
+        return None
+    doc_ids = related_table['doc_ids']
+    row = np.searchsorted(doc_ids, int(doc_id))
+    if row == len(doc_ids) or doc_ids[row] != int(doc_id) or related_table['clusters'][row] != cluster:
+        return None
+    with metrics.timed(metrics.recommend_stages, 'table'):
+        return [
+            _related_game_entry(neighbour, cluster, similarity)
+            for neighbour, similarity in zip(related_table['neighbours'][row, :top_n].tolist(),
+                                             related_table['similarities'][row, :top_n].tolist())
+            if neighbour != -1 and neighbour in booleanQuerySteam.document_data
+        ]
+
+
+build_tag_index()
+load_related_table()
+
+
+# Nightly batch: python -m Controller.relatedGameRecommendation
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Precompute related games for the whole catalog.")
+    parser.add_argument('--top-n', type=int, default=5)
+    parser.add_argument('--chunk-size', type=int, default=1024)
+    parser.add_argument('--metric', choices=['jaccard', 'cosine'], default='jaccard')
+    parser.add_argument('--output', default=RELATED_TABLE_PATH)
+    args = parser.parse_args()
+    save_related_table(recommend_all(args.top_n, args.chunk_size, args.metric), args.output)
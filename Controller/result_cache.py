@@ -0,0 +1,55 @@
+import threading  # Flask may serve requests from several threads.
+import time  # For expiring old entries.
+from collections import OrderedDict  # Entries in least recently used order.
+
+
+class ResultCache:
+    """Bounded LRU cache of ranked results with a time to live.
+
+    Keys are planned queries, so differently spelled queries that normalize to the same
+    plan share an entry. Values are whatever the caller stores (ranked doc-id arrays),
+    tagged with the index generation they were computed on; an entry from an older
+    generation is a miss, so reloading or updating the index invalidates everything.
+    """
+
+    def __init__(self, max_entries=256, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # Cached value, or None; `accept` can reject a value that can't answer this lookup
+    def get(self, key, generation, accept=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (entry[0] != generation or time.monotonic() - entry[1] > self.ttl):
+                del self.entries[key]
+                entry = None
+            if entry is None or (accept is not None and not accept(entry[2])):
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, generation, value):
+        with self.lock:
+            self.entries[key] = (generation, time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,488 @@
+import json  # For the manifest and per-segment document metadata.
+import math  # For recomputing idf.
+import os  # For segment directories and atomic manifest swaps.
+import shutil  # For removing segments once they are merged.
+import threading  # For the background merge thread.
+import time  # For the background merge interval and the age of the writer lock.
+import traceback  # For logging failed background merges.
+from collections import Counter  # Term counts of new documents.
+from contextlib import contextmanager  # For the writer lock.
+from functools import lru_cache  # Postings of a view never change, so they are cached per view.
+import numpy as np  # Posting arrays.
+from Controller import bitmaps  # Dense terms of the live view.
+from Controller import posting_algebra  # Tombstone filtering on sorted doc-id arrays.
+from Controller.binary_index import (  # On-disk format shared by the base index and every segment.
+    BinaryIndex, binary_index_exists, load_binary_index, save_binary_index, score_bounds, write_binary_index
+)
+from Controller.document_store import clean_filename, sanitize_filename  # File names like create_document.py.
+from Controller.create_document import document_fields, document_text, full_text  # Same text layout as every other game.
+from Controller.cluster_model import CLUSTER_MODEL_PATH, assign_clusters, load_cluster_model  # Clusters for new games.
+from Controller.analyzer import analyzer  # Same text processing as the full index build.
+from Controller.positions import encode_position_lists, list_offsets, positions_to_text  # Position lists of new and merged games.
+
+
+# Incremental updates. New and changed games are written to small append-only segments
+# next to the base index instead of rebuilding everything; deletions are tombstones.
+# Readers combine base + segments into one live view, and merge_segments folds the
+# segments back into a new base once there are enough of them.
+#
+# dataset/segments/manifest.json:
+#   generation         bumped on every change; readers reload when it moves
+#   base               merged base index directory inside the segments dir, or null
+#                      for the index built by the full pipeline (dataset/inverted_index_bin)
+#   segments           append-only list of {"name": segment dir or null, "deletes": [doc ids]};
+#                      "deletes" are games removed or replaced when the entry was written and
+#                      hide those games' postings in the base and all earlier segments
+#   next_doc_id        id for the next new game
+#   removed_documents  games from dataset/document that were deleted and merged away
+#
+# Every segment directory is a binary index (binary_index.py) plus documents.json holding
+# the new games' metadata: {doc_id: {"original_name", "sanitized_name", "content"}}.
+SEGMENTS_DIR = "dataset/segments"
+BASE_INDEX_DIR = "dataset/inverted_index_bin"
+MANIFEST_FILE = "manifest.json"
+DOCUMENTS_FILE = "documents.json"
+LOCK_FILE = "write.lock"
+# A writer lock older than this is broken even when its pid is running (the pid was reused)
+LOCK_STALE_SECONDS = 6 * 3600
+
+
+def empty_manifest():
+    return {'generation': 0, 'base': None, 'segments': [], 'next_doc_id': None, 'removed_documents': []}
+
+
+def manifest_path(segments_dir=SEGMENTS_DIR):
+    return os.path.join(segments_dir, MANIFEST_FILE)
+
+
+def read_manifest(segments_dir=SEGMENTS_DIR):
+    path = manifest_path(segments_dir)
+    if not os.path.exists(path):
+        return empty_manifest()
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Publish a new manifest atomically; readers see either the old or the new one
+def write_manifest(manifest, segments_dir=SEGMENTS_DIR):
+    manifest['generation'] += 1
+    path = manifest_path(segments_dir)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+# Whether process `pid` is running on this machine
+def process_running(pid):
+    if os.name == 'nt':  # os.kill would terminate it; the lock's age decides instead
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Owner of a lock file ({"pid", "time"}), or None when it can't be read
+def read_lock(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            owner = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return owner if isinstance(owner, dict) and {'pid', 'time'} <= owner.keys() else None
+
+
+# A lock is stale when its writer is gone: its pid isn't running, or it is older than
+# LOCK_STALE_SECONDS (an unreadable lock is judged by its mtime)
+def lock_is_stale(path, owner):
+    try:
+        locked_at = owner['time'] if owner else os.path.getmtime(path)
+    except OSError:
+        return False
+    if time.time() - locked_at > LOCK_STALE_SECONDS:
+        return True
+    return owner is not None and not process_running(owner['pid'])
+
+
+# Only one writer (add, delete or merge) at a time, across processes. The lock file records
+# the writer's pid and start time so the lock of a crashed writer is broken by the next one.
+@contextmanager
+def writer_lock(segments_dir=SEGMENTS_DIR):
+    os.makedirs(segments_dir, exist_ok=True)
+    path = os.path.join(segments_dir, LOCK_FILE)
+    for attempt in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            owner = read_lock(path)
+            # Re-read before removing, so a lock just taken by another writer is left alone
+            if attempt == 0 and lock_is_stale(path, owner) and read_lock(path) == owner:
+                print(f"Breaking stale writer lock {path} ({owner or 'unreadable'}).")
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            raise RuntimeError(f"Another process is updating the index ({path}: {owner}).")
+    try:
+        os.write(fd, json.dumps({'pid': os.getpid(), 'time': time.time()}).encode('utf-8'))
+        yield
+    finally:
+        os.close(fd)
+        os.remove(path)
+
+
+def load_segment_documents(segment_dir):
+    path = os.path.join(segment_dir, DOCUMENTS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return {int(doc_id): document for doc_id, document in json.load(f).items()}
+
+
+class SegmentedIndex(BinaryIndex):
+    """Live view over a base index and its segments, with the same interface as BinaryIndex.
+
+    `segments` are BinaryIndex objects oldest first (the base is segments[0]) and
+    `deletes[i]` the doc ids removed or replaced when segments[i] was written. A game
+    is live only in the newest segment that holds it, so segments never overlap.
+    """
+
+    def __init__(self, segments, deletes):
+        self.segments = segments
+
+        # Postings of a segment are dead when a later entry deleted or replaced the game
+        self.dead = [None] * len(segments)
+        later = posting_algebra.EMPTY
+        for i in reversed(range(len(segments))):
+            self.dead[i] = later
+            later = posting_algebra.union(later, np.unique(np.asarray(deletes[i], dtype=np.int32)))
+
+        documents, document_clusters, doc_frequency = [], [], {}
+        for segment, dead in zip(segments, self.dead):
+            live = ~posting_algebra.contains(dead, segment.documents)
+            documents.append(np.asarray(segment.documents)[live])
+            document_clusters.append(np.asarray(segment.document_clusters)[live])
+
+            counts = np.diff(segment.offsets)
+            if len(dead):
+                dead_postings = posting_algebra.contains(dead, segment.doc_ids)
+                term_of_posting = np.repeat(np.arange(len(segment.terms)), counts)
+                counts = counts - np.bincount(term_of_posting[dead_postings], minlength=len(segment.terms))
+            for term, count in zip(segment.terms, counts.tolist()):
+                if count:
+                    doc_frequency[term] = doc_frequency.get(term, 0) + count
+
+        documents = np.concatenate(documents)
+        order = np.argsort(documents, kind='stable')
+        self.documents = documents[order].astype(np.int32)
+        self.document_clusters = np.concatenate(document_clusters)[order].astype(np.int16)
+
+        # Term statistics over live games only
+        self.terms = sorted(doc_frequency)
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+        self.live_doc_frequency = np.array([doc_frequency[term] for term in self.terms], dtype=np.int64)
+        self.idf_values = np.log(max(len(self.documents), 1) / (1 + self.live_doc_frequency))
+
+        # Score bounds stay valid upper/lower bounds when some postings are dead
+        self.max_scores = np.full(len(self.terms), -np.inf, dtype=np.float32)
+        self.min_scores = np.full(len(self.terms), np.inf, dtype=np.float32)
+        for segment in segments:
+            ids = np.array([self.term_ids.get(term, -1) for term in segment.terms], dtype=np.int64)
+            known = ids >= 0
+            np.maximum.at(self.max_scores, ids[known], segment.max_scores[known])
+            np.minimum.at(self.min_scores, ids[known], segment.min_scores[known])
+
+        self._build_bitmaps(bitmaps.dense_terms(self.live_doc_frequency, len(self.documents)))
+        self._build_cluster_docs()
+        self.postings = lru_cache(maxsize=4096)(self._live_postings)
+        self.has_positions = all(segment.has_positions for segment in segments if len(segment.documents))
+
+    # Live postings of a term in every segment, in segment order
+    def segment_postings(self, term):
+        for segment, dead in zip(self.segments, self.dead):
+            if term not in segment.term_ids:
+                continue
+            doc_ids, scores, clusters = segment.postings(term)
+            if len(dead):
+                live = ~posting_algebra.contains(dead, doc_ids)
+                doc_ids, scores, clusters = doc_ids[live], scores[live], clusters[live]
+            if len(doc_ids):
+                yield segment, doc_ids, scores, clusters
+
+    def _live_postings(self, term):
+        parts = list(self.segment_postings(term))
+        if not parts:
+            return posting_algebra.EMPTY, np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int16)
+        if len(parts) == 1:
+            return parts[0][1:]
+        doc_ids = np.concatenate([part[1] for part in parts])
+        order = np.argsort(doc_ids, kind='stable')
+        return (doc_ids[order],
+                np.concatenate([part[2] for part in parts])[order],
+                np.concatenate([part[3] for part in parts])[order])
+
+    def doc_frequency(self, term):
+        return int(self.live_doc_frequency[self.term_ids[term]]) if term in self.term_ids else 0
+
+    # Positions of a term in the sorted `doc_ids`, read from the segment holding each game
+    def term_positions(self, term, doc_ids):
+        parts = [segment.term_positions(term, posting_algebra.intersect(doc_ids, live_doc_ids))
+                 for segment, live_doc_ids, _, _ in self.segment_postings(term)]
+        if not parts:
+            return doc_ids[:0], np.empty(0, dtype=np.int64)
+        position_doc_ids = np.concatenate([part[0] for part in parts])
+        order = np.argsort(position_doc_ids, kind='stable')
+        return position_doc_ids[order], np.concatenate([part[1] for part in parts])[order]
+
+
+EMPTY_SEGMENT = BinaryIndex.from_dict({})
+
+
+# Combine a base index and loaded segments into the live index readers should search
+def live_index(base, manifest, segment_indexes):
+    if not manifest['segments']:
+        return base
+    segments = [base] + [segment_indexes.get(entry['name'], EMPTY_SEGMENT) for entry in manifest['segments']]
+    deletes = [[]] + [entry['deletes'] for entry in manifest['segments']]
+    return SegmentedIndex(segments, deletes)
+
+
+def load_base_index(manifest, segments_dir=SEGMENTS_DIR, base_dir=BASE_INDEX_DIR):
+    path = os.path.join(segments_dir, manifest['base']) if manifest['base'] else base_dir
+    if not binary_index_exists(path):
+        raise RuntimeError(f"No binary index at {path}; run python -m Controller.kmeans_clustering first.")
+    return load_binary_index(path)
+
+
+# Load everything a writer needs: the manifest, the base index and every segment
+def load_index_parts(segments_dir=SEGMENTS_DIR, base_dir=BASE_INDEX_DIR):
+    manifest = read_manifest(segments_dir)
+    segment_indexes = {
+        entry['name']: load_binary_index(os.path.join(segments_dir, entry['name']))
+        for entry in manifest['segments'] if entry['name']
+    }
+    return manifest, load_base_index(manifest, segments_dir, base_dir), segment_indexes
+
+
+def add_documents(records, segments_dir=SEGMENTS_DIR, base_dir=BASE_INDEX_DIR, model_path=CLUSTER_MODEL_PATH):
+    """Index new or changed games into a new segment; returns their doc ids.
+
+    `records` are dicts with the steam_uncleaned.csv columns. A record with an 'id'
+    replaces that game, otherwise it gets the next free id. Scores use the idf of the
+    catalog after the change; games already indexed keep their scores until the next merge.
+    New games join the cluster of the nearest saved K-Means centroid (-1 without a model).
+    """
+    with writer_lock(segments_dir):
+        manifest, base, segment_indexes = load_index_parts(segments_dir, base_dir)
+        view = live_index(base, manifest, segment_indexes)
+        next_doc_id = manifest['next_doc_id'] or (int(view.documents.max()) + 1 if len(view.documents) else 1)
+
+        new_documents = {}
+        for record in records:
+            if record.get('id') is not None:
+                doc_id = int(record['id'])
+            else:
+                doc_id = next_doc_id
+                next_doc_id += 1
+            new_documents[doc_id] = record
+        doc_ids = list(new_documents)
+
+        # Catalog statistics once the replaced games are gone and the new ones are in
+        replaced = sorted(set(doc_ids) & set(view.documents.tolist()))
+        remaining = live_index(base, {'segments': manifest['segments'] + [{'name': None, 'deletes': replaced}]},
+                               segment_indexes)
+        texts = {doc_id: document_text(record) for doc_id, record in new_documents.items()}
+        # Positions are recorded when the base index has them, so phrase queries keep working
+        if base.has_positions:
+            term_positions = {doc_id: {} for doc_id in texts}
+            for doc_id, text in texts.items():
+                for term, position in analyzer.analyze_positions(full_text(text)):
+                    term_positions[doc_id].setdefault(term, []).append(position)
+            term_counts = {doc_id: Counter({term: len(offsets) for term, offsets in term_positions[doc_id].items()})
+                           for doc_id in texts}
+        else:
+            term_counts = {doc_id: Counter(terms)
+                           for doc_id, terms in zip(texts, analyzer.analyze_many(map(full_text, texts.values())))}
+        field_tfs = {doc_id: analyzer.analyze_fields(document_fields(text)) for doc_id, text in texts.items()}
+        new_doc_frequency = Counter(term for counts in term_counts.values() for term in counts)
+        new_doc_frequency.update(term for tfs in field_tfs.values() for term in tfs)
+        document_count = len(remaining.documents) + len(doc_ids)
+        idf = {
+            term: math.log(document_count / (1 + remaining.doc_frequency(term) + count))
+            for term, count in new_doc_frequency.items()
+        }
+
+        model = load_cluster_model(model_path)
+        if model is not None:
+            clusters = assign_clusters(
+                model,
+                [str(new_documents[doc_id].get('Tags', '')).split(",") for doc_id in doc_ids],
+                [str(new_documents[doc_id].get('Price', 'Unknown')) for doc_id in doc_ids]
+            ).tolist()
+        else:
+            clusters = [-1] * len(doc_ids)
+
+        inverted_index = {}
+        for doc_id, cluster in zip(doc_ids, clusters):
+            doc_length = sum(term_counts[doc_id].values())
+            tfs = {term: count / doc_length for term, count in term_counts[doc_id].items()}
+            tfs.update(field_tfs[doc_id])
+            for term, tf in tfs.items():
+                entry = inverted_index.setdefault(term, {'idf': idf[term], 'postings': {}})
+                entry['postings'][str(doc_id)] = {'score': tf * idf[term], 'cluster': int(cluster)}
+            if base.has_positions:
+                for term, offsets in term_positions[doc_id].items():
+                    inverted_index[term].setdefault('positions', {})[str(doc_id)] = positions_to_text(offsets)
+
+        name = f"seg_{manifest['generation'] + 1:06d}"
+        segment_dir = os.path.join(segments_dir, name)
+        write_binary_index(inverted_index, segment_dir)
+        documents = {}
+        for doc_id, record in new_documents.items():
+            original_name = f"{doc_id}_{clean_filename(str(record.get('Name', '')))}.txt"
+            documents[str(doc_id)] = {
+                'original_name': original_name,
+                'sanitized_name': sanitize_filename(original_name),
+                'content': texts[doc_id],
+            }
+        with open(os.path.join(segment_dir, DOCUMENTS_FILE), 'w', encoding='utf-8') as f:
+            json.dump(documents, f, ensure_ascii=False)
+
+        manifest['segments'].append({'name': name, 'deletes': replaced})
+        manifest['next_doc_id'] = next_doc_id
+        write_manifest(manifest, segments_dir)
+        print(f"Added {len(doc_ids)} document(s) in segment {name}.")
+        return doc_ids
+
+
+def delete_documents(doc_ids, segments_dir=SEGMENTS_DIR):
+    """Tombstone games; they disappear from searches as soon as readers refresh."""
+    with writer_lock(segments_dir):
+        manifest = read_manifest(segments_dir)
+        manifest['segments'].append({'name': None, 'deletes': sorted(int(doc_id) for doc_id in doc_ids)})
+        write_manifest(manifest, segments_dir)
+        print(f"Deleted {len(doc_ids)} document(s).")
+
+
+def merge_segments(segments_dir=SEGMENTS_DIR, base_dir=BASE_INDEX_DIR):
+    """Fold all segments and tombstones into a new base index.
+
+    Postings are rescaled to the live idf (score * new_idf / old_idf; a score written with
+    idf 0 is 0 and stays 0). Returns False when there was nothing to merge.
+    """
+    with writer_lock(segments_dir):
+        manifest, base, segment_indexes = load_index_parts(segments_dir, base_dir)
+        if not manifest['segments']:
+            return False
+        view = live_index(base, manifest, segment_indexes)
+
+        offsets = np.zeros(len(view.terms) + 1, dtype=np.int64)
+        doc_id_parts, score_parts, cluster_parts = [], [], []
+        position_count_parts, position_parts = [], []
+        for i, term in enumerate(view.terms):
+            live_idf = float(view.idf_values[i])
+            parts = []
+            for segment, doc_ids, scores, clusters in view.segment_postings(term):
+                segment_idf = segment.idf(term)
+                factor = live_idf / segment_idf if segment_idf != 0 else 1.0
+                parts.append((doc_ids, scores * np.float32(factor), clusters))
+            doc_ids = np.concatenate([part[0] for part in parts])
+            order = np.argsort(doc_ids, kind='stable')
+            doc_id_parts.append(doc_ids[order])
+            score_parts.append(np.concatenate([part[1] for part in parts])[order])
+            cluster_parts.append(np.concatenate([part[2] for part in parts])[order])
+            offsets[i + 1] = offsets[i] + len(doc_ids)
+            if view.has_positions:
+                position_doc_ids, term_positions = view.term_positions(term, doc_id_parts[-1])
+                position_count_parts.append(np.searchsorted(position_doc_ids, doc_id_parts[-1], side='right')
+                                            - np.searchsorted(position_doc_ids, doc_id_parts[-1], side='left'))
+                position_parts.append(term_positions)
+
+        arrays = {
+            'idf': np.asarray(view.idf_values, dtype=np.float64),
+            'offsets': offsets,
+            'doc_ids': np.concatenate(doc_id_parts).astype(np.int32) if doc_id_parts else posting_algebra.EMPTY,
+            'scores': np.concatenate(score_parts).astype(np.float32) if score_parts else np.empty(0, np.float32),
+            'clusters': np.concatenate(cluster_parts).astype(np.int16) if cluster_parts else np.empty(0, np.int16),
+            'documents': view.documents,
+            'document_clusters': view.document_clusters,
+        }
+        arrays['max_scores'], arrays['min_scores'] = score_bounds(offsets, arrays['scores'])
+        if view.has_positions:
+            heap, lengths = encode_position_lists(np.concatenate(position_count_parts), np.concatenate(position_parts))
+            arrays['positions'] = heap
+            arrays['position_offsets'] = list_offsets(lengths)
+
+        name = f"base_{manifest['generation'] + 1:06d}"
+        save_binary_index(view.terms, arrays, os.path.join(segments_dir, name))
+
+        # Carry the metadata of games added through segments into the new base
+        live = set(view.documents.tolist())
+        old_dirs = ([manifest['base']] if manifest['base'] else []) + [e['name'] for e in manifest['segments'] if e['name']]
+        documents = {}
+        for old_dir in old_dirs:
+            documents.update(load_segment_documents(os.path.join(segments_dir, old_dir)))
+        with open(os.path.join(segments_dir, name, DOCUMENTS_FILE), 'w', encoding='utf-8') as f:
+            json.dump({str(doc_id): doc for doc_id, doc in documents.items() if doc_id in live}, f, ensure_ascii=False)
+
+        deleted = {doc_id for entry in manifest['segments'] for doc_id in entry['deletes']} - live
+        manifest['removed_documents'] = sorted(set(manifest['removed_documents']) | deleted)
+        manifest['base'] = name
+        manifest['segments'] = []
+        write_manifest(manifest, segments_dir)
+
+        # Open memory maps in running readers keep working after the files are unlinked
+        for old_dir in old_dirs:
+            shutil.rmtree(os.path.join(segments_dir, old_dir), ignore_errors=True)
+        print(f"Merged {len(old_dirs)} index directories into {name}.")
+        return True
+
+
+# Merge in the background whenever `max_segments` segments have piled up. Start it in one
+# process only (app.py does with STEAM_BACKGROUND_MERGE=1); every process would compete for
+# the writer lock otherwise.
+def start_background_merge(segments_dir=SEGMENTS_DIR, base_dir=BASE_INDEX_DIR, max_segments=8, interval=60):
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                if len(read_manifest(segments_dir)['segments']) >= max_segments:
+                    merge_segments(segments_dir, base_dir)
+            except RuntimeError as e:
+                print(f"Background merge skipped: {e}")
+            except Exception:
+                # Keep the thread alive; the next interval tries again
+                print("Background merge failed:")
+                traceback.print_exc()
+
+    thread = threading.Thread(target=run, name='segment-merge', daemon=True)
+    thread.start()
+    return thread
+
+
+# python -m Controller.segments add <games.csv> | delete <doc id>... | merge
+if __name__ == "__main__":
+    import argparse
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Incremental index updates.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    add_parser = subparsers.add_parser('add', help="index new or changed games from a CSV with the dataset columns")
+    add_parser.add_argument('csv_path')
+    delete_parser = subparsers.add_parser('delete', help="remove games by doc id")
+    delete_parser.add_argument('doc_ids', type=int, nargs='+')
+    subparsers.add_parser('merge', help="fold all segments into a new base index")
+    args = parser.parse_args()
+
+    if args.command == 'add':
+        rows = pd.read_csv(args.csv_path).to_dict('records')
+        add_documents([{column: value for column, value in row.items() if pd.notna(value)} for row in rows])
+    elif args.command == 'delete':
+        delete_documents(args.doc_ids)
+    else:
+        merge_segments()
@@ -0,0 +1,377 @@
+import json  # For the shard manifest.
+import os  # For shard directories and the workers' environment.
+import queue  # Pool of worker lanes shared by concurrent queries.
+import secrets  # Authentication key of the worker connections.
+import subprocess  # One worker process per shard and lane.
+import sys  # For starting workers with the same interpreter.
+import time  # For reporting build and query times.
+from functools import lru_cache  # For caching compiled query plans.
+from multiprocessing.connection import Client, Listener  # Local socket between coordinator and workers.
+import numpy as np  # Splitting postings and merging the shards' top hits.
+from Controller import bitmaps  # Boolean results may be bitmaps; ranking takes arrays.
+from Controller import metrics  # Stage latencies, like unsharded searches.
+from Controller import query_planner  # Plans are compiled once and executed on every shard.
+from Controller import ranking  # Top-k scoring on each shard.
+from Controller.analyzer import analyzer, is_field_term  # Query words -> index terms, like booleanQuerySteam.
+from Controller.binary_index import BinaryIndex, load_binary_index, save_binary_index  # Shards are ordinary binary indexes.
+from Controller.document_store import DocumentData, document_store_exists, load_document_store  # Range filters.
+from Controller.positions import list_offsets  # Position lists of the postings a shard keeps.
+from Controller.query_parser import parse_query, parse_range_term, QuerySyntaxError  # Boolean query grammar.
+from Controller.result_cache import ResultCache  # Merged rankings reused across page turns.
+from Controller.spell_correction import CorrectionIndex  # Typo correction over the global vocabulary.
+
+# Run from the repository root:
+#   python -m Controller.sharding build --shards 4
+#   python -m Controller.sharding search "open world AND NOT zombie" --limit 10
+#
+# Document-partitioned search. The binary index is split by doc id (doc_id % shard count) into
+# shard indexes under dataset/index_shards/, each served by worker processes, so a query uses
+# every core and each process only maps its part of the postings. A worker listens on an
+# authenticated local socket (multiprocessing.connection), which can later be a TCP address on
+# another node, and prints its address for the coordinator to connect to. The coordinator
+# (ShardedSearch) holds the global vocabulary: it parses, spell corrects and plans a query once
+# against the merged document frequencies, sends the plan to every shard, and merges the
+# shards' match counts and top hits.
+#
+# A worker answers one request at a time, so the coordinator starts `lanes` workers per shard
+# (one full set of shards per lane) and every query checks out a lane: up to `lanes` queries
+# run at once. A worker that dies fails the queries using it with {'error': ...} and is
+# restarted.
+#
+# Shards keep the global idf and the global score bounds of every term, so a shard scores and
+# orders its documents exactly like the unsharded index does (top_k sums term scores in score
+# bound order) and the merged ranking is identical. Games added through segments.py are not
+# part of the shards until they are rebuilt.
+
+SHARDS_DIR = 'dataset/index_shards'
+MANIFEST_FILE = 'shards.json'
+AUTHKEY_VARIABLE = 'STEAM_SHARD_AUTHKEY'  # workers read the connection key from the environment
+ADDRESS_PREFIX = 'shard address: '  # line a worker prints once it listens
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_CACHE_DEPTH = 100  # hits merged on a cache miss, like booleanQuerySteam
+
+
+def shard_dir(shards_dir, shard):
+    return os.path.join(shards_dir, f"shard_{shard:03d}")
+
+
+# Split the binary index in `index_dir` into `shard_count` shard indexes
+def build_shards(index_dir='dataset/inverted_index_bin', shards_dir=SHARDS_DIR, shard_count=4):
+    start = time.perf_counter()
+    index = load_binary_index(index_dir)
+    counts = np.diff(index.offsets)
+    posting_terms = np.repeat(np.arange(len(index.terms)), counts)
+    posting_shards = np.asarray(index.doc_ids) % shard_count
+    document_shards = np.asarray(index.documents) % shard_count
+
+    for shard in range(shard_count):
+        keep = posting_shards == shard
+        term_counts = np.bincount(posting_terms[keep], minlength=len(index.terms))
+        terms = np.flatnonzero(term_counts)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(term_counts[terms], out=offsets[1:])
+        documents = document_shards == shard
+        arrays = {
+            'idf': np.asarray(index.idf_values)[terms],
+            'offsets': offsets,
+            'doc_ids': np.asarray(index.doc_ids)[keep],
+            'scores': np.asarray(index.scores)[keep],
+            'clusters': np.asarray(index.clusters)[keep],
+            'documents': np.asarray(index.documents)[documents],
+            'document_clusters': np.asarray(index.document_clusters)[documents],
+            'max_scores': np.asarray(index.max_scores)[terms],
+            'min_scores': np.asarray(index.min_scores)[terms],
+        }
+        if index.has_positions:
+            starts = np.asarray(index.position_offsets[:-1], dtype=np.int64)[keep]
+            lengths = np.asarray(index.position_offsets[1:], dtype=np.int64)[keep] - starts
+            heap_starts = np.cumsum(lengths) - lengths
+            arrays['positions'] = np.asarray(index.positions)[np.repeat(starts - heap_starts, lengths)
+                                                              + np.arange(int(lengths.sum()))]
+            arrays['position_offsets'] = list_offsets(lengths)
+        save_binary_index([index.terms[i] for i in terms.tolist()], arrays, shard_dir(shards_dir, shard))
+
+    with open(os.path.join(shards_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'shard_count': shard_count, 'source': index_dir, 'document_count': len(index.documents)}, f)
+    print(f"Split {len(index.documents)} documents into {shard_count} shards in {time.perf_counter() - start:.1f}s.")
+
+
+# Match and rank a plan on one shard: (match count, best doc ids, their scores and clusters)
+def rank_shard(index, document_data, plan, limit):
+    term_positions = index.term_positions if index.has_positions else None
+    result = bitmaps.to_array(query_planner.execute(
+        plan, lambda term: query_planner.index_postings(index, document_data, term), index.document_set(),
+        term_positions))
+    if len(result) == 0:
+        return 0, result, np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int16)
+    term_postings = [index.scored_postings(term) for term in query_planner.scoring_terms(plan)]
+    doc_ids, scores = ranking.top_k(result, term_postings, limit)
+    return len(result), doc_ids, scores, index.clusters_of(doc_ids)
+
+
+# Worker process: serve the shard in `directory` over one connection from the coordinator, until
+# it sends None or goes away. Requests are ('vocabulary', None) and ('search', (plan, limit));
+# failures are answered with {'error': ...}.
+def serve_shard(directory):
+    index = load_binary_index(directory)
+    document_data = DocumentData(load_document_store()) if document_store_exists() else DocumentData()
+    with Listener(authkey=bytes.fromhex(os.environ[AUTHKEY_VARIABLE])) as listener:
+        print(f"{ADDRESS_PREFIX}{listener.address}", flush=True)
+        # The coordinator stops reading stdout once connected
+        sys.stdout = sys.stderr
+        connection = listener.accept()
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        kind, payload = request
+        try:
+            if kind == 'vocabulary':
+                connection.send((index.terms, np.diff(index.offsets), np.asarray(index.documents),
+                                 np.asarray(index.document_clusters)))
+            elif kind == 'search':
+                connection.send(rank_shard(index, document_data, *payload))
+            else:
+                connection.send({'error': f"Unknown request '{kind}'."})
+        except Exception as e:
+            connection.send({'error': f"Shard {directory}: {e}"})
+    connection.close()
+
+
+class ShardWorker:
+    """A worker process serving one shard, and the coordinator's connection to it."""
+
+    def __init__(self, directory, authkey, env):
+        self.directory = directory
+        self.authkey = authkey
+        self.connection = None
+        self.process = subprocess.Popen([sys.executable, '-m', 'Controller.sharding', 'serve', directory],
+                                        env=env, stdout=subprocess.PIPE, text=True)
+
+    # Wait for the worker to load its shard and connect to it
+    def connect(self):
+        for line in self.process.stdout:
+            if line.startswith(ADDRESS_PREFIX):
+                self.connection = Client(line[len(ADDRESS_PREFIX):].strip(), authkey=self.authkey)
+                self.process.stdout.close()
+                return self
+            print(line, end='')
+        raise RuntimeError(f"Shard worker for {self.directory} exited with code {self.process.wait()}.")
+
+    def close(self):
+        try:
+            self.connection.send(None)
+            self.process.wait(timeout=10)
+        except (AttributeError, OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+
+
+class ShardCatalog(BinaryIndex):
+    """Terms, document frequencies and clusters of every shard, without postings.
+
+    Stands in for booleanQuerySteam.inverted_index in a coordinator process, for game pages,
+    related games and suggestions; searches go to the shards.
+    """
+
+    def __init__(self, doc_frequencies, documents, document_clusters):
+        terms = sorted(doc_frequencies)
+        order = np.argsort(documents, kind='stable')
+        no_scores = np.zeros(len(terms), dtype=np.float32)
+        super().__init__(terms, {
+            'idf': np.zeros(len(terms), dtype=np.float64),
+            'offsets': np.zeros(len(terms) + 1, dtype=np.int64),
+            'doc_ids': np.empty(0, dtype=np.int32),
+            'scores': np.empty(0, dtype=np.float32),
+            'clusters': np.empty(0, dtype=np.int16),
+            'documents': documents[order].astype(np.int32),
+            'document_clusters': document_clusters[order].astype(np.int16),
+            'max_scores': no_scores,
+            'min_scores': no_scores,
+            'dense_terms': np.empty(0, dtype=np.int32),
+        })
+        self.frequencies = np.array([doc_frequencies[term] for term in terms], dtype=np.int64)
+
+    def doc_frequency(self, term):
+        return int(self.frequencies[self.term_ids[term]]) if term in self.term_ids else 0
+
+
+# Whether a cached ranking holds the best `limit` hits
+def covers(cached, limit):
+    return len(cached.doc_ids) == cached.total or (limit is not None and limit <= len(cached.doc_ids))
+
+
+class ShardedSearch:
+    """Coordinator of the shard workers: plans queries once and merges the shards' hits.
+
+    `ranked_search` has the same contract as booleanQuerySteam.ranked_search, so its
+    results can be passed to booleanQuerySteam.describe_results.
+    """
+
+    def __init__(self, shards_dir=SHARDS_DIR, lanes=2):
+        with open(os.path.join(shards_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        # Workers are fresh interpreters (python -m Controller.sharding serve), not copies of
+        # this process
+        self.authkey = secrets.token_bytes(32)
+        self.env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get('PYTHONPATH')])))
+        self.env[AUTHKEY_VARIABLE] = self.authkey.hex()
+        self.shard_dirs = [shard_dir(shards_dir, shard) for shard in range(self.manifest['shard_count'])]
+        workers = [[ShardWorker(directory, self.authkey, self.env) for directory in self.shard_dirs]
+                   for _ in range(lanes)]
+        self.lane_count = lanes
+        self.lanes = queue.Queue()
+        for lane in workers:
+            self.lanes.put([worker.connect() for worker in lane])
+        self.result_cache = ResultCache(max_entries=256, ttl=300)
+
+        # Global document frequencies are the sums of the shards' ones
+        answers = self._scatter(('vocabulary', None))
+        if isinstance(answers, dict):
+            raise RuntimeError(answers['error'])
+        doc_frequencies = {}
+        for terms, frequencies, _, _ in answers:
+            for term, frequency in zip(terms, frequencies.tolist()):
+                doc_frequencies[term] = doc_frequencies.get(term, 0) + frequency
+        self.catalog = ShardCatalog(doc_frequencies, np.concatenate([answer[2] for answer in answers]),
+                                    np.concatenate([answer[3] for answer in answers]))
+        self.document_count = len(self.catalog.documents)
+        self.correction_index = CorrectionIndex(term for term in doc_frequencies if not is_field_term(term))
+        self.compile_query = lru_cache(maxsize=1024)(self._compile_query)
+        print(f"Serving {self.document_count} documents from {len(self.shard_dirs)} shards ({lanes} lanes).")
+
+    # Send a request to every shard of a free lane, then collect the answers; the shards work in
+    # parallel. Workers that fail are restarted and the request answered with {'error': ...}.
+    def _scatter(self, request):
+        lane = self.lanes.get()
+        try:
+            answers, failed = [None] * len(lane), []
+            for shard, worker in enumerate(lane):
+                try:
+                    worker.connection.send(request)
+                except (OSError, EOFError):
+                    failed.append(shard)
+            for shard, worker in enumerate(lane):
+                if shard not in failed:
+                    try:
+                        answers[shard] = worker.connection.recv()
+                    except (OSError, EOFError):
+                        failed.append(shard)
+            for shard in failed:
+                lane[shard] = self._restart(lane[shard])
+        finally:
+            self.lanes.put(lane)
+        if failed:
+            return {'error': f"Search shard {min(failed)} is unavailable, please try again."}
+        return answers
+
+    # A new worker in place of a failed one; the failed one is kept when the new one can't start
+    # (the next request tries again)
+    def _restart(self, worker):
+        print(f"Restarting the shard worker for {worker.directory}.")
+        worker.close()
+        try:
+            return ShardWorker(worker.directory, self.authkey, self.env).connect()
+        except (OSError, RuntimeError) as e:
+            print(f"Shard worker for {worker.directory} failed to start: {e}")
+            return worker
+
+    def normalize_term(self, word):
+        term = analyzer.normalize(word)
+        if term is None:
+            return None
+        with metrics.timed(metrics.search_stages, 'correction'):
+            return self.correction_index.closest(term, cutoff=0.8)
+
+    # Range pseudo terms are never planned away; the shards evaluate them
+    def doc_frequency(self, term):
+        if parse_range_term(term) is not None:
+            return self.document_count
+        return self.catalog.doc_frequency(term)
+
+    def _compile_query(self, query):
+        with metrics.timed(metrics.search_stages, 'parse'):
+            ast = parse_query(query)
+        with metrics.timed(metrics.search_stages, 'plan'):
+            return query_planner.plan_query(ast, self.normalize_term, self.doc_frequency,
+                                            self.document_count, analyzer.field_terms)
+
+    # Best `limit` hits of every shard merged into the global best `limit`
+    def rank_plan(self, plan, limit=None):
+        with metrics.timed(metrics.search_stages, 'shards'):
+            answers = self._scatter(('search', (plan, limit)))
+        if isinstance(answers, dict):
+            return answers
+        errors = [answer for answer in answers if isinstance(answer, dict)]
+        if errors:
+            return errors[0]
+        doc_ids = np.concatenate([answer[1] for answer in answers])
+        scores = np.concatenate([answer[2] for answer in answers])
+        clusters = np.concatenate([answer[3] for answer in answers])
+        order = np.lexsort((doc_ids, -scores))[:limit]
+        return ranking.SearchResults(sum(answer[0] for answer in answers), doc_ids[order], scores[order],
+                                     clusters[order])
+
+    def ranked_search(self, query, limit=None):
+        if not query.strip():
+            return self.rank_plan(query_planner.EMPTY, limit)
+        start = time.perf_counter()
+        try:
+            plan = self.compile_query(query)
+        except QuerySyntaxError as e:
+            return {'error': str(e)}
+
+        cached = self.result_cache.get(plan, 0, lambda ranked: covers(ranked, limit))
+        if cached is None:
+            cached = self.rank_plan(plan, None if limit is None else max(limit, RESULT_CACHE_DEPTH))
+            if isinstance(cached, dict):
+                return cached
+            self.result_cache.put(plan, 0, cached)
+        metrics.search_stages.observe('search', time.perf_counter() - start)
+        return ranking.SearchResults(cached.total, cached.doc_ids[:limit], cached.scores[:limit],
+                                     cached.clusters[:limit])
+
+    def close(self):
+        for _ in range(self.lane_count):
+            for worker in self.lanes.get():
+                worker.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Split the index into shards and search them in parallel.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help="split the binary index into shards")
+    build_parser.add_argument('--index', default='dataset/inverted_index_bin')
+    build_parser.add_argument('--output', default=SHARDS_DIR)
+    build_parser.add_argument('--shards', type=int, default=os.cpu_count() or 1)
+    serve_parser = subparsers.add_parser('serve', help="serve one shard (started by the coordinator)")
+    serve_parser.add_argument('directory')
+    search_parser = subparsers.add_parser('search', help="run queries against the shards")
+    search_parser.add_argument('queries', nargs='+')
+    search_parser.add_argument('--shards-dir', default=SHARDS_DIR)
+    search_parser.add_argument('--limit', type=int, default=10)
+    search_parser.add_argument('--lanes', type=int, default=2, help="queries served at once")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_shards(args.index, args.output, args.shards)
+    elif args.command == 'serve':
+        serve_shard(args.directory)
+    else:
+        sharded_search = ShardedSearch(args.shards_dir, args.lanes)
+        for query in args.queries:
+            started = time.perf_counter()
+            results = sharded_search.ranked_search(query, args.limit)
+            elapsed = (time.perf_counter() - started) * 1000
+            if isinstance(results, dict):
+                print(f"{query!r}: {results['error']}")
+                continue
+            print(f"{query!r}: {results.total} matches in {elapsed:.1f} ms")
+            for doc_id, score in zip(results.doc_ids.tolist(), results.scores.tolist()):
+                print(f"  {doc_id:>8} {score:.6f}")
+        sharded_search.close()
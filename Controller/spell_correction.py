@@ -0,0 +1,75 @@
+import difflib  # Final ranking, so results match difflib.get_close_matches exactly.
+from collections import Counter  # Character counts of a word.
+from functools import lru_cache  # For caching repeated misspellings.
+import numpy as np  # Vectorized candidate filtering.
+
+
+class CorrectionIndex:
+    """Finds the closest vocabulary term like difflib.get_close_matches(word, vocabulary, n=1, cutoff).
+
+    difflib runs a SequenceMatcher against every vocabulary term. Its two cheap upper bounds,
+    real_quick_ratio (lengths only) and quick_ratio (shared character counts), are evaluated
+    here for the whole vocabulary at once from length-sorted character counts, and only the few
+    terms that pass both are handed to difflib for the exact ratio. The counts are stored
+    sparsely, by character (CSR): a term only has entries for the characters it contains.
+    """
+
+    def __init__(self, vocabulary, cache_size=4096):
+        # Sort by length so every length is one contiguous block
+        self.vocabulary = sorted(vocabulary, key=len)
+        self.vocabulary_set = set(self.vocabulary)
+        self.alphabet = {ch: i for i, ch in enumerate(sorted({ch for word in self.vocabulary for ch in word}))}
+
+        lengths = np.array([len(word) for word in self.vocabulary], dtype=np.int64)
+        self.lengths, self.length_starts = np.unique(lengths, return_index=True)
+        self.length_ends = np.append(self.length_starts[1:], len(self.vocabulary))
+
+        # Rows (ascending) and counts of the terms containing each character
+        characters, rows, counts = [], [], []
+        for i, word in enumerate(self.vocabulary):
+            for ch, count in Counter(word).items():
+                characters.append(self.alphabet[ch])
+                rows.append(i)
+                counts.append(count)
+        characters = np.array(characters, dtype=np.int32)
+        order = np.argsort(characters, kind='stable')
+        self.char_offsets = np.zeros(len(self.alphabet) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(characters, minlength=len(self.alphabet)), out=self.char_offsets[1:])
+        self.char_rows = np.array(rows, dtype=np.int32)[order]
+        self.char_counts = np.array(counts, dtype=np.uint16)[order]
+
+        self.closest = lru_cache(maxsize=cache_size)(self._closest)
+
+    # Closest term scoring at least `cutoff`, or the word itself when nothing qualifies
+    def _closest(self, word, cutoff=0.8):
+        if word in self.vocabulary_set or not self.vocabulary:
+            return word
+        candidates = self.candidates(word, cutoff)
+        matches = difflib.get_close_matches(word, candidates, n=1, cutoff=cutoff)
+        return matches[0] if matches else word
+
+    # Terms whose real_quick_ratio and quick_ratio against `word` both reach `cutoff`
+    def candidates(self, word, cutoff=0.8):
+        length = len(word)
+        # real_quick_ratio, computed exactly like difflib does, per distinct term length
+        total = self.lengths + length
+        real_quick = 2.0 * np.minimum(self.lengths, length) / total
+        blocks = np.flatnonzero(real_quick >= cutoff)
+        if len(blocks) == 0:
+            return []
+        start, end = self.length_starts[blocks[0]], self.length_ends[blocks[-1]]
+
+        # quick_ratio: characters shared with each term, counting duplicates
+        matches = np.zeros(end - start, dtype=np.int64)
+        for ch, count in Counter(word).items():
+            column = self.alphabet.get(ch)
+            if column is None:
+                continue
+            rows = self.char_rows[self.char_offsets[column]:self.char_offsets[column + 1]]
+            counts = self.char_counts[self.char_offsets[column]:self.char_offsets[column + 1]]
+            first, last = np.searchsorted(rows, (start, end))
+            matches[rows[first:last] - start] += np.minimum(counts[first:last], count)
+        term_lengths = np.repeat(self.lengths[blocks[0]:blocks[-1] + 1],
+                                 self.length_ends[blocks[0]:blocks[-1] + 1] - self.length_starts[blocks[0]:blocks[-1] + 1])
+        quick = 2.0 * matches / (term_lengths + length)
+        return [self.vocabulary[start + i] for i in np.flatnonzero(quick >= cutoff).tolist()]
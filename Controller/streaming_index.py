@@ -0,0 +1,282 @@
+import heapq  # For the k-way merge of sorted runs.
+import json  # For run term lists and the packed export.
+import math  # For idf, computed exactly like indexing.py.
+import os  # For run files and input discovery.
+import shutil  # For removing spilled runs after the merge.
+import tempfile  # For the spill directory.
+import time  # For reporting throughput.
+from array import array  # Compact in-memory posting buffers.
+from collections import deque  # Batches in flight in the worker pool.
+from itertools import groupby  # For collecting one term's postings from every run.
+from multiprocessing import Pool  # For tokenizing batches in parallel.
+import numpy as np  # Run files and the output arrays.
+from Controller.binary_index import save_binary_index, score_bounds, staging_directory  # Output format loaded by the app.
+from Controller.cluster_model import CLUSTER_MODEL_PATH, assign_clusters, load_cluster_model  # Optional clusters.
+from Controller.create_document import document_fields, document_text, full_text, iter_packed_documents  # Same documents as the other inputs.
+from Controller.analyzer import analyzer  # Same text processing as the in-memory indexer and the queries.
+
+# Run from the repository root:
+#   python -m Controller.streaming_index dataset/steam_uncleaned.csv --memory-mb 256
+#
+# Builds the same binary index as indexing.py followed by binary_index.py, for inputs too big
+# to hold in memory: documents are streamed and tokenized in batches, postings are buffered
+# until the memory budget is reached and then spilled to disk as a run sorted by term, and
+# the runs are merged term by term straight into memory mapped output arrays. Peak memory is
+# the posting buffer plus one term's postings during the merge, plus the term dictionary.
+# When `output_dir` already holds an index, the merge writes a new generation next to it
+# (binary_index.staging_directory) that only replaces the served index once it is complete.
+
+output_dir = 'dataset/inverted_index_bin'
+
+# Rough cost of buffered postings: a doc id (int32) and a tf (float64) in array buffers,
+# plus the dict entry and the two arrays of every term in the buffer
+POSTING_BYTES = 12
+TERM_BYTES = 250
+
+
+# (doc_id, text) of every game in a CSV (ids are row numbers + 1, like create_document.py),
+# a packed .jsonl export or a directory of .txt files
+def stream_documents(input_path, csv_chunk_size=10000):
+    if input_path.endswith('.csv'):
+        import pandas as pd  # Only needed for CSV input.
+
+        doc_id = 1
+        for chunk in pd.read_csv(input_path, chunksize=csv_chunk_size):
+            for record in chunk.to_dict('records'):
+                yield doc_id, document_text(record)
+                doc_id += 1
+    elif input_path.endswith('.jsonl'):
+        for document in iter_packed_documents(input_path):
+            yield document['id'], document['content']
+    else:
+        for filename in os.listdir(input_path):
+            if filename.endswith('.txt'):
+                with open(os.path.join(input_path, filename), 'r', encoding='utf-8') as f:
+                    yield int(filename.split('_')[0]), f.read()
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Tags and price line of a document text, for clustering new games
+def tags_and_price(content):
+    tags, price = [], 'Unknown'
+    for line in content.splitlines():
+        if line.startswith("Price:"):
+            price = line[len("Price:"):].strip()
+        elif line.startswith("Tags:"):
+            tags = line[len("Tags:"):].strip().split(",")
+    return tags, price
+
+
+# Tokenize a batch: (doc_id, {term: tf}, tags, price) per document; the terms are the full-text
+# terms of the name and description plus the field terms (analyzer.FIELDS), whose tf is
+# relative to their field
+def tokenize_batch(batch):
+    tokenized = []
+    for (doc_id, content), tokens in zip(batch, analyzer.analyze_many(full_text(content) for _, content in batch)):
+        term_counts = {}
+        for token in tokens:
+            term_counts[token] = term_counts.get(token, 0) + 1
+        doc_length = sum(term_counts.values())
+        term_tfs = {term: count / doc_length for term, count in term_counts.items()}
+        term_tfs.update(analyzer.analyze_fields(document_fields(content)))
+        tags, price = tags_and_price(content)
+        tokenized.append((doc_id, term_tfs, tags, price))
+    return tokenized
+
+
+# Tokenized batches in input order; at most 2 batches per worker are in flight
+def tokenized_batches(documents, batch_size, workers):
+    batches = batched(documents, batch_size)
+    if workers == 1:
+        yield from map(tokenize_batch, batches)
+        return
+    with Pool(workers) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.apply_async(tokenize_batch, (batch,)))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+class PostingBuffer:
+    """Postings of the documents seen since the last spill, by term."""
+
+    def __init__(self):
+        self.terms = {}
+        self.posting_count = 0
+
+    def add(self, doc_id, term_tfs):
+        for term, tf in term_tfs.items():
+            postings = self.terms.get(term)
+            if postings is None:
+                postings = self.terms[term] = (array('i'), array('d'))
+            postings[0].append(doc_id)
+            postings[1].append(tf)
+        self.posting_count += len(term_tfs)
+
+    def estimated_bytes(self):
+        return self.posting_count * POSTING_BYTES + len(self.terms) * TERM_BYTES
+
+    # Write the buffer as a run sorted by term: terms.json, offsets.npy, doc_ids.npy, tfs.npy
+    def spill(self, run_dir):
+        os.makedirs(run_dir)
+        terms = sorted(self.terms)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(self.terms[term][0]) for term in terms])
+        doc_ids = np.lib.format.open_memmap(os.path.join(run_dir, 'doc_ids.npy'), mode='w+',
+                                            dtype=np.int32, shape=(int(offsets[-1]),))
+        tfs = np.lib.format.open_memmap(os.path.join(run_dir, 'tfs.npy'), mode='w+',
+                                        dtype=np.float64, shape=(int(offsets[-1]),))
+        for i, term in enumerate(terms):
+            ids, term_tfs = self.terms.pop(term)
+            doc_ids[offsets[i]:offsets[i + 1]] = np.frombuffer(ids, dtype=np.int32)
+            tfs[offsets[i]:offsets[i + 1]] = np.frombuffer(term_tfs, dtype=np.float64)
+        doc_ids.flush()
+        tfs.flush()
+        del doc_ids, tfs
+        np.save(os.path.join(run_dir, 'offsets.npy'), offsets)
+        with open(os.path.join(run_dir, 'terms.json'), 'w', encoding='utf-8') as f:
+            json.dump(terms, f, ensure_ascii=False)
+        self.posting_count = 0
+        return int(offsets[-1])
+
+
+# (term, run number, doc_ids, tfs) of a run in term order, read through memory maps
+def read_run(run_dir, run_number):
+    with open(os.path.join(run_dir, 'terms.json'), 'r', encoding='utf-8') as f:
+        terms = json.load(f)
+    offsets = np.load(os.path.join(run_dir, 'offsets.npy'))
+    doc_ids = np.load(os.path.join(run_dir, 'doc_ids.npy'), mmap_mode='r')
+    tfs = np.load(os.path.join(run_dir, 'tfs.npy'), mmap_mode='r')
+    for i, term in enumerate(terms):
+        yield term, run_number, doc_ids[offsets[i]:offsets[i + 1]], tfs[offsets[i]:offsets[i + 1]]
+
+
+# Merge sorted runs into the binary index in `output_dir`. `documents` are the sorted ids of
+# every document with at least one term and `document_clusters` their clusters.
+def merge_runs(run_dirs, output_dir, posting_count, document_count, documents, document_clusters):
+    staging_dir = staging_directory(output_dir)
+    try:
+        return _merge_runs(run_dirs, output_dir, staging_dir, posting_count, document_count, documents,
+                           document_clusters)
+    except BaseException:
+        # A generation that was never published is of no use to anyone
+        if os.path.abspath(staging_dir) != os.path.abspath(output_dir):
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+
+def _merge_runs(run_dirs, output_dir, staging_dir, posting_count, document_count, documents, document_clusters):
+    def output_array(name, dtype):
+        return np.lib.format.open_memmap(os.path.join(staging_dir, f"{name}.npy"), mode='w+',
+                                         dtype=dtype, shape=(posting_count,))
+
+    doc_ids = output_array('doc_ids', np.int32)
+    scores = output_array('scores', np.float32)
+    clusters = output_array('clusters', np.int16)
+
+    terms, idf, offsets = [], [], [0]
+    runs = heapq.merge(*(read_run(run_dir, i) for i, run_dir in enumerate(run_dirs)), key=lambda part: part[:2])
+    for term, parts in groupby(runs, key=lambda part: part[0]):
+        parts = list(parts)
+        term_ids = np.concatenate([part[2] for part in parts])
+        term_tfs = np.concatenate([part[3] for part in parts])
+        order = np.argsort(term_ids, kind='stable')
+        term_ids, term_tfs = term_ids[order], term_tfs[order]
+
+        term_idf = math.log(document_count / (1 + len(term_ids)))
+        start, end = offsets[-1], offsets[-1] + len(term_ids)
+        doc_ids[start:end] = term_ids
+        scores[start:end] = term_tfs * term_idf
+        clusters[start:end] = document_clusters[np.searchsorted(documents, term_ids)]
+        terms.append(term)
+        idf.append(term_idf)
+        offsets.append(end)
+
+    offsets = np.array(offsets, dtype=np.int64)
+    arrays = {
+        'idf': np.array(idf, dtype=np.float64),
+        'offsets': offsets,
+        'doc_ids': doc_ids,
+        'scores': scores,
+        'clusters': clusters,
+        'documents': documents,
+        'document_clusters': document_clusters,
+    }
+    arrays['max_scores'], arrays['min_scores'] = score_bounds(offsets, scores)
+    save_binary_index(terms, arrays, output_dir, staging_dir)
+    return terms, arrays
+
+
+def build_streaming_index(input_path, output_dir=output_dir, memory_mb=256, batch_size=256, workers=1,
+                          spill_dir=None, model_path=CLUSTER_MODEL_PATH):
+    """Index `input_path` with postings memory bounded by `memory_mb`.
+
+    Games are put in the cluster of the nearest saved K-Means centroid when a cluster
+    model exists (see kmeans_clustering.py), otherwise their cluster is -1.
+    """
+    start = time.perf_counter()
+    budget = memory_mb * 1024 * 1024
+    model = load_cluster_model(model_path)
+    run_root = tempfile.mkdtemp(prefix='index_runs_', dir=spill_dir)
+    run_dirs = []
+    buffer = PostingBuffer()
+    posting_count = 0
+    document_count = 0
+    documents, document_clusters = array('i'), array('h')  # every document with at least one term
+
+    try:
+        for batch in tokenized_batches(stream_documents(input_path), batch_size, workers):
+            if model is not None:
+                batch_clusters = assign_clusters(model, [doc[2] for doc in batch], [doc[3] for doc in batch]).tolist()
+            else:
+                batch_clusters = [-1] * len(batch)
+            for (doc_id, term_tfs, _, _), cluster in zip(batch, batch_clusters):
+                document_count += 1
+                if term_tfs:
+                    buffer.add(doc_id, term_tfs)
+                    documents.append(doc_id)
+                    document_clusters.append(cluster)
+            if buffer.estimated_bytes() >= budget:
+                run_dirs.append(os.path.join(run_root, f"run_{len(run_dirs):05d}"))
+                posting_count += buffer.spill(run_dirs[-1])
+        if buffer.posting_count:
+            run_dirs.append(os.path.join(run_root, f"run_{len(run_dirs):05d}"))
+            posting_count += buffer.spill(run_dirs[-1])
+
+        documents = np.frombuffer(documents, dtype=np.int32)
+        order = np.argsort(documents, kind='stable')
+        terms, _ = merge_runs(run_dirs, output_dir, posting_count, document_count,
+                              documents[order], np.frombuffer(document_clusters, dtype=np.int16)[order])
+    finally:
+        shutil.rmtree(run_root, ignore_errors=True)
+
+    elapsed = time.perf_counter() - start
+    print(f"Indexed {document_count} documents ({len(terms)} terms, {posting_count} postings) in "
+          f"{elapsed:.1f}s using {len(run_dirs)} run(s).")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the binary inverted index with bounded memory.")
+    parser.add_argument('input', help="steam CSV, packed .jsonl export or directory of .txt documents")
+    parser.add_argument('--output', default=output_dir)
+    parser.add_argument('--memory-mb', type=int, default=256, help="posting buffer size before spilling a run")
+    parser.add_argument('--batch-size', type=int, default=256, help="documents per tokenizing batch")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--spill-dir', default=None, help="where to write runs (default: system temp dir)")
+    args = parser.parse_args()
+    build_streaming_index(args.input, args.output, args.memory_mb, args.batch_size, args.workers, args.spill_dir)
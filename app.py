@@ -1,11 +1,80 @@
+import json  # NDJSON lines of the batch search API.
+import os  # For the profiling switch.
 import re  # Regular expressions for pattern matching and text processing
-import os  # File path and directory management
-from flask import Flask, render_template, request, jsonify  # Flask framework for web app development
+import threading  # For profiling the thread serving a request.
+import time  # For request latencies.
+from flask import Flask, render_template, request, jsonify, make_response, g, stream_with_context, url_for  # Flask framework for web app development
 from Controller import booleanQuerySteam
 from Controller import relatedGameRecommendation
+from Controller import autocomplete  # Search box suggestions
+from Controller import segments  # Incremental index updates and their background merge
+from Controller import metrics  # Latency histograms, /metrics and the sampling profiler
+from Controller import sharding  # Optional scatter-gather search over index shards
 
 app = Flask(__name__, template_folder='templates')
 
+# Segments are merged by one background thread. Under a WSGI server with several workers,
+# set STEAM_BACKGROUND_MERGE=1 for a single process only (or run python -m Controller.segments
+# merge from cron); `python app.py` starts it itself.
+BACKGROUND_MERGE_ENABLED = os.environ.get('STEAM_BACKGROUND_MERGE') == '1'
+if BACKGROUND_MERGE_ENABLED:
+    segments.start_background_merge()
+
+# With STEAM_PROFILING=1, adding ?profile=1 to a request returns a sampling profile of it
+# instead of the page
+PROFILING_ENABLED = os.environ.get('STEAM_PROFILING') == '1'
+
+# With STEAM_SHARDS=<shards dir> (python -m Controller.sharding build), searches are matched and
+# ranked by the shard worker processes, STEAM_SHARD_LANES (default 2) queries at a time. This
+# process doesn't load the full index: game metadata comes from it, and clusters and the
+# vocabulary for related games and suggestions from the shards' catalog.
+sharded_search = None
+if booleanQuerySteam.SHARDED:
+    sharded_search = sharding.ShardedSearch(os.environ['STEAM_SHARDS'], int(os.environ.get('STEAM_SHARD_LANES', 2)))
+    booleanQuerySteam.use_index(sharded_search.catalog)
+    autocomplete.build_suggestions()
+    # Sharded searches cache their merged rankings in sharded_search.result_cache
+    metrics.register_gauges('steam_result_cache', "Search result cache counters.", sharded_search.result_cache.stats)
+    metrics.register_gauges('steam_plan_cache', "Compiled query plan cache counters.",
+                            lambda: sharded_search.compile_query.cache_info()._asdict())
+
+
+@app.before_request
+def start_request():
+    g.request_start = time.perf_counter()
+    g.profiler = None
+    if PROFILING_ENABLED and request.args.get('profile') == '1':
+        g.profiler = metrics.SamplingProfiler(threading.get_ident()).start()
+
+
+# Streamed responses (/api/search) do their work while the body is sent, after this returns,
+# so latencies are observed when the response is closed and profiled bodies are run here
+@app.after_request
+def finish_request(response):
+    route, start = request.endpoint or 'unknown', g.request_start
+    if g.get('profiler') is not None:
+        response.get_data()
+        report = g.profiler.stop().report()
+        metrics.request_latency.observe(route, time.perf_counter() - start)
+        return app.response_class(report, mimetype='text/plain')
+    response.call_on_close(lambda: metrics.request_latency.observe(route, time.perf_counter() - start))
+    return response
+
+
+# Pick up games added or removed through Controller/segments.py since the last request (the
+# shards only change when they are rebuilt)
+@app.before_request
+def refresh_index():
+    if sharded_search is None and booleanQuerySteam.refresh_index():
+        relatedGameRecommendation.build_tag_index()
+        autocomplete.build_suggestions()
+
+
+def ranked_search(query, limit=None):
+    if sharded_search is not None:
+        return sharded_search.ranked_search(query, limit)
+    return booleanQuerySteam.ranked_search(query, limit)
+
 
 # Route for the main index page
 @app.route('/')
@@ -19,78 +88,132 @@ def search():
     if request.method == 'POST':
         query = request.form['query']
         method = request.form.get('method', 'boolean')
-
-        if method == 'boolean':
-            results = booleanQuerySteam.boolean_search(query)
-        else:
-            return jsonify({"error": f"Unsupported search method '{method}'."})
-
-        if isinstance(results, dict) and 'error' in results:
-            return jsonify(results)
-
         page = 1
     else:
         query = request.args.get('query', '')
         method = request.args.get('method', 'boolean')
+        page = int(request.args.get('page', 1))
 
-        if method == 'boolean':
-            results = booleanQuerySteam.boolean_search(query)
-        else:
-            return jsonify({"error": f"Unsupported search method '{method}'."})
+    per_page = 10
 
-        if isinstance(results, dict) and 'error' in results:
-            return jsonify(results)
+    # Only the hits up to the end of the requested page are ranked
+    if method == 'boolean':
+        results = ranked_search(query, limit=page * per_page)
+    else:
+        return jsonify({"error": f"Unsupported search method '{method}'."})
 
-        page = int(request.args.get('page', 1))
+    if isinstance(results, dict) and 'error' in results:
+        return jsonify(results)
 
-    per_page = 10
-    total_results = len(results)
+    # Metadata is only looked up for the hits on this page
     start = (page - 1) * per_page
     end = start + per_page
-    paginated_results = results[start:end]
-
-    # Add sanitized names for links
-    for result in paginated_results:
-        doc_id = result['id']
-        document = booleanQuerySteam.document_data.get(doc_id, {})
-        result['original_name'] = document.get('original_name', 'Unknown')
-        result['sanitized_name'] = document.get('sanitized_name', 'unknown')
-
-    return render_template(
-        'index.html',
-        query=query,
-        results=paginated_results,
-        total_results=total_results,
-        page=page,
-        per_page=per_page,
-        method=method
-    )
-
-
-# Function to parse game details
-def parse_txt_file(file_path):
-    data = {}
-    try:
-        with open(file_path, 'r') as file:
-            lines = file.readlines()
-            for line in lines:
-                if line.startswith("Name:"):
-                    data['name'] = line[len("Name:"):].strip()
-                elif line.startswith("Price:"):
-                    data['price'] = line[len("Price:"):].strip()
-                elif line.startswith("Release_date:"):
-                    data['release_date'] = line[len("Release_date:"):].strip()
-                elif line.startswith("Review_no:"):
-                    data['review_no'] = line[len("Review_no:"):].strip()
-                elif line.startswith("Review_type:"):
-                    data['review_type'] = line[len("Review_type:"):].strip()
-                elif line.startswith("Tags:"):
-                    data['tags'] = line[len("Tags:"):].strip()
-                elif line.startswith("Description:"):
-                    data['description'] = line[len("Description:"):].strip()
-    except FileNotFoundError:
-        data = None
-    return data
+    paginated_results = booleanQuerySteam.describe_results(results, start, end)
+
+    with metrics.timed(metrics.search_stages, 'render'):
+        return render_template(
+            'index.html',
+            query=query,
+            results=paginated_results,
+            total_results=results.total,
+            page=page,
+            per_page=per_page,
+            method=method
+        )
+
+
+# Completions of a partly typed query, for the search box (called on every keystroke)
+@app.route('/suggest')
+def suggest():
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 5, type=int), 1), 20)
+    suggestions = autocomplete.suggest(query[:200], limit)
+    games = [dict(game, url=url_for('game_details', path=game['sanitized_name'], cluster=game['cluster']))
+             for game in suggestions['games']]
+    return jsonify({'query': query, 'terms': suggestions['terms'], 'games': games})
+
+
+# Limits of the batch search API
+API_MAX_QUERIES = 1000
+API_MAX_LIMIT = 100
+API_FIELDS = ('id', 'score', 'cluster', 'original_name', 'sanitized_name', 'name', 'price', 'release_date',
+              'review_no', 'tags', 'path', 'rec_path')
+
+
+# One query of a batch: a query string, or {"query": ..., "page": 1, "limit": 10, "fields": [...]}.
+# Returns (query, page, limit, fields) or {'error': ...}
+def parse_api_query(item):
+    if isinstance(item, str):
+        item = {'query': item}
+    if not isinstance(item, dict) or not isinstance(item.get('query'), str):
+        return {'error': "Each query must be a string or an object with a 'query' string."}
+    page, limit = item.get('page', 1), item.get('limit', 10)
+    if not isinstance(page, int) or isinstance(page, bool) or page < 1:
+        return {'error': "'page' must be a positive integer."}
+    if not isinstance(limit, int) or isinstance(limit, bool) or not 1 <= limit <= API_MAX_LIMIT:
+        return {'error': f"'limit' must be an integer from 1 to {API_MAX_LIMIT}."}
+    fields = item.get('fields', list(API_FIELDS))
+    if not isinstance(fields, list) or any(field not in API_FIELDS for field in fields):
+        return {'error': f"'fields' must be a list of: {', '.join(API_FIELDS)}."}
+    return item['query'], page, limit, fields
+
+
+# Batch search for programmatic clients. The body is {"queries": [...]} (or just the list);
+# results stream back as NDJSON, one line per query in request order:
+# {"index": i, "query": ..., "page": ..., "limit": ..., "total": ..., "results": [...]} or
+# {"index": i, "error": ...}
+@app.route('/api/search', methods=['POST'])
+def api_search():
+    body = request.get_json(silent=True)
+    queries = body.get('queries') if isinstance(body, dict) else body
+    if not isinstance(queries, list):
+        return jsonify({'error': "Expected a JSON list of queries or {\"queries\": [...]}."}), 400
+    if len(queries) > API_MAX_QUERIES:
+        return jsonify({'error': f"At most {API_MAX_QUERIES} queries per request."}), 400
+    parsed = [parse_api_query(item) for item in queries]
+
+    # Invalid queries are skipped by the pipeline and reported in place
+    valid = [item for item in parsed if not isinstance(item, dict)]
+    requests = ((query, page * limit) for query, page, limit, _ in valid)
+    if sharded_search is not None:
+        searches = (sharded_search.ranked_search(query, limit) for query, limit in requests)
+    else:
+        searches = booleanQuerySteam.batch_search(requests)
+
+    def lines():
+        for i, item in enumerate(parsed):
+            if isinstance(item, dict):
+                yield json.dumps({'index': i, **item}) + "\n"
+                continue
+            query, page, limit, fields = item
+            results = next(searches)
+            if isinstance(results, dict):
+                yield json.dumps({'index': i, 'query': query, **results}) + "\n"
+                continue
+            hits = booleanQuerySteam.describe_results(results, (page - 1) * limit, page * limit)
+            yield json.dumps({
+                'index': i,
+                'query': query,
+                'page': page,
+                'limit': limit,
+                'total': results.total,
+                'results': [{field: hit[field] for field in fields} for hit in hits],
+            }) + "\n"
+
+    return app.response_class(stream_with_context(lines()), mimetype='application/x-ndjson')
+
+
+# Hit/miss counters of the search result cache
+@app.route('/cache_stats')
+def cache_stats():
+    cache = sharded_search.result_cache if sharded_search is not None else booleanQuerySteam.result_cache
+    return jsonify(cache.stats())
+
+
+# Latency histograms and cache / index gauges in the Prometheus text format
+@app.route('/metrics')
+def prometheus_metrics():
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 
 # Route to display game details and recommend related games
@@ -102,11 +225,22 @@ def extract_numeric_value(input_string):
 
 @app.route('/game_details.html/<string:path>/<int:cluster>')
 def game_details(path,cluster):
-    # Build file path
-    real_path = os.path.join("dataset", "document", path)
+    # The path only identifies the game: its doc id prefix must lead to a game whose
+    # file name is exactly `path`. Nothing is read from the filesystem.
+    match = re.match(r"(\d+)_", path)
+    doc_id = int(match.group(1)) if match else None
+    document = booleanQuerySteam.document_data.get(doc_id)
+    if document is None or document['sanitized_name'] != path:
+        return "Game details not found", 404
+
+    # The page only changes when the index or the game data is reloaded
+    etag = f"{doc_id}-{cluster}-{booleanQuerySteam.data_version()}"
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
 
-    # Parse game details
-    game = parse_txt_file(real_path)
+    game = booleanQuerySteam.document_data.details(doc_id)
     if not game:
         return "Game details not found", 404
 
@@ -114,19 +248,26 @@ def game_details(path,cluster):
     tags = game.get("tags", "").split(",")
     # price = game.get("price", "0")  # Default to "0" if missing
     # price = extract_numeric_value(price)  # Extract only the numeric part
-    doc_id = path.split("_")[0]
 
-    # Get related games
-    related_game_vectors = relatedGameRecommendation.recommend_related_games(tags, cluster, 5, doc_id) #start state
+    # Get related games, from the nightly table when it has this game
+    related_game_vectors = relatedGameRecommendation.cached_related_games(doc_id, cluster, 5)
+    if related_game_vectors is None:
+        related_game_vectors = relatedGameRecommendation.recommend_related_games(tags, cluster, 5, doc_id) #start state
 
     # Render the template
-    return render_template(
-        'game_details.html',
-        game=game,
-        related_games=[vec['game'] for vec in related_game_vectors]
-    )
+    with metrics.timed(metrics.recommend_stages, 'render'):
+        response = make_response(render_template(
+            'game_details.html',
+            game=game,
+            related_games=[vec['game'] for vec in related_game_vectors]
+        ))
+    response.set_etag(etag)
+    response.cache_control.no_cache = True  # browsers revalidate with If-None-Match
+    return response
 
 
 # Run the application
 if __name__ == '__main__':
+    if not BACKGROUND_MERGE_ENABLED:
+        segments.start_background_merge()
     app.run()
@@ -0,0 +1,62 @@
+import os  # For running from the repository root.
+import sys  # For importing app and Controller from the repository root.
+import pytest  # Shared fixtures.
+
+# Run from anywhere: python -m pytest tests. The app and booleanQuerySteam read dataset/
+# relative to the repository root.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from Controller.binary_index import write_binary_index  # Fixture indexes in the binary format.
+from Controller.create_document import document_text  # Same text layout as every other game.
+from Controller.indexing import index_records, merge_shards  # Same pipeline as the full index build.
+
+# A small catalog with the steam_uncleaned.csv columns; enough overlap between games for
+# boolean, phrase and ranked queries to have several hits
+GAMES = [
+    {'Name': "Dark Souls Remastered", 'Tags': "Souls-like,RPG,Dark Fantasy", 'Price': "$39.99",
+     'Release_date': "May 23, 2018", 'Review_no': "85,000", 'Review_type': "Very Positive",
+     'Description': "A dark fantasy action RPG with punishing combat in an open world of dragons."},
+    {'Name': "Open World Racing", 'Tags': "Racing,Open World,Multiplayer", 'Price': "$19.99",
+     'Release_date': "Jan 10, 2020", 'Review_no': "12,000", 'Review_type': "Mostly Positive",
+     'Description': "Race across an open world map with friends in online multiplayer."},
+    {'Name': "Zombie Survival Island", 'Tags': "Survival,Zombies,Open World", 'Price': "Free",
+     'Release_date': "Mar 3, 2019", 'Review_no': "40,500", 'Review_type': "Mixed",
+     'Description': "Survive the zombie outbreak on an open world island, craft weapons and build a base."},
+    {'Name': "Rock and Roll Tycoon", 'Tags': "Simulation,Music,Management", 'Price': "$9.99",
+     'Release_date': "Aug 1, 2015", 'Review_no': "900", 'Review_type': "Positive",
+     'Description': "Manage a rock band from garage gigs to stadium tours."},
+    {'Name': "Space Colony Builder", 'Tags': "Simulation,Space,Base Building", 'Price': "$24.99",
+     'Release_date': "Nov 20, 2021", 'Review_no': "7,300", 'Review_type': "Very Positive",
+     'Description': "Build a colony in space, manage oxygen and survive meteor storms."},
+    {'Name': "Dragon Quest Tactics", 'Tags': "RPG,Strategy,Turn-Based", 'Price': "$29.99",
+     'Release_date': "Feb 14, 2017", 'Review_no': "15,200", 'Review_type': "Positive",
+     'Description': "Turn based tactics with dragons, knights and a dark fantasy story."},
+    {'Name': "Zombie Racing Mayhem", 'Tags': "Racing,Zombies,Action", 'Price': "$4.99",
+     'Release_date': "Oct 31, 2016", 'Review_no': "2,100", 'Review_type': "Mixed",
+     'Description': "Run over zombie hordes in a racing game of pure mayhem."},
+    {'Name': "Quiet Farm Life", 'Tags': "Farming,Relaxing,Simulation", 'Price': "$14.99",
+     'Release_date': "Apr 5, 2022", 'Review_no': "30,000", 'Review_type': "Overwhelmingly Positive",
+     'Description': "Grow crops, raise animals and build a quiet life in the open countryside."},
+]
+
+
+# Binary index (with positions) of `games` written to `directory`; doc ids are 1..len(games)
+# unless given
+def build_index(directory, games=GAMES, doc_ids=None):
+    doc_ids = range(1, len(games) + 1) if doc_ids is None else doc_ids
+    records = [(doc_id, document_text(game)) for doc_id, game in zip(doc_ids, games)]
+    inverted_index, _ = merge_shards([index_records(records, positions=True)])
+    write_binary_index(inverted_index, str(directory))
+    return str(directory)
+
+
+@pytest.fixture
+def games():
+    return [dict(game) for game in GAMES]
+
+
+@pytest.fixture
+def index_dir(tmp_path):
+    return build_index(tmp_path / 'index')
@@ -0,0 +1,61 @@
+import json  # NDJSON lines.
+import os  # Checking for the built dataset.
+import pytest  # Skipping without the dataset.
+
+# The app serves the index and game data built under dataset/ (see README.md)
+if not os.path.exists(os.path.join('dataset', 'inverted_index_bin')):
+    pytest.skip("the binary index in dataset/inverted_index_bin hasn't been built", allow_module_level=True)
+
+import app  # The Flask app under test.
+from Controller import booleanQuerySteam  # Reference searches.
+
+
+@pytest.fixture(scope='module')
+def client():
+    return app.app.test_client()
+
+
+def search_lines(client, body):
+    response = client.post('/api/search', json=body)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+# The batched pipeline answers like one ranked_search per query
+def test_batch_matches_single_searches(client):
+    queries = ["open world", "zombie AND survival", '"dark souls"', "racing NOT zombie", "tag:roguelike",
+               "open world"]
+    lines = search_lines(client, {'queries': queries})
+    assert [line['index'] for line in lines] == list(range(len(queries)))
+    for query, line in zip(queries, lines):
+        expected = booleanQuerySteam.ranked_search(query, 10)
+        assert line['query'] == query and line['page'] == 1 and line['limit'] == 10
+        assert line['total'] == expected.total
+        assert [hit['id'] for hit in line['results']] == expected.doc_ids.tolist()
+
+
+def test_pages_and_fields(client):
+    first, second, both = search_lines(client, [
+        {'query': "open world", 'limit': 5, 'fields': ['id']},
+        {'query': "open world", 'page': 2, 'limit': 5, 'fields': ['id', 'name']},
+        {'query': "open world", 'limit': 10, 'fields': ['id']},
+    ])
+    assert all(list(hit) == ['id'] for hit in first['results'])
+    assert all(list(hit) == ['id', 'name'] for hit in second['results'])
+    assert [hit['id'] for hit in first['results'] + second['results']] == [hit['id'] for hit in both['results']]
+
+
+def test_errors_are_reported_in_place(client):
+    lines = search_lines(client, ["zombie", {'query': "zombie", 'limit': 0}, "(zombie", {'page': 1},
+                                  {'query': "zombie", 'fields': ['secret']}, "racing"])
+    assert 'results' in lines[0] and 'results' in lines[5]
+    assert all('error' in line for line in lines[1:5])
+    assert [line['index'] for line in lines] == list(range(6))
+
+
+def test_bad_bodies(client):
+    assert client.post('/api/search', json={'query': "zombie"}).status_code == 400
+    assert client.post('/api/search', data="not json").status_code == 400
+    too_many = ["zombie"] * (app.API_MAX_QUERIES + 1)
+    assert client.post('/api/search', json=too_many).status_code == 400
@@ -0,0 +1,27 @@
+import random  # Random keys and weights.
+import pytest  # Parametrized seeds.
+from Controller.autocomplete import PrefixIndex  # Prefix completion under test.
+
+
+# Every key with the prefix, heaviest first, ties by key order
+def brute_force(keys, weights, prefix, limit):
+    rows = sorted(range(len(keys)), key=lambda row: (keys[row], row))
+    matches = [(keys[row], weights[row], row) for row in rows if keys[row].startswith(prefix)]
+    order = sorted(range(len(matches)), key=lambda i: (-matches[i][1], i))[:limit]
+    return [(matches[i][0], float(matches[i][1])) for i in order]
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_complete_matches_brute_force(seed):
+    rng = random.Random(seed)
+    keys = ["".join(rng.choice('abc') for _ in range(rng.randint(1, 5))) for _ in range(rng.randint(0, 200))]
+    # Few distinct weights, so ties at the limit are common
+    weights = [rng.choice([1, 2, 5, 5, 5, 9]) for _ in keys]
+    index = PrefixIndex(keys, weights, keys)
+    for prefix in ('', 'a', 'ab', 'ca', 'abc', 'x'):
+        for limit in (1, 3, 5, 50):
+            assert index.complete(prefix, limit) == brute_force(keys, weights, prefix, limit)
+
+
+def test_empty_index():
+    assert PrefixIndex([], [], []).complete('a') == []
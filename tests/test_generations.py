@@ -0,0 +1,56 @@
+import json  # Reading current.json.
+import os  # Generation directories.
+import pytest  # Expected errors.
+from conftest import GAMES, build_index  # Fixture catalog and index builder.
+from Controller import generations  # Atomic publishing under test.
+from Controller.binary_index import binary_index_exists, load_binary_index  # Indexes are published generations.
+from Controller.document_store import build_document_store, document_store_exists, load_document_store  # Stores too.
+
+
+def test_first_build_is_written_in_place(index_dir):
+    assert binary_index_exists(index_dir)
+    assert generations.current_path(index_dir) == index_dir
+    assert not os.path.exists(os.path.join(index_dir, generations.CURRENT_FILE))
+
+
+# Rebuilds never touch the files a reader has mapped; the previous generation is kept
+def test_rebuilds_publish_new_generations(index_dir):
+    reader = load_binary_index(index_dir)
+    files = set(os.listdir(index_dir))
+    build_index(index_dir, GAMES[:4])
+    assert set(os.listdir(index_dir)) == files | {generations.CURRENT_FILE, 'gen_000001'}
+    assert load_binary_index(index_dir).documents.tolist() == [1, 2, 3, 4]
+    assert reader.documents.tolist() == list(range(1, len(GAMES) + 1))
+
+    # The files written in place go once they are no longer the previous generation either
+    build_index(index_dir, GAMES[:2])
+    build_index(index_dir, GAMES[:3])
+    assert sorted(os.listdir(index_dir)) == [generations.CURRENT_FILE, 'gen_000002', 'gen_000003']
+    with open(os.path.join(index_dir, generations.CURRENT_FILE), 'r', encoding='utf-8') as f:
+        assert json.load(f) == {'directory': 'gen_000003'}
+    assert load_binary_index(index_dir).documents.tolist() == [1, 2, 3]
+
+
+def test_incomplete_directory(tmp_path):
+    assert not binary_index_exists(str(tmp_path))
+    assert generations.staging_directory(str(tmp_path / 'new')) == str(tmp_path / 'new')
+    with pytest.raises(FileNotFoundError):
+        load_binary_index(str(tmp_path))
+
+
+def test_document_store_generations(tmp_path):
+    store_dir = str(tmp_path / 'store')
+    csv_path = tmp_path / 'games.csv'
+    pd = pytest.importorskip('pandas')
+    pd.DataFrame(GAMES).to_csv(csv_path, index=False)
+
+    build_document_store(str(csv_path), store_dir)
+    reader = load_document_store(store_dir)
+    assert reader.generation == '.'
+    pd.DataFrame(GAMES[:3]).to_csv(csv_path, index=False)
+    build_document_store(str(csv_path), store_dir)
+    assert document_store_exists(store_dir)
+    store = load_document_store(store_dir)
+    assert store.generation == 'gen_000001' and len(store) == 3
+    # The old reader's memory maps are untouched
+    assert len(reader) == len(GAMES) and reader.string('name', 0) == GAMES[0]['Name']
@@ -0,0 +1,72 @@
+import numpy as np  # Random posting lists.
+import pytest  # Parametrized list sizes.
+from Controller import bitmaps  # Bitmap form of dense posting lists.
+from Controller import posting_algebra  # Operations under test.
+
+
+def random_postings(rng, size, universe):
+    return np.sort(rng.choice(universe, size=min(size, universe), replace=False)).astype(np.int32)
+
+
+def as_set(postings):
+    return set(bitmaps.to_array(postings).tolist())
+
+
+def as_sorted_array(postings):
+    array = bitmaps.to_array(postings)
+    assert array.dtype == np.int32
+    assert np.all(np.diff(array) > 0)
+    return array
+
+
+# Sizes cover the merge path, the galloping path (one list GALLOP_RATIO times longer) and empty lists
+@pytest.mark.parametrize('size_a, size_b', [(0, 0), (0, 50), (40, 60), (5, 900), (900, 5), (300, 300)])
+@pytest.mark.parametrize('form_a, form_b', [('array', 'array'), ('bitmap', 'array'), ('array', 'bitmap'),
+                                            ('bitmap', 'bitmap')])
+def test_operations_match_sets(size_a, size_b, form_a, form_b):
+    rng = np.random.default_rng(size_a * 1000 + size_b)
+    a = random_postings(rng, size_a, 2000)
+    b = random_postings(rng, size_b, 2000)
+    expected_a, expected_b = set(a.tolist()), set(b.tolist())
+    if form_a == 'bitmap':
+        a = bitmaps.from_array(a)
+    if form_b == 'bitmap':
+        b = bitmaps.from_array(b)
+
+    intersection = posting_algebra.intersect(a, b)
+    union = posting_algebra.union(a, b)
+    difference = posting_algebra.difference(a, b)
+    assert as_set(intersection) == expected_a & expected_b
+    assert as_set(union) == expected_a | expected_b
+    assert as_set(difference) == expected_a - expected_b
+    for result in (intersection, union, difference):
+        as_sorted_array(result)
+
+
+def test_many_match_sets():
+    rng = np.random.default_rng(7)
+    lists = [random_postings(rng, size, 5000) for size in (10, 400, 2500, 3000, 60)]
+    lists[2] = bitmaps.from_array(lists[2])
+    sets = [as_set(postings) for postings in lists]
+    assert as_set(posting_algebra.intersect_many(lists)) == set.intersection(*sets)
+    assert as_set(posting_algebra.union_many(lists)) == set.union(*sets)
+    assert len(posting_algebra.intersect_many([])) == 0
+    assert len(posting_algebra.union_many([posting_algebra.EMPTY])) == 0
+
+
+def test_contains():
+    postings = np.array([2, 5, 9], dtype=np.int32)
+    values = np.array([1, 2, 5, 6, 9, 10])
+    assert posting_algebra.contains(postings, values).tolist() == [False, True, True, False, True, False]
+    assert posting_algebra.contains(posting_algebra.EMPTY, values).tolist() == [False] * 6
+
+
+def test_packed_bitmap_matches_arrays():
+    rng = np.random.default_rng(3)
+    a, b = random_postings(rng, 300, 4000), random_postings(rng, 900, 4000)
+    packed_a, packed_b = bitmaps.PackedBitmap.from_array(a), bitmaps.PackedBitmap.from_array(b)
+    assert len(packed_a) == len(a)
+    assert np.array_equal(packed_a.to_array(), a)
+    assert as_set((packed_a & packed_b).to_array()) == set(a.tolist()) & set(b.tolist())
+    assert as_set((packed_a | packed_b).to_array()) == set(a.tolist()) | set(b.tolist())
+    assert as_set((packed_a - packed_b).to_array()) == set(a.tolist()) - set(b.tolist())
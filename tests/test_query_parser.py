@@ -0,0 +1,58 @@
+import pytest  # Parametrized cases and expected errors.
+from Controller.query_parser import (  # Boolean query grammar.
+    And, Field, Near, Not, Or, Phrase, Range, Term, QuerySyntaxError, parse_query, parse_range_term, range_term
+)
+
+
+@pytest.mark.parametrize('query, expected', [
+    ("zombie", Term('zombie')),
+    ("open world", And((Term('open'), Term('world')))),
+    ("zombie AND survival", And((Term('zombie'), Term('survival')))),
+    ("racing OR farming", Or((Term('racing'), Term('farming')))),
+    ("zombie NOT racing", And((Term('zombie'), Not(Term('racing'))))),
+    ("NOT NOT zombie", Not(Not(Term('zombie')))),
+    ("a OR b AND c", Or((Term('a'), And((Term('b'), Term('c')))))),
+    ("(a OR b) AND c", And((Or((Term('a'), Term('b'))), Term('c')))),
+    ('"open world"', Phrase((Term('open'), Term('world')))),
+    ("souls-like", Phrase((Term('souls'), Term('like')))),
+    ("tag:roguelike", Field('tag', 'roguelike')),
+    ('name: "black myth"', Field('name', 'black myth')),
+    ('name:"black myth"', Field('name', 'black myth')),
+    ("desc:dragons", Field('description', 'dragons')),
+    ("price<10", Range('price', '<', 10.0)),
+    ("review_no>=1000", Range('reviews', '>=', 1000.0)),
+    ("souls NEAR/3 like", Near((Term('souls'), Term('like')), 3)),
+    ("a NEAR/3 b NEAR/2 c", And((Near((Term('a'), Term('b')), 3), Near((Term('b'), Term('c')), 2)))),
+])
+def test_parse_query(query, expected):
+    assert parse_query(query) == expected
+
+
+# Only uppercase words are operators
+@pytest.mark.parametrize('query, expected', [
+    ("rock and roll", And((Term('rock'), Term('and'), Term('roll')))),
+    ("not for broadcast", And((Term('not'), Term('for'), Term('broadcast')))),
+    ("this or that", And((Term('this'), Term('or'), Term('that')))),
+    ("a near/2 b", And((Term('a'), Phrase((Term('near'), Term('2'))), Term('b')))),
+])
+def test_lowercase_operators_are_words(query, expected):
+    assert parse_query(query) == expected
+
+
+@pytest.mark.parametrize('query', ["", "   ", "(zombie", "zombie AND", "OR zombie", "zombie )",
+                                   '"open world" NEAR/2 zombie', "tag:"])
+def test_syntax_errors(query):
+    with pytest.raises(QuerySyntaxError):
+        parse_query(query)
+
+
+def test_range_terms_round_trip():
+    for node in (Range('price', '<', 10.0), Range('year', '>=', 2020.0), Range('price', '=', 9.99)):
+        assert parse_range_term(range_term(node)) == node
+    assert parse_range_term("zombie") is None
+    assert parse_range_term("level<10") is None
+
+
+# Trees are hashable, so compiled plans can be cached by query
+def test_trees_are_hashable():
+    assert hash(parse_query("(a OR b) AND NOT tag:c")) == hash(parse_query("(a OR b) AND NOT tag:c"))
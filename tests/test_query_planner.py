@@ -0,0 +1,73 @@
+import pytest  # Parametrized queries.
+from Controller import bitmaps  # Results may be bitmaps.
+from Controller import query_planner  # Planning and execution under test.
+from Controller.analyzer import analyzer  # Query words -> index terms.
+from Controller.binary_index import load_binary_index  # Fixture index.
+from Controller.create_document import document_text, full_text  # Text of every fixture game.
+from Controller.query_parser import And, Near, Not, Or, Phrase, Term, parse_query  # AST nodes.
+
+
+# Positions of every term of every game, straight from the analyzer
+def game_positions(games):
+    positions = {}
+    for doc_id, game in enumerate(games, start=1):
+        terms = positions[doc_id] = {}
+        for term, position in analyzer.analyze_positions(full_text(document_text(game))):
+            terms.setdefault(term, set()).add(position)
+    return positions
+
+
+# Evaluate a parsed query one document at a time, without planning
+def brute_force(node, positions):
+    if isinstance(node, Term):
+        term = analyzer.normalize(node.text)
+        return {doc_id for doc_id, terms in positions.items() if term in terms}
+    if isinstance(node, Phrase):
+        terms = [analyzer.normalize(term.text) for term in node.terms]
+        return {doc_id for doc_id, found in positions.items()
+                if all(term in found for term in terms)
+                and any(all(start + i in found[term] for i, term in enumerate(terms)) for start in found[terms[0]])}
+    if isinstance(node, Near):
+        left, right = (analyzer.normalize(term.text) for term in node.children)
+        return {doc_id for doc_id, found in positions.items()
+                if left in found and right in found
+                and any(abs(a - b) <= node.distance for a in found[left] for b in found[right])}
+    if isinstance(node, Not):
+        return set(positions) - brute_force(node.child, positions)
+    if isinstance(node, And):
+        return set.intersection(*(brute_force(child, positions) for child in node.children))
+    if isinstance(node, Or):
+        return set.union(*(brute_force(child, positions) for child in node.children))
+    raise AssertionError(f"Unexpected node {node!r}")
+
+
+@pytest.mark.parametrize('query', [
+    "zombie", "open world", '"open world"', '"world open"', "zombie AND racing", "zombie OR farm",
+    "open NOT zombie", "(dragon OR zombie) AND NOT racing", "NOT simulation", '"dark fantasy" OR space',
+    "build NEAR/3 base", "build NEAR/1 base", "racing NOT (zombie OR multiplayer)", "NOT zombie NOT racing",
+    "unknownword", "unknownword OR zombie", "NOT unknownword",
+])
+def test_execute_matches_brute_force(index_dir, games, query):
+    index = load_binary_index(index_dir)
+    plan = query_planner.plan_query(parse_query(query), analyzer.normalize, index.doc_frequency,
+                                    len(index.documents), analyzer.field_terms)
+    result = query_planner.execute(plan, index.doc_set, index.document_set(), index.term_positions)
+    assert set(bitmaps.to_array(result).tolist()) == brute_force(parse_query(query), game_positions(games))
+
+
+# Without positions, phrases and NEAR only require all their terms
+def test_phrase_without_positions(index_dir, games):
+    index = load_binary_index(index_dir)
+    plan = query_planner.plan_query(parse_query('"world open"'), analyzer.normalize, index.doc_frequency,
+                                    len(index.documents))
+    result = query_planner.execute(plan, index.doc_set, index.document_set())
+    assert set(bitmaps.to_array(result).tolist()) == brute_force(parse_query("world open"), game_positions(games))
+
+
+def test_field_queries(index_dir):
+    index = load_binary_index(index_dir)
+    plan = query_planner.plan_query(parse_query("tag:racing NOT tag:zombies"), analyzer.normalize,
+                                    index.doc_frequency, len(index.documents), analyzer.field_terms)
+    result = query_planner.execute(plan, index.doc_set, index.document_set(), index.term_positions)
+    assert bitmaps.to_array(result).tolist() == [2]
+    assert query_planner.scoring_terms(plan) == ['tag:racing']
@@ -0,0 +1,52 @@
+import numpy as np  # Random candidates and term postings.
+import pytest  # Parametrized seeds.
+from Controller import ranking  # MaxScore top-k under test.
+
+
+def random_term_postings(rng, universe, term_count, negative=False):
+    term_postings = []
+    for _ in range(term_count):
+        doc_ids = np.sort(rng.choice(universe, size=rng.integers(1, universe), replace=False)).astype(np.int32)
+        scores = rng.random(len(doc_ids)).astype(np.float32)
+        if negative:
+            scores -= np.float32(0.5)
+        # Rounded scores make ties common, so the doc id tie-break is exercised
+        scores = np.round(scores, 1).astype(np.float32)
+        term_postings.append((doc_ids, scores, float(scores.max()), float(scores.min())))
+    return term_postings
+
+
+# Every candidate scored by every term, sorted by score then doc id
+def brute_force(candidates, term_postings, k):
+    totals = {}
+    for doc_id in candidates.tolist():
+        total = 0.0
+        for doc_ids, scores, _, _ in term_postings:
+            position = np.searchsorted(doc_ids, doc_id)
+            if position < len(doc_ids) and doc_ids[position] == doc_id:
+                total += float(scores[position])
+        totals[doc_id] = total
+    best = sorted(totals.items(), key=lambda item: (-item[1], item[0]))[:k]
+    return [doc_id for doc_id, _ in best], [score for _, score in best]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_top_k_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    universe = 300
+    term_postings = random_term_postings(rng, universe, rng.integers(1, 6), negative=seed % 2 == 1)
+    candidates = np.sort(rng.choice(universe, size=rng.integers(1, universe), replace=False)).astype(np.int32)
+    for k in (1, 5, 10, 50, None):
+        doc_ids, scores = ranking.top_k(candidates, term_postings, k)
+        expected_ids, expected_scores = brute_force(candidates, term_postings, len(candidates) if k is None else k)
+        assert doc_ids.tolist() == expected_ids
+        assert np.allclose(scores, expected_scores, atol=1e-5)
+
+
+def test_top_k_edge_cases():
+    candidates = np.array([3, 4], dtype=np.int32)
+    doc_ids, scores = ranking.top_k(candidates, [], 0)
+    assert len(doc_ids) == 0 and len(scores) == 0
+    # Candidates missing from every term score 0 and are ordered by doc id
+    doc_ids, scores = ranking.top_k(candidates, [], 5)
+    assert doc_ids.tolist() == [3, 4] and scores.tolist() == [0.0, 0.0]
@@ -0,0 +1,79 @@
+import os  # Temporary segment directories.
+import numpy as np  # Comparing posting arrays.
+import pytest  # Fixtures.
+from conftest import GAMES, build_index  # Fixture catalog and index builder.
+from Controller import bitmaps  # Results may be bitmaps.
+from Controller import segments  # Incremental updates under test.
+from Controller.binary_index import load_binary_index  # The rebuilt reference index.
+
+NEW_GAME = {'Name': "Zombie Farm", 'Tags': "Farming,Zombies", 'Price': "$5.99", 'Release_date': "Jan 1, 2023",
+            'Review_no': "100", 'Review_type': "Positive",
+            'Description': "Farm crops by day and fight zombie hordes at night."}
+CHANGED_GAME = dict(GAMES[1], Description="Race across a desert map.")
+
+
+@pytest.fixture
+def dirs(tmp_path, index_dir):
+    return {'segments_dir': str(tmp_path / 'segments'), 'base_dir': index_dir}
+
+
+def live_view(dirs):
+    manifest, base, segment_indexes = segments.load_index_parts(**dirs)
+    return segments.live_index(base, manifest, segment_indexes)
+
+
+def doc_ids(index, term):
+    return bitmaps.to_array(index.doc_set(term)).tolist()
+
+
+# Add a game, replace one and delete one
+def apply_changes(dirs, tmp_path):
+    model_path = str(tmp_path / 'no_model.npz')
+    assert segments.add_documents([NEW_GAME], model_path=model_path, **dirs) == [len(GAMES) + 1]
+    assert segments.add_documents([dict(CHANGED_GAME, id=2)], model_path=model_path, **dirs) == [2]
+    segments.delete_documents([7], dirs['segments_dir'])
+
+
+def test_live_view(dirs, tmp_path):
+    apply_changes(dirs, tmp_path)
+    view = live_view(dirs)
+    assert view.documents.tolist() == [1, 2, 3, 4, 5, 6, 8, 9]
+    assert doc_ids(view, 'zombi') == [3, 9]
+    assert doc_ids(view, 'desert') == [2]
+    # The replaced description's words are gone from game 2
+    assert 2 not in doc_ids(view, 'friend')
+    assert view.cluster_of(9) == -1
+    documents = segments.load_segment_documents(os.path.join(dirs['segments_dir'], 'seg_000001'))
+    assert documents[9]['original_name'] == "9_Zombie_Farm.txt"
+
+
+# A merge gives the index a full rebuild of the final catalog would
+def test_merge_matches_rebuild(dirs, tmp_path):
+    apply_changes(dirs, tmp_path)
+    assert segments.merge_segments(**dirs)
+    manifest = segments.read_manifest(dirs['segments_dir'])
+    assert manifest['segments'] == [] and manifest['removed_documents'] == [7]
+    merged = live_view(dirs)
+
+    final = {doc_id: game for doc_id, game in enumerate(GAMES, start=1)}
+    final[2] = CHANGED_GAME
+    final[9] = NEW_GAME
+    del final[7]
+    rebuilt = load_binary_index(build_index(tmp_path / 'rebuilt', list(final.values()), list(final)))
+    assert sorted(rebuilt.terms) == sorted(merged.terms)
+    for term in rebuilt.terms:
+        expected_ids, expected_scores, _ = rebuilt.postings(term)
+        merged_ids, merged_scores, _ = merged.postings(term)
+        assert np.array_equal(expected_ids, merged_ids), term
+        assert np.allclose(expected_scores, merged_scores, atol=1e-5), term
+    assert not segments.merge_segments(**dirs)
+
+
+def test_writer_lock_is_exclusive(dirs):
+    os.makedirs(dirs['segments_dir'])
+    with segments.writer_lock(dirs['segments_dir']):
+        with pytest.raises(RuntimeError):
+            with segments.writer_lock(dirs['segments_dir']):
+                pass
+    with segments.writer_lock(dirs['segments_dir']):
+        pass
@@ -0,0 +1,58 @@
+import numpy as np  # Comparing rankings.
+import pytest  # Module-scoped coordinator.
+from conftest import build_index  # Fixture index builder.
+from Controller import sharding  # Scatter-gather search under test.
+from Controller.binary_index import load_binary_index  # The unsharded index.
+from Controller.document_store import DocumentData  # Range filters need no store here.
+
+QUERIES = ["open world", "zombie OR racing", "dark fantasy", '"open world"', "simulation NOT space",
+           "NOT zombie", "build NEAR/3 base", "tag:racing", "dragn"]
+
+
+@pytest.fixture(scope='module')
+def sharded(tmp_path_factory):
+    root = tmp_path_factory.mktemp('sharding')
+    index_dir = build_index(root / 'index')
+    sharding.build_shards(index_dir, str(root / 'shards'), shard_count=3)
+    search = sharding.ShardedSearch(str(root / 'shards'), lanes=1)
+    yield search, load_binary_index(index_dir)
+    search.close()
+
+
+# Merging every shard's best hits gives the ranking of the unsharded index
+@pytest.mark.parametrize('query', QUERIES)
+@pytest.mark.parametrize('limit', [1, 3, None])
+def test_sharded_search_matches_unsharded(sharded, query, limit):
+    search, index = sharded
+    plan = search.compile_query(query)
+    total, doc_ids, scores, clusters = sharding.rank_shard(index, DocumentData(), plan, limit)
+    results = search.ranked_search(query, limit)
+    assert results.total == total
+    assert results.doc_ids.tolist() == doc_ids.tolist()
+    assert np.allclose(results.scores, scores)
+    assert results.clusters.tolist() == clusters.tolist()
+
+
+def test_catalog_matches_index(sharded):
+    search, index = sharded
+    assert search.catalog.documents.tolist() == np.asarray(index.documents).tolist()
+    for term in index.terms:
+        assert search.catalog.doc_frequency(term) == index.doc_frequency(term)
+    # Typos are corrected against the global vocabulary
+    assert search.compile_query("dragn") == search.compile_query("dragon")
+
+
+def test_dead_worker_is_restarted(sharded):
+    search, _ = sharded
+    expected = search.rank_plan(search.compile_query("zombie"), None)
+    lane = search.lanes.get()
+    lane[1].process.kill()
+    lane[1].process.wait()
+    search.lanes.put(lane)
+    assert 'error' in search.rank_plan(search.compile_query("zombie"), None)
+    assert search.rank_plan(search.compile_query("zombie"), None).doc_ids.tolist() == expected.doc_ids.tolist()
+
+
+def test_syntax_errors_are_reported(sharded):
+    search, _ = sharded
+    assert 'error' in search.ranked_search("(zombie")
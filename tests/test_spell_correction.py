@@ -0,0 +1,55 @@
+import difflib  # Reference implementation.
+import random  # Random typos.
+from Controller.spell_correction import CorrectionIndex  # Fast closest-term lookup under test.
+
+VOCABULARY = ['adventur', 'action', 'racing', 'zombi', 'surviv', 'simul', 'strategi', 'multiplay',
+              'open', 'world', 'dragon', 'dark', 'fantasi', 'puzzl', 'platform', 'shooter', 'horror',
+              'rpg', 'indi', 'casual', 'sport', 'space', 'farm', 'craft', 'build', 'tactic', 'rock',
+              'roll', 'stori', 'anim', 'pixel', 'graphic', 'souls', 'like', 'roguelik', 'roguelit']
+
+
+def reference(word, vocabulary, cutoff):
+    if word in vocabulary:
+        return word
+    matches = difflib.get_close_matches(word, vocabulary, n=1, cutoff=cutoff)
+    return matches[0] if matches else word
+
+
+def typo(rng, word):
+    letters = list(word)
+    position = rng.randrange(len(letters))
+    edit = rng.choice(('delete', 'insert', 'replace', 'swap'))
+    if edit == 'delete' and len(letters) > 1:
+        del letters[position]
+    elif edit == 'insert':
+        letters.insert(position, rng.choice('abcdefghijklmnopqrstuvwxyz'))
+    elif edit == 'swap' and position + 1 < len(letters):
+        letters[position], letters[position + 1] = letters[position + 1], letters[position]
+    else:
+        letters[position] = rng.choice('abcdefghijklmnopqrstuvwxyz')
+    return "".join(letters)
+
+
+def test_closest_matches_difflib():
+    rng = random.Random(11)
+    index = CorrectionIndex(VOCABULARY)
+    words = [typo(rng, rng.choice(VOCABULARY)) for _ in range(500)] + ['xyz', 'q', 'zzzzzzzzzzzz', 'é']
+    for cutoff in (0.6, 0.8):
+        for word in words:
+            assert index.closest(word, cutoff=cutoff) == reference(word, VOCABULARY, cutoff), word
+
+
+# The candidate filter never drops the term difflib would pick
+def test_candidates_keep_the_best_match():
+    rng = random.Random(5)
+    index = CorrectionIndex(VOCABULARY)
+    for _ in range(300):
+        word = typo(rng, rng.choice(VOCABULARY))
+        expected = difflib.get_close_matches(word, VOCABULARY, n=1, cutoff=0.8)
+        if expected:
+            assert expected[0] in index.candidates(word, 0.8)
+
+
+def test_known_and_empty():
+    assert CorrectionIndex(VOCABULARY).closest('racing') == 'racing'
+    assert CorrectionIndex([]).closest('racing') == 'racing'
@@ -0,0 +1,24 @@
+import numpy as np  # Comparing posting arrays.
+import pytest  # Parametrized memory budgets.
+from conftest import GAMES  # Fixture catalog.
+from Controller.binary_index import load_binary_index  # Both builds are read back.
+from Controller.streaming_index import build_streaming_index  # Bounded memory build under test.
+
+
+# The spilled and merged runs give the index of the in-memory build
+@pytest.mark.parametrize('memory_mb, batch_size', [(256, 256), (0, 1), (0, 3)])
+def test_streaming_matches_in_memory(tmp_path, index_dir, memory_mb, batch_size):
+    pd = pytest.importorskip('pandas')
+    csv_path = str(tmp_path / 'games.csv')
+    pd.DataFrame(GAMES).to_csv(csv_path, index=False)
+    output_dir = str(tmp_path / 'streamed')
+    build_streaming_index(csv_path, output_dir, memory_mb=memory_mb, batch_size=batch_size,
+                          spill_dir=str(tmp_path), model_path=str(tmp_path / 'no_model.npz'))
+
+    expected, streamed = load_binary_index(index_dir), load_binary_index(output_dir)
+    assert streamed.terms == expected.terms
+    assert np.allclose(streamed.idf_values, expected.idf_values)
+    assert np.array_equal(streamed.offsets, expected.offsets)
+    assert np.array_equal(streamed.doc_ids, expected.doc_ids)
+    assert np.allclose(streamed.scores, expected.scores, atol=1e-6)
+    assert streamed.documents.tolist() == expected.documents.tolist()